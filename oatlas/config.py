@@ -204,6 +204,36 @@ class NettackerConfig:
     compare_report_path_filename = ""
     max_retries = 3
     retry_delay = 0.1
+    event_batch_size = 500  # rows per transaction of the event writer, for every backend
+    event_flush_interval = 0.5  # seconds before a partial batch gets committed anyway
+    dependent_event_timeout = 5.0  # seconds to wait on a temp event before checking the DB
+    dependent_event_max_wait = 600.0  # seconds a step waits on its temp events before it fails
+    http_response_cache_size = 2048  # GET/HEAD responses shared between modules, 0 disables it
+    prune_modules_by_fingerprint = True  # skip product modules (requires:) the host doesn't run
+    scan_checkpoints = True  # record finished work items so a scan can be resumed
+    scan_checkpoint_interval = 100  # sub-steps between the checkpoints of a running module
+    tls_probe_workers = 64  # TLS version/cipher probes running at the same time per process
+    tls_cache_size = 1024  # host:port certificates and probe results kept per scan process
+    brute_force_connections_per_host = 8  # login attempts running on a host:port at once
+    brute_force_idle_sessions = 64  # logged out sessions kept for reuse per scan process
+    icmp_sweep = True  # ping_before_scan pings every target from one raw socket
+    icmp_packets_per_second = 1000  # echo requests sent per second by the icmp sweep
+    database_compaction = True  # purge finished scans' temp events, shrink the SQLite file
+    vacuum_pages_per_step = 1000  # SQLite pages freed per incremental vacuum transaction
+    log_success_events = True  # print every found event, turn off for long unattended scans
+    adaptive_concurrency = True  # adjust the requests in flight per target, up to thread_per_host
+    adaptive_initial_concurrency = 4  # requests in flight per target before it has answered
+    adaptive_backoff = 0.5  # the limit is multiplied by this on a read timeout, reset or 429/503
+    adaptive_latency_tolerance = 3.0  # slower than this times the fastest answer isn't healthy
+    congestion_retries = 2  # extra tries for a request a busy target turned down (429/503, reset)
+    max_retry_after = 30  # most seconds a Retry-After header pauses a target
+    dns_cache_ttl = 300  # seconds a resolved name is kept in the scan's DNS cache
+    dns_negative_ttl = 30  # seconds a name that didn't resolve is kept failing
+    dns_prefetch_workers = 32  # target names resolved at the same time before the scan
+    proxy_selection = "round_robin"  # how a connection picks a proxy: round_robin, least_loaded
+    proxy_check_timeout = 5.0  # seconds to reach a proxy in the check before the scan
+    proxy_failure_threshold = 3  # connections a proxy fails in a row before it's left out
+    proxy_down_time = 60  # seconds a failing proxy is left out of the pool
 
 
 class Files:
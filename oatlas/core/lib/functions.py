@@ -616,6 +616,12 @@ nettacker_parameters = {
             "description": "Ports (or port ranges) to exclude from scanning (e.g. ['22', '80-90']).",
             "default": None,
         },
+        "excluded_targets": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "IPs, IP ranges, CIDRs or domains to leave out of the scan (e.g. ['10.0.0.0/24']).",
+            "default": None,
+        },
         "usernames": {
             "type": "array",
             "items": {"type": "string"},
@@ -691,7 +697,7 @@ nettacker_parameters = {
         },
         "socks_proxy": {
             "type": "string",
-            "description": "SOCKS proxy URL (e.g. 'socks5://127.0.0.1:9050') to route traffic through.",
+            "description": "Comma separated SOCKS4/SOCKS5/HTTP proxy URLs (e.g. 'socks5://127.0.0.1:9050,http://10.0.0.2:3128') to route traffic through, the connections are spread over them.",
             "default": None,
         },
         "retries": {
@@ -715,6 +721,16 @@ nettacker_parameters = {
             "description": "Extra HTTP headers to send with requests (each entry like 'Header: value').",
             "default": None,
         },
+        "dry_run": {
+            "type": "boolean",
+            "description": "Only report the requests, connections and estimated duration of the scan, without sending anything.",
+            "default": False,
+        },
+        "resume_scan_id": {
+            "type": "string",
+            "description": "ScanID of an interrupted scan to resume with its original arguments, the finished work is skipped.",
+            "default": None,
+        },
     },
     "required": ["targets", "selected_modules"],
 }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Lookup latency of the Nettacker event tables as they grow, with and without the
+composite indexes added in schema version 1 (core/database/migrations.py).
+
+It uses the stdlib sqlite3 module so it runs without the rest of the project installed,
+the queries are the same ones find_events, find_temp_events and remove_old_logs send.
+
+    python oatlas/tools/nettacker/benchmarks/db_lookups.py --sizes 10000 100000 1000000 10000000
+
+The 10M rows run takes a while to fill (and a few GBs of disk), the database is created in
+a temporary directory and removed at the end.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+SCHEMA = """
+CREATE TABLE scan_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date DATETIME,
+    target TEXT,
+    module_name TEXT,
+    scan_unique_id TEXT,
+    port TEXT,
+    event TEXT,
+    json_event TEXT,
+    protocols TEXT
+);
+CREATE TABLE temp_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date DATETIME,
+    target TEXT,
+    module_name TEXT,
+    scan_unique_id TEXT,
+    event_name TEXT,
+    port TEXT,
+    event TEXT,
+    data TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX ix_scan_events_lookup ON scan_events (target, module_name, scan_unique_id);
+CREATE INDEX ix_temp_events_lookup ON temp_events (target, module_name, scan_unique_id, event_name);
+"""
+
+QUERIES = {
+    "find_events": (
+        "SELECT json_event FROM scan_events "
+        "WHERE target = ? AND module_name = ? and scan_unique_id = ?"
+    ),
+    "find_temp_events": (
+        "SELECT event FROM temp_events "
+        "WHERE target = ? AND module_name = ? AND scan_unique_id = ? AND event_name = ? LIMIT 1"
+    ),
+}
+
+MODULES = ["port_scan", "dir_scan", "admin_scan", "waf_scan", "http_status_scan"]
+JSON_EVENT = '{"port": 80, "response": {"conditions_results": {"http": ["HTTP/1.1 200"]}}}'
+
+
+def random_row(index, scans):
+    return (
+        f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}",
+        MODULES[index % len(MODULES)],
+        f"scan-{index % scans}",
+    )
+
+
+def fill(connection, rows, scans, start=0, batch=50_000):
+    for offset in range(start, rows, batch):
+        chunk = [random_row(index, scans) for index in range(offset, min(offset + batch, rows))]
+        connection.executemany(
+            "INSERT INTO scan_events (date, target, module_name, scan_unique_id, port, event, "
+            "json_event, protocols) VALUES ('2025-01-01', ?, ?, ?, '80', 'event', ?, '[\"http\"]')",
+            [row + (JSON_EVENT,) for row in chunk],
+        )
+        connection.executemany(
+            "INSERT INTO temp_events (date, target, module_name, scan_unique_id, event_name, "
+            "port, event, data) VALUES ('2025-01-01', ?, ?, ?, 'token', '80', 'event', 'data')",
+            chunk,
+        )
+        connection.commit()
+
+
+def measure(connection, rows, scans, lookups):
+    results = {}
+    for name, query in QUERIES.items():
+        timings = []
+        for _ in range(lookups):
+            params = random_row(random.randrange(rows), scans)
+            if name == "find_temp_events":
+                params = params + ("token",)
+            started = time.perf_counter()
+            connection.execute(query, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--scans", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'query':>18} {'no index (ms)':>15} {'indexed (ms)':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        plain = sqlite3.connect(os.path.join(directory, "plain.db"))
+        indexed = sqlite3.connect(os.path.join(directory, "indexed.db"))
+        plain.executescript(SCHEMA)
+        indexed.executescript(SCHEMA + INDEXES)
+
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(plain, size, args.scans, start=filled)
+            fill(indexed, size, args.scans, start=filled)
+            filled = size
+            lookups = max(args.lookups // 10, 3) if size > 1_000_000 else args.lookups
+            without_index = measure(plain, size, args.scans, lookups)
+            with_index = measure(indexed, size, args.scans, lookups)
+            for name in QUERIES:
+                print(
+                    f"{size:>12} {name:>18} {without_index[name]:>15.3f} {with_index[name]:>14.3f}"
+                )
+        plain.close()
+        indexed.close()
+
+
+if __name__ == "__main__":
+    main()
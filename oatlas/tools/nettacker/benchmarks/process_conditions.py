@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Events per second one core gets through BaseEngine.process_conditions.
+
+The rows go to a writer that drops them instead of the database, so this is the CPU cost
+of an event only: cleaning the headers, serializing and compressing the row (codec.py) and
+formatting the terminal log. The terminal output goes to /dev/null. Needs the project's
+dependencies, orjson is used when it's installed and the json fallback is timed as well.
+
+    python oatlas/tools/nettacker/benchmarks/process_conditions.py --events 20000
+
+Add -v to time the verbose logging too, it's skipped otherwise like in a scan.
+"""
+
+import argparse
+import contextlib
+import copy
+import os
+import time
+
+from oatlas.config import Config
+from oatlas.tools.nettacker.core.database import codec, database
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+
+# A dir_scan hit as the http engine hands it over, the misses are the same without results
+FOUND_EVENT = {
+    "method": "get",
+    "timeout": 3,
+    "headers": {"User-Agent": "Nettacker 0.4.0 QUIN", "Authorization": "Basic dXNlcjpwYXNz"},
+    "allow_redirects": False,
+    "ssl": False,
+    "url": "http://example.com:80/backup/",
+    "response": {
+        "condition_type": "or",
+        "conditions": {"status_code": {"regex": "200|403", "reverse": False}},
+        "conditions_results": {"status_code": ["200"]},
+        "ssl_flag": False,
+    },
+}
+MISSED_EVENT = copy.deepcopy(FOUND_EVENT)
+MISSED_EVENT["response"]["conditions_results"] = {}
+
+
+class DroppingWriter:
+    def put(self, table, row):
+        pass
+
+
+def measure(event, events):
+    engine = BaseEngine()
+    # Copied up front, process_conditions changes the event it gets
+    queue = [copy.deepcopy(event) for _ in range(events)]
+    started = time.perf_counter()
+    for number, item in enumerate(queue):
+        engine.process_conditions(
+            item,
+            "dir_scan",
+            "example.com",
+            "benchmark",
+            {},
+            item["response"]["conditions_results"],
+            1,
+            1,
+            1,
+            number,
+            events,
+        )
+    return events / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20_000)
+    # Logger looks for -v in sys.argv itself, this only lets argparse accept it
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    database.get_event_writer = DroppingWriter
+    serializers = ["orjson", "json"] if codec.orjson is not None else ["json"]
+    orjson = codec.orjson
+
+    results = []
+    for serializer in serializers:
+        codec.orjson = orjson if serializer == "orjson" else None
+        for name, event, log_success_events in (
+            ("found, logged", FOUND_EVENT, True),
+            ("found, not logged", FOUND_EVENT, False),
+            ("missed", MISSED_EVENT, True),
+        ):
+            Config.nettacker.log_success_events = log_success_events
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results.append((serializer, name, measure(event, args.events)))
+
+    print(f"{'serializer':>10} {'event':>18} {'events/s':>12}")
+    for serializer, name, events_per_second in results:
+        print(f"{serializer:>10} {name:>18} {events_per_second:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
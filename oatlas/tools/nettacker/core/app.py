@@ -1,8 +1,10 @@
+import collections
 import copy
 import json
 import os
-import socket
-from threading import Thread
+import queue
+import threading
+import time
 from types import SimpleNamespace
 from typing import List, Optional
 
@@ -10,6 +12,9 @@ import multiprocess
 
 from oatlas.config import Database, Config
 from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.brute import get_brute_force_sessions
+from oatlas.tools.nettacker.core.checkpoints import ModuleCheckpoint
+from oatlas.tools.nettacker.core.concurrency import release_host_concurrency
 
 # Database functions have been moved to the main database manager
 from oatlas.tools.nettacker.core.database import (
@@ -18,29 +23,45 @@ from oatlas.tools.nettacker.core.database import (
     sqlite_create_tables,
     postgres_create_database,
 )
-from oatlas.tools.nettacker.core.database.database import find_events, remove_old_logs
+from oatlas.tools.nettacker.core.database.database import (
+    find_events,
+    find_scan_plan,
+    find_scan_progress,
+    flush_events,
+    remove_old_logs,
+    save_scan_plan,
+    start_database_compaction,
+)
+from oatlas.tools.nettacker.core.fingerprints import FINGERPRINT_MODULE, get_module_requirements
+from oatlas.tools.nettacker.core.icmp import icmp_sweep
 
 # Commenting this to remind me about this
 # from nettacker.core.graph import create_report
-from oatlas.tools.nettacker.core.ip import (
-    get_ip_range,
-    generate_ip_range,
-    is_single_ipv4,
-    is_ipv4_range,
-    is_ipv4_cidr,
-    is_single_ipv6,
-    is_ipv6_range,
-    is_ipv6_cidr,
-)
+from oatlas.tools.nettacker.core.ip import get_ip_range, is_single_ipv4, is_single_ipv6
+from oatlas.tools.nettacker.core.lib.socket import SocketEngine
 
 # Will let the messages logic stay cause its not hurting me at this moment
 from oatlas.tools.nettacker.core.messages import messages as _
 from oatlas.tools.nettacker.core.module import Module
-from oatlas.tools.nettacker.core.socks_proxy import set_socks_proxy
+from oatlas.tools.nettacker.core.planner import log_scan_plan, plan_scan
+from oatlas.tools.nettacker.core.proxy import UNPROXIED_MODULES, install_proxy_pool
+from oatlas.tools.nettacker.core.resolver import prefetch_target_names
+from oatlas.tools.nettacker.core.scheduler import shutdown_scheduler
+from oatlas.tools.nettacker.core.targets import TargetSet
+from oatlas.tools.nettacker.core.temp_events import get_temp_event_store
+from oatlas.tools.nettacker.core.template import TemplateLoader
 
 # We'll let its own common file as it is, because its big!
 from oatlas.tools.nettacker.core.utils import common as common_utils
-from oatlas.tools.nettacker.core.utils.common import wait_for_threads_to_finish
+from oatlas.tools.nettacker.core.utils.common import (
+    wait_for_futures_to_finish,
+    wait_for_threads_to_finish,
+)
+from oatlas.tools.nettacker.core.workers import (
+    get_worker_pool,
+    log_exception,
+    shutdown_worker_pool,
+)
 from oatlas.utils.die import die_failure
 
 log = get_logger()
@@ -57,8 +78,8 @@ class NettackerEngine:
     def handle_dependencies(self):
         if Database.engine == "sqlite":
             try:
-                if not Config.path.database_file.exists():
-                    sqlite_create_tables()
+                # Creates the tables on the first run and applies pending migrations after that
+                sqlite_create_tables()
             except PermissionError:
                 die_failure("cannot access the database directory!")
         elif Database.engine == "mysql":
@@ -76,8 +97,13 @@ class NettackerEngine:
             die_failure("Database not yet supported (or invalid)")
 
     @classmethod
-    def expand_targets(cls, options, scan_id):
-        targets = []
+    def parse_targets(cls, options):
+        """
+        Turn the target inputs into a TargetSet (and set url_base_path). Nothing is sent, the
+        discovery scans happen in expand_targets.
+        """
+        # IPs, ranges and CIDRs are stored as intervals in here, nothing gets listed
+        targets = TargetSet()
         base_path = ""
         if isinstance(options.targets, str):
             options.targets = options.targets.split(
@@ -95,23 +121,19 @@ class NettackerEngine:
                 except IndexError:
                     base_path = ""
                 target = target.split("://")[1].split("/")[0].split(":")[0]
-                targets.append(target)
-            elif is_single_ipv4(target) or is_single_ipv6(target):
-                if options.scan_ip_range:
-                    targets += get_ip_range(target)
-                else:
-                    targets.append(target)
-            elif (
-                is_ipv4_range(target)
-                or is_ipv6_range(target)
-                or is_ipv4_cidr(target)
-                or is_ipv6_cidr(target)
-            ):
-                targets += generate_ip_range(target)
+                targets.add(target)
+            elif (is_single_ipv4(target) or is_single_ipv6(target)) and options.scan_ip_range:
+                targets.add(get_ip_range(target))
             else:
-                targets.append(target)
+                targets.add(target)
+        targets.exclude(options.excluded_targets)
         options.targets = targets
         options.url_base_path = base_path
+        return targets
+
+    @classmethod
+    def expand_targets(cls, options, scan_id):
+        NettackerEngine.parse_targets(options)
 
         # subdomain_scan
         if options.scan_subdomains:
@@ -122,25 +144,34 @@ class NettackerEngine:
             if "subdomain_scan" in options.selected_modules:
                 options.selected_modules.remove("subdomain_scan")
 
-            for target in copy.deepcopy(options.targets):
+            sub_domains = []
+            for target in options.targets:
                 for row in find_events(target, "subdomain_scan", scan_id):
-                    for sub_domain in json.loads(row.json_event)["response"]["conditions_results"][
-                        "content"
-                    ]:
-                        if sub_domain not in options.targets:
-                            options.targets.append(sub_domain)
+                    sub_domains += json.loads(row)["response"]["conditions_results"]["content"]
+            for sub_domain in sub_domains:
+                options.targets.add(sub_domain)
+            options.targets.exclude(options.excluded_targets)
+
+        # Resolve every name once, in parallel, the scan processes are forked with the answers.
+        # With proxies the names are resolved by the proxies.
+        if not options.socks_proxy:
+            prefetch_target_names(options.targets)
 
         # icmp_scan
         if options.ping_before_scan:
             if os.geteuid() == 0:
                 selected_modules = options.selected_modules
-                options.selected_modules = ["icmp_scan"]
-                NettackerEngine.start_scan(options, scan_id)
+                if Config.nettacker.icmp_sweep:
+                    live_targets = NettackerEngine.icmp_sweep(options, scan_id)
+                else:
+                    options.selected_modules = ["icmp_scan"]
+                    NettackerEngine.start_scan(options, scan_id)
+                    live_targets = None
                 options.selected_modules = selected_modules
                 if "icmp_scan" in options.selected_modules:
                     options.selected_modules.remove("icmp_scan")
                 options.targets = NettackerEngine.filter_target_by_event(
-                    targets, scan_id, "icmp_scan"
+                    options.targets, scan_id, "icmp_scan", live_targets
                 )
             else:
                 log.warn(_("icmp_need_root_access"))
@@ -156,17 +187,84 @@ class NettackerEngine:
             options.selected_modules = selected_modules
             if "port_scan" in options.selected_modules:
                 options.selected_modules.remove("port_scan")
-            options.targets = NettackerEngine.filter_target_by_event(targets, scan_id, "port_scan")
+            options.targets = NettackerEngine.filter_target_by_event(
+                options.targets, scan_id, "port_scan"
+            )
             options.skip_service_discovery = False
 
-        return list(set(options.targets))
+        # web_technologies_scan, the product specific modules (requires:) look at its results.
+        # It runs whenever they can be pruned, selected or not.
+        if Config.nettacker.prune_modules_by_fingerprint and any(
+            get_module_requirements(module) for module in options.selected_modules
+        ):
+            log.info(_("fingerprinting_targets").format(FINGERPRINT_MODULE))
+            selected_modules = options.selected_modules
+            options.selected_modules = [FINGERPRINT_MODULE]
+            NettackerEngine.start_scan(options, scan_id)
+            options.selected_modules = [
+                module_name
+                for module_name in selected_modules
+                if module_name != FINGERPRINT_MODULE
+            ]
+
+        return options.targets
 
     @classmethod
-    def filter_target_by_event(cls, targets, scan_id, module_name):
-        for target in copy.deepcopy(targets):
-            if not find_events(target, module_name, scan_id):
-                targets.remove(target)
-        return targets
+    def icmp_sweep(cls, options, scan_id):
+        """
+        ping_before_scan from one raw socket instead of an icmp_scan module run per target.
+        The targets that replied get the same icmp_scan events the module writes.
+
+        Args:
+            options: the scan options
+            scan_id: unique scan identifier
+
+        Returns:
+            a dict of the targets that replied -> response time
+        """
+        started = time.monotonic()
+        live_targets = icmp_sweep(
+            options.targets, options.timeout, Config.nettacker.icmp_packets_per_second
+        )
+        log.info(
+            _("icmp_sweep_done").format(
+                len(live_targets), options.targets.size(), round(time.monotonic() - started, 2)
+            )
+        )
+
+        engine = SocketEngine()
+        module_inputs = dict(options.__dict__)
+        for request_number, (target, response_time) in enumerate(live_targets.items(), 1):
+            module_inputs["target"] = target
+            module_content = TemplateLoader("icmp_scan", module_inputs).load()
+            sub_step = module_content["payloads"][0]["steps"][0]
+            response = {"host": target, "response_time": response_time, "ssl_flag": False}
+            sub_step["response"]["conditions_results"] = response
+            engine.process_conditions(
+                sub_step,
+                "icmp_scan",
+                target,
+                scan_id,
+                options.__dict__,
+                response,
+                0,
+                request_number,
+                len(live_targets),
+                1,
+                1,
+            )
+        flush_events()
+        return live_targets
+
+    @classmethod
+    def filter_target_by_event(cls, targets, scan_id, module_name, live_targets=None):
+        """
+        Keep the targets that have an event of the module, or the ones in live_targets when
+        the caller already knows them (the icmp sweep), which saves a query per target
+        """
+        if live_targets is not None:
+            return TargetSet(target for target in targets if target in live_targets)
+        return TargetSet(target for target in targets if find_events(target, module_name, scan_id))
 
     # Keeping only this as a staticmethod because of my architecture
     @staticmethod
@@ -178,6 +276,7 @@ class NettackerEngine:
         profiles: Optional[str] = None,
         excluded_modules: Optional[List[str]] = None,
         excluded_ports: Optional[List[str]] = None,
+        excluded_targets: Optional[List[str]] = None,
         usernames: Optional[List[str]] = None,
         usernames_list: Optional[str] = None,
         passwords: Optional[List[str]] = None,
@@ -197,6 +296,8 @@ class NettackerEngine:
         ping_before_scan: bool = False,
         read_from_file: Optional[str] = None,
         http_header: Optional[List[str]] = None,
+        dry_run: bool = False,
+        resume_scan_id: Optional[str] = None,
     ):
         """
         Public static entry point for Nettacker. This is derived from the CLI arguments that
@@ -213,34 +314,58 @@ class NettackerEngine:
         graphs only hardcore usage. I have tried to strip the code as much as I can!
 
         This is the main run function. Enjoy.
+
+        With dry_run nothing gets scanned, it returns what the scan would cost (see
+        planner.plan_scan) instead. resume_scan_id picks up an interrupted scan with the
+        arguments it was started with (the other arguments are ignored) and skips the work it
+        already did.
         """
+        # Saved with the scan so it can be resumed with the same arguments
+        arguments = {
+            key: value
+            for key, value in locals().items()
+            if key not in ("dry_run", "resume_scan_id")
+        }
+        if resume_scan_id:
+            scan_plan = find_scan_plan(resume_scan_id)
+            if scan_plan is None:
+                log.error(_("scan_plan_not_found").format(resume_scan_id))
+                return False
+            arguments = scan_plan[0]
+            log.info(_("resuming_scan").format(resume_scan_id, scan_plan[1]))
+        # The options share the lists of the arguments and the scan expands them in place
+        # (profiles into modules, the discovery modules taken out), the scan plan keeps
+        # what was asked for so a resume expands it again from scratch
+        saved_arguments = copy.deepcopy(arguments)
+
         # Build options object dynamically from arguments
         options = SimpleNamespace(
-            targets=targets or [],
-            targets_list=targets_list,
-            selected_modules=selected_modules or [],
-            profiles=profiles,
-            excluded_modules=excluded_modules or [],
-            excluded_ports=excluded_ports or [],
-            usernames=usernames or [],
-            usernames_list=usernames_list,
-            passwords=passwords or [],
-            passwords_list=passwords_list,
-            ports=ports or [],
-            user_agent=user_agent,
-            timeout=timeout,
-            time_sleep_between_requests=time_sleep_between_requests,
-            scan_ip_range=scan_ip_range,
-            scan_subdomains=scan_subdomains,
-            skip_service_discovery=skip_service_discovery,
-            thread_per_host=thread_per_host,
-            parallel_module_scan=parallel_module_scan,
-            set_hardware_usage=set_hardware_usage,
-            socks_proxy=socks_proxy,
-            retries=retries,
-            ping_before_scan=ping_before_scan,
-            read_from_file=read_from_file,
-            http_header=http_header or [],
+            targets=arguments["targets"] or [],
+            targets_list=arguments["targets_list"],
+            selected_modules=arguments["selected_modules"] or [],
+            profiles=arguments["profiles"],
+            excluded_modules=arguments["excluded_modules"] or [],
+            excluded_ports=arguments["excluded_ports"] or [],
+            excluded_targets=arguments["excluded_targets"] or [],
+            usernames=arguments["usernames"] or [],
+            usernames_list=arguments["usernames_list"],
+            passwords=arguments["passwords"] or [],
+            passwords_list=arguments["passwords_list"],
+            ports=arguments["ports"] or [],
+            user_agent=arguments["user_agent"],
+            timeout=arguments["timeout"],
+            time_sleep_between_requests=arguments["time_sleep_between_requests"],
+            scan_ip_range=arguments["scan_ip_range"],
+            scan_subdomains=arguments["scan_subdomains"],
+            skip_service_discovery=arguments["skip_service_discovery"],
+            thread_per_host=arguments["thread_per_host"],
+            parallel_module_scan=arguments["parallel_module_scan"],
+            set_hardware_usage=arguments["set_hardware_usage"],
+            socks_proxy=arguments["socks_proxy"],
+            retries=arguments["retries"],
+            ping_before_scan=arguments["ping_before_scan"],
+            read_from_file=arguments["read_from_file"],
+            http_header=arguments["http_header"] or [],
             # Runtime only
             url_base_path="",
         )
@@ -250,51 +375,259 @@ class NettackerEngine:
                 ","
             )  # Again same thing as target
 
-        scan_id = common_utils.generate_random_token(32)
+        if dry_run:
+            # Only count what the scan would send, the discovery scans are left out as well
+            if not NettackerEngine.parse_targets(options):
+                log.error("No targets selected to scan!")
+                return {}
+            plan = plan_scan(options)
+            log_scan_plan(plan)
+            return plan
+
+        # The connections of the engines take a proxy from the pool (proxy.py)
+        try:
+            proxy_pool = install_proxy_pool(options.socks_proxy)
+        except ValueError as e:
+            log.error(_("invalid_proxy").format(e))
+            return False
+        if proxy_pool is not None:
+            if not proxy_pool.check():
+                log.error(_("no_proxy_reachable"))
+                return False
+            skipped = [name for name in options.selected_modules if name in UNPROXIED_MODULES]
+            if options.ping_before_scan:
+                skipped.append("ping_before_scan")
+                options.ping_before_scan = False
+            if skipped:
+                log.warn(_("not_proxied").format(", ".join(skipped)))
+            options.selected_modules = [
+                name for name in options.selected_modules if name not in UNPROXIED_MODULES
+            ]
+
+        scan_id = resume_scan_id or common_utils.generate_random_token(32)
         log.info(f"ScanID: {scan_id}")
+        save_scan_plan(scan_id, saved_arguments)
         log.info(_("regrouping_targets"))
 
         options.targets = NettackerEngine.expand_targets(options, scan_id)
         if not options.targets:
             log.error("No targets selected to scan!")
+            save_scan_plan(scan_id, saved_arguments, "finished")
             return True
 
         exit_code = NettackerEngine.start_scan(options, scan_id)
+        save_scan_plan(scan_id, saved_arguments, "finished" if exit_code else "stopped")
+        # The temp events of the scan are not needed anymore
+        start_database_compaction()
         log.info(f"ScanID: {scan_id} " + _("done"))
         return exit_code
 
     @classmethod
     def start_scan(cls, options, scan_id):
-        target_groups = common_utils.generate_target_groups(
-            options.targets, options.set_hardware_usage
+        """
+        Scan every (target, module) pair of the options on a pool of worker processes. The
+        pairs go on a shared queue and every worker takes the next one as soon as it has a
+        free module thread, so a few slow targets keep one worker busy and not a whole
+        group of targets. Work items a resumed scan already finished are skipped.
+
+        Returns:
+            True when finished, False if it was stopped
+        """
+        total_number_of_modules = options.targets.size() * len(options.selected_modules)
+        number_of_processes = max(
+            min(options.set_hardware_usage, os.cpu_count() or 1, total_number_of_modules), 1
         )
-        log.info(_("removing_old_db_records"))
-
-        for target_group in target_groups:
-            for target in target_group:
-                for module_name in options.selected_modules:
-                    remove_old_logs(
-                        {
-                            "target": target,
-                            "module_name": module_name,
-                            "scan_id": scan_id,
-                        }
-                    )
+        log.info(_("start_multi_process").format(options.targets.size(), number_of_processes))
 
-        for _i in range(target_groups.count([])):
-            target_groups.remove([])
+        # Bounded so the targets are only listed as fast as the workers take them
+        work_queue = multiprocess.Queue(
+            maxsize=number_of_processes * max(options.parallel_module_scan, 1) * 2
+        )
+        progress_queue = multiprocess.Queue()
+        stop_event = multiprocess.Event()
+        # (target, module) -> (completed_requests, finished) of earlier runs of the scan
+        scan_progress = find_scan_progress(scan_id) if Config.nettacker.scan_checkpoints else {}
 
-        log.info(_("start_multi_process").format(len(options.targets), len(target_groups)))
         active_processes = []
-        for t_id, target_group in enumerate(target_groups):
+        for process_number in range(number_of_processes):
             process = multiprocess.Process(
-                target=NettackerEngine.scan_target_group,
-                args=(options, target_group, scan_id, t_id),
+                target=NettackerEngine.scan_worker,
+                args=(options, work_queue, progress_queue, stop_event, scan_id, process_number),
             )
             process.start()
             active_processes.append(process)
 
-        return wait_for_threads_to_finish(active_processes, sub_process=True)
+        feeder = threading.Thread(
+            target=NettackerEngine.feed_work_queue,
+            args=(
+                options,
+                work_queue,
+                progress_queue,
+                stop_event,
+                active_processes,
+                scan_progress,
+                total_number_of_modules,
+            ),
+            daemon=True,
+        )
+        feeder.start()
+
+        finished_modules = 0
+        try:
+            while any(process.is_alive() for process in active_processes):
+                try:
+                    target, module_name, status = progress_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                finished_modules += 1
+                log.verbose_event_info(
+                    _("scan_progress").format(
+                        finished_modules, total_number_of_modules, module_name, target, status
+                    )
+                )
+        except KeyboardInterrupt:
+            stop_event.set()
+            log.warn(_("stopping_scan"))
+            wait_for_threads_to_finish(active_processes, sub_process=True)
+            return False
+        return not stop_event.is_set()
+
+    @classmethod
+    def feed_work_queue(
+        cls,
+        options,
+        work_queue,
+        progress_queue,
+        stop_event,
+        processes,
+        scan_progress,
+        total_number_of_modules,
+    ):
+        """
+        Put the (target, module) pairs on the work queue and a None for every worker at the
+        end. Runs on a thread of the parent process. Pairs that are finished according to
+        scan_progress go straight to the progress queue, the partly done ones carry the
+        number of sub-steps to skip.
+        """
+
+        def put(item):
+            while not stop_event.is_set() and any(process.is_alive() for process in processes):
+                try:
+                    work_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        module_number = 1
+        for target in options.targets:
+            for module_name in options.selected_modules:
+                completed_requests, finished = scan_progress.get((target, module_name), (0, False))
+                if finished:
+                    progress_queue.put((target, module_name, "resumed"))
+                elif not put(
+                    (
+                        target,
+                        module_name,
+                        module_number,
+                        total_number_of_modules,
+                        completed_requests,
+                    )
+                ):
+                    return
+                module_number += 1
+        for _process in processes:
+            put(None)
+
+    @classmethod
+    def scan_worker(cls, options, work_queue, progress_queue, stop_event, scan_id, process_number):
+        """
+        A scan process. Takes (target, module) pairs from the work queue and runs up to
+        parallel_module_scan of them at a time on its module pool.
+        """
+        log.verbose_event_info(_("single_process_started").format(process_number))
+        worker_pool = get_worker_pool()
+        modules = worker_pool.executor("modules", options.parallel_module_scan)
+        pending_modules = set()
+        # Work items of a target running in this process, what's kept per target is freed
+        # when the last one finishes
+        running_targets = collections.Counter()
+        running_targets_lock = threading.Lock()
+
+        def report_progress(future, target, module_name):
+            if future.cancelled():
+                status = "cancelled"
+            elif future.exception() is not None:
+                status = "failed"
+            else:
+                status = "done"
+            progress_queue.put((target, module_name, status))
+            with running_targets_lock:
+                running_targets[target] -= 1
+                if running_targets[target]:
+                    return
+                del running_targets[target]
+            NettackerEngine.release_target(target)
+
+        try:
+            while not stop_event.is_set():
+                # Only take the next item when a module thread is free, the rest of the queue
+                # is left for the other workers
+                if not wait_for_futures_to_finish(
+                    pending_modules, maximum=options.parallel_module_scan
+                ):
+                    worker_pool.stop()
+                    break
+                try:
+                    item = work_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                target, module_name, module_number, total_number_of_modules, completed = item
+                with running_targets_lock:
+                    running_targets[target] += 1
+                future = modules.submit(
+                    NettackerEngine.scan_target,
+                    options,
+                    target,
+                    module_name,
+                    scan_id,
+                    process_number,
+                    module_number,
+                    total_number_of_modules,
+                    completed,
+                )
+                future.add_done_callback(log_exception)
+                future.add_done_callback(
+                    lambda future, target=target, module_name=module_name: report_progress(
+                        future, target, module_name
+                    )
+                )
+                pending_modules.add(future)
+            if stop_event.is_set():
+                worker_pool.stop()
+            if not wait_for_futures_to_finish(pending_modules):
+                worker_pool.stop()
+        except KeyboardInterrupt:
+            # The parent got the Ctrl-C as well and sets stop_event
+            worker_pool.stop()
+        finally:
+            flush_events()
+        if worker_pool.stopping.is_set():
+            return False
+        shutdown_worker_pool()
+        shutdown_scheduler()
+        get_temp_event_store().discard_scan(scan_id)
+        return True
+
+    @classmethod
+    def release_target(cls, target):
+        """
+        Free what the scan process keeps for a target once none of its work items run here
+        """
+        get_brute_force_sessions().release_host(target)
+        release_host_concurrency(target)
 
     @classmethod
     def scan_target(
@@ -306,11 +639,18 @@ class NettackerEngine:
         process_number,
         thread_number,
         total_number_threads,
+        completed_requests=0,
     ):
+        log.verbose_event_info(
+            _("start_parallel_module_scan").format(
+                process_number, module_name, target, thread_number, total_number_threads
+            )
+        )
+        # Done here and not for every target up front, the targets are only listed as they
+        # are scanned
+        remove_old_logs({"target": target, "module_name": module_name, "scan_id": scan_id})
         # Each thread needs its own copy of the options
         thread_options = copy.deepcopy(options)
-
-        socket.socket, socket.getaddrinfo = set_socks_proxy(thread_options.socks_proxy)
         module = Module(
             module_name,
             thread_options,
@@ -320,6 +660,8 @@ class NettackerEngine:
             thread_number,
             total_number_threads,
         )
+        if Config.nettacker.scan_checkpoints:
+            module.checkpoint = ModuleCheckpoint(scan_id, target, module_name, completed_requests)
         module.load()
         module.generate_loops()
         module.sort_loops()
@@ -332,44 +674,3 @@ class NettackerEngine:
         )
 
         return os.EX_OK
-
-    @classmethod
-    def scan_target_group(cls, options, targets, scan_id, process_number):
-        active_threads = []
-        log.verbose_event_info(_("single_process_started").format(process_number))
-        total_number_of_modules = len(targets) * len(options.selected_modules)
-        total_number_of_modules_counter = 1
-
-        for target in targets:
-            for module_name in options.selected_modules:
-                thread = Thread(
-                    target=NettackerEngine.scan_target,
-                    args=(
-                        options,
-                        target,
-                        module_name,
-                        scan_id,
-                        process_number,
-                        total_number_of_modules_counter,
-                        total_number_of_modules,
-                    ),
-                )
-                thread.name = f"{target} -> {module_name}"
-                thread.start()
-                log.verbose_event_info(
-                    _("start_parallel_module_scan").format(
-                        process_number,
-                        module_name,
-                        target,
-                        total_number_of_modules_counter,
-                        total_number_of_modules,
-                    )
-                )
-                total_number_of_modules_counter += 1
-                active_threads.append(thread)
-                if not wait_for_threads_to_finish(
-                    active_threads, options.parallel_module_scan, True
-                ):
-                    return False
-        wait_for_threads_to_finish(active_threads, maximum=None, terminable=True)
-        return True
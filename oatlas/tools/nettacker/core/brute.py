@@ -0,0 +1,196 @@
+import os
+import threading
+
+from oatlas.config import Config
+from oatlas.tools.nettacker.core.lib.base import BaseLibrary
+
+
+class UsernameAlreadyFound(Exception):
+    """
+    Raised for the attempts of a username that already logged in on the host
+    """
+
+
+class BruteForceSessions:
+    """
+    State shared by the brute force attempts of a process: the idle sessions that can take
+    another login attempt, a semaphore per host:port that bounds the attempts running on it
+    at once, and the usernames that already logged in.
+
+    At most `brute_force_idle_sessions` sessions are kept idle in the process (an SSH one is
+    a socket and a thread), and a host's state is dropped by release_host when the scan
+    process has no work on it anymore.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        # key -> [(session, library that closes it)]
+        self.idle = {}
+        self.idle_count = 0
+        self.slots = {}
+        self.found = set()
+
+    def slot(self, host, port):
+        with self.lock:
+            if (host, port) not in self.slots:
+                self.slots[host, port] = threading.BoundedSemaphore(
+                    max(Config.nettacker.brute_force_connections_per_host, 1)
+                )
+            return self.slots[host, port]
+
+    def take(self, key):
+        """
+        Returns an idle session for the key, None if there is none
+        """
+        with self.lock:
+            sessions = self.idle.get(key)
+            if not sessions:
+                return None
+            self.idle_count -= 1
+            return sessions.pop()[0]
+
+    def give_back(self, key, session, library):
+        """
+        Keep the session for the next attempt
+
+        Args:
+            key: the session key, (library name, host, port, ...)
+            session: the session
+            library: the BruteForceLibrary that closes it
+
+        Returns:
+            False when there are enough idle sessions already, the caller closes it then
+        """
+        with self.lock:
+            sessions = self.idle.setdefault(key, [])
+            if (
+                len(sessions) >= Config.nettacker.brute_force_connections_per_host
+                or self.idle_count >= Config.nettacker.brute_force_idle_sessions
+            ):
+                return False
+            sessions.append((session, library))
+            self.idle_count += 1
+            return True
+
+    def release_host(self, host):
+        """
+        Close the idle sessions of the host and forget its slots and found usernames, the
+        scan process is done with it
+        """
+        with self.lock:
+            sessions = []
+            for key in [key for key in self.idle if key[1] == host]:
+                sessions += self.idle.pop(key)
+            self.idle_count -= len(sessions)
+            for slot_key in [slot_key for slot_key in self.slots if slot_key[0] == host]:
+                del self.slots[slot_key]
+            self.found = {found_key for found_key in self.found if found_key[1] != host}
+        for session, library in sessions:
+            library.close(session)
+
+
+_brute_force_sessions = None
+_brute_force_sessions_lock = threading.Lock()
+
+
+def get_brute_force_sessions():
+    """
+    Returns the brute force sessions of the current process, the sockets are not shared
+    with a forked process
+    """
+    global _brute_force_sessions
+    if _brute_force_sessions is None or _brute_force_sessions.pid != os.getpid():
+        with _brute_force_sessions_lock:
+            if _brute_force_sessions is None or _brute_force_sessions.pid != os.getpid():
+                _brute_force_sessions = BruteForceSessions()
+    return _brute_force_sessions
+
+
+class BruteForceLibrary(BaseLibrary):
+    """
+    Base of the brute force libraries. Every attempt used to open a new connection (and do
+    a key exchange for SSH). Protocols that allow another login after a failed one keep the
+    connection in a pool and the next attempt on the same host:port uses it. At most
+    `brute_force_connections_per_host` attempts run on a host:port at once, and once a
+    username logs in its remaining passwords are skipped.
+
+    A library implements connect, login and close, and is_auth_failure to tell a wrong
+    password (the session can be reused) from a broken connection.
+    """
+
+    # False for protocols where a failed login ends the session
+    reuse_sessions = True
+
+    def session_key(self, host, port, username):
+        # The sessions of a host:port can try any username, SSH overrides this
+        return host, port
+
+    def connect(self, host, port, timeout):
+        raise NotImplementedError
+
+    def login(self, session, username, password):
+        raise NotImplementedError
+
+    def is_auth_failure(self, error):
+        return False
+
+    def close(self, session):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def brute_force(self, host, port, username, password, timeout):
+        self.attempt(
+            host, port, username, self.login_with_session, host, port, username, password, timeout
+        )
+        return {
+            "host": host,
+            "port": port,
+            "username": username,
+            "password": password,
+        }
+
+    def attempt(self, host, port, username, login, *args):
+        """
+        Run login(*args) in one of the host's slots, unless the username is already found
+
+        Raises:
+            UsernameAlreadyFound: when another attempt found the password of the username
+        """
+        sessions = get_brute_force_sessions()
+        found_key = (type(self).__name__, host, port, username)
+        if found_key in sessions.found:
+            raise UsernameAlreadyFound(username)
+        with sessions.slot(host, port):
+            if found_key in sessions.found:
+                raise UsernameAlreadyFound(username)
+            login(*args)
+        sessions.found.add(found_key)
+
+    def login_with_session(self, host, port, username, password, timeout):
+        sessions = get_brute_force_sessions()
+        key = (type(self).__name__,) + self.session_key(host, port, username)
+        session = sessions.take(key) if self.reuse_sessions else None
+        reused = session is not None
+        while True:
+            if session is None:
+                session = self.connect(host, port, timeout)
+            try:
+                self.login(session, username, password)
+            except Exception as e:
+                if self.reuse_sessions and self.is_auth_failure(e):
+                    if not sessions.give_back(key, session, self):
+                        self.close(session)
+                    raise
+                self.close(session)
+                if reused:
+                    # The pooled session was closed by the server in the meantime, try the
+                    # password again on a new connection
+                    session, reused = None, False
+                    continue
+                raise
+            # Logged in, a session can't be used for another attempt after that
+            self.close(session)
+            return
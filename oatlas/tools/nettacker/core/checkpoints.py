@@ -0,0 +1,59 @@
+import threading
+
+from oatlas.config import Config
+from oatlas.tools.nettacker.core.database.database import submit_scan_progress
+
+
+class ModuleCheckpoint:
+    """
+    Progress of one module on one target. The sub-steps finish out of order, so this keeps
+    the highest number N for which the first N are all done and saves it every
+    `scan_checkpoint_interval` sub-steps. A resumed scan starts the module at N.
+
+    Args:
+        scan_id: unique scan identifier
+        target: target
+        module_name: module name
+        completed_requests: sub-steps done by an earlier run of the scan
+    """
+
+    def __init__(self, scan_id, target, module_name, completed_requests=0):
+        self.scan_id = scan_id
+        self.target = target
+        self.module_name = module_name
+        self.completed_requests = completed_requests
+        self.saved_requests = completed_requests
+        self.interval = max(Config.nettacker.scan_checkpoint_interval, 1)
+        self.done_requests = set()
+        self.lock = threading.Lock()
+
+    def done(self, request_number):
+        """
+        Args:
+            request_number: index of the sub-step that is done
+        """
+        with self.lock:
+            self.done_requests.add(request_number)
+            while self.completed_requests in self.done_requests:
+                self.done_requests.remove(self.completed_requests)
+                self.completed_requests += 1
+            if self.completed_requests - self.saved_requests < self.interval:
+                return
+            self.saved_requests = self.completed_requests
+        submit_scan_progress(self.scan_id, self.target, self.module_name, self.saved_requests)
+
+    def track(self, future, request_number):
+        """
+        Mark the sub-step done when its future is, cancelled ones don't count
+        """
+
+        def done(future):
+            if not future.cancelled():
+                self.done(request_number)
+
+        future.add_done_callback(done)
+
+    def finish(self):
+        submit_scan_progress(
+            self.scan_id, self.target, self.module_name, self.completed_requests, finished=True
+        )
@@ -0,0 +1,184 @@
+import asyncio
+import collections
+
+from oatlas.config import Config
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.scheduler import get_scheduler
+
+log = get_logger()
+
+# Latencies below this count as healthy whatever the fastest one was, so the jitter of a
+# host that answers in a millisecond doesn't stop the limit from growing
+LATENCY_FLOOR = 0.05
+
+
+class HostConcurrency:
+    """
+    How many requests go to a target at once, adjusted AIMD style (like TCP's congestion
+    window). thread_per_host used to be a fixed number of requests in flight, too many for
+    a fragile host (which starts timing out, and the findings behind those timeouts are
+    lost) and too few for a strong one.
+
+    The limit starts at `adaptive_initial_concurrency` and grows by one for every healthy
+    response until the first sign of trouble (slow start), by one per round of `limit`
+    responses after that. A request that times out or is reset once the target took its
+    connection, or a 429/503, cuts it by `adaptive_backoff`, once per round: the requests
+    that were already in flight when it was cut see the same congestion and don't cut it
+    again. Connects that time out or are refused don't count, that's a filtered or closed
+    port. A Retry-After header pauses the target. thread_per_host is the ceiling, with
+    adaptive_concurrency off the limit stays there.
+
+    Lives on the scheduler loop, one per target and process.
+
+    Args:
+        target: the scan target
+        ceiling: the most requests in flight
+    """
+
+    def __init__(self, target, ceiling):
+        self.target = target
+        self.ceiling = max(int(ceiling), 1)
+        self.adaptive = Config.nettacker.adaptive_concurrency
+        self.limit = float(
+            min(Config.nettacker.adaptive_initial_concurrency, self.ceiling)
+            if self.adaptive
+            else self.ceiling
+        )
+        self.slow_start = True
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.min_latency = None
+        self.metrics = {
+            "requests": 0,
+            "congested": 0,
+            "increases": 0,
+            "decreases": 0,
+            "pauses": 0,
+            "lowest_limit": int(self.limit),
+            "highest_limit": int(self.limit),
+        }
+
+    async def acquire(self):
+        """
+        Wait for a free slot (and for the end of a Retry-After pause)
+
+        Returns:
+            the loop time the request starts at, to hand back to release
+        """
+        loop = asyncio.get_running_loop()
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+        else:
+            waiter = loop.create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just before the cancel, pass it on
+                    self.in_flight -= 1
+                    self.wake_up()
+                else:
+                    self.waiters.remove(waiter)
+                raise
+        pause = self.paused_until - loop.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        return loop.time()
+
+    def wake_up(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def release(self, started, congested=False, retry_after=None):
+        """
+        Give the slot back and adjust the limit to how the request went
+
+        Args:
+            started: what acquire returned
+            congested: the request timed out or was reset after it connected, or got a
+                429/503
+            retry_after: seconds the target asked us to wait, if it did
+        """
+        now = asyncio.get_running_loop().time()
+        self.in_flight -= 1
+        self.metrics["requests"] += 1
+        if congested:
+            self.metrics["congested"] += 1
+            if retry_after:
+                self.paused_until = max(
+                    self.paused_until, now + min(retry_after, Config.nettacker.max_retry_after)
+                )
+                self.metrics["pauses"] += 1
+            if self.adaptive and started >= self.last_decrease:
+                self.slow_start = False
+                self.last_decrease = now
+                self.set_limit(
+                    max(self.limit * Config.nettacker.adaptive_backoff, 1.0), "congestion"
+                )
+        elif self.adaptive and self.limit < self.ceiling:
+            latency = now - started
+            if self.min_latency is None or latency < self.min_latency:
+                self.min_latency = latency
+            if latency <= max(
+                self.min_latency * Config.nettacker.adaptive_latency_tolerance, LATENCY_FLOOR
+            ):
+                self.set_limit(
+                    min(self.limit + (1 if self.slow_start else 1 / self.limit), self.ceiling),
+                    "healthy",
+                )
+        self.wake_up()
+
+    def set_limit(self, limit, reason):
+        old_limit, self.limit = int(self.limit), limit
+        if int(limit) == old_limit:
+            return
+        self.metrics["increases" if int(limit) > old_limit else "decreases"] += 1
+        self.metrics["lowest_limit"] = min(self.metrics["lowest_limit"], int(limit))
+        self.metrics["highest_limit"] = max(self.metrics["highest_limit"], int(limit))
+        log.verbose_info(
+            _("concurrency_changed").format(self.target, old_limit, int(limit), reason)
+        )
+
+    async def close(self):
+        # Called when the target has no work item left in this process (or with the
+        # scheduler's resources at the end of the scan)
+        if self.adaptive and self.metrics["requests"]:
+            log.verbose_info(
+                _("concurrency_stats").format(
+                    self.target,
+                    self.metrics["requests"],
+                    self.metrics["congested"],
+                    self.metrics["decreases"],
+                    self.metrics["pauses"],
+                    self.metrics["lowest_limit"],
+                    self.metrics["highest_limit"],
+                    int(self.limit),
+                )
+            )
+
+
+async def get_host_concurrency(target, ceiling):
+    """
+    Returns the HostConcurrency of the target, call it from the scheduler loop
+    """
+
+    async def create_host_concurrency():
+        return HostConcurrency(target, ceiling)
+
+    return await get_scheduler().resource(f"concurrency_{target}", create_host_concurrency)
+
+
+def release_host_concurrency(target):
+    """
+    Drop the HostConcurrency of the target once none of its work items run in this process,
+    from any thread. A later work item of the target starts over from the initial limit.
+    """
+    scheduler = get_scheduler()
+    scheduler.submit(scheduler.release_resource(f"concurrency_{target}"))
@@ -0,0 +1,173 @@
+import re
+import threading
+from collections import OrderedDict
+
+from oatlas.tools.nettacker.core.utils.common import (
+    replace_dependent_response,
+    reverse_and_regex_condition,
+)
+from oatlas.tools.nettacker.core.utils.expressions import compile_comparison
+
+RESPONSE_FIELDS = ("reason", "status_code", "content", "url")
+
+
+class RegexCondition:
+    def __init__(self, condition):
+        self.pattern = re.compile(condition["regex"])
+        self.reverse = condition["reverse"]
+
+    def match(self, value):
+        return reverse_and_regex_condition(self.pattern.findall(value), self.reverse)
+
+
+def lowercase_headers(headers):
+    # When a header comes in with different cases, the one that isn't lowercase wins (that's
+    # how the old in-place lowercasing of the response headers ended up)
+    lowercased = {key: value for key, value in headers.items() if key == key.lower()}
+    for key, value in headers.items():
+        if key != key.lower():
+            lowercased[key.lower()] = value
+    return lowercased
+
+
+class ConditionMatcher:
+    """
+    The `response` block of a step, compiled. The regexes are compiled once, the headers are
+    looked up in a lowercased copy made once per response (iterative_response_match used to
+    lowercase them again for every entry) and the AND/OR decision is made on the results as
+    they are collected instead of counting [] over and over.
+
+    Args:
+        response: the response block of the step (condition_type, conditions and log)
+    """
+
+    def __init__(self, response):
+        conditions = response["conditions"]
+        self.condition_type = response["condition_type"].lower()
+        self.log = response.get("log", False)
+        # (condition, compiled condition) in the order of the module file
+        self.plan = []
+        for condition in conditions:
+            if condition in RESPONSE_FIELDS:
+                self.plan.append((condition, RegexCondition(conditions[condition])))
+            elif condition == "headers":
+                self.plan.append(
+                    (
+                        condition,
+                        [
+                            (header, header.lower(), RegexCondition(value))
+                            for header, value in conditions["headers"].items()
+                        ],
+                    )
+                )
+            elif condition == "responsetime":
+                self.plan.append((condition, compile_comparison(conditions[condition])))
+        self.iterative_response_match = [
+            (key, ConditionMatcher(value["response"]))
+            for key, value in conditions.get("iterative_response_match", {}).items()
+        ]
+
+    def match_conditions(self, response, headers):
+        condition_results = {}
+        matched = []
+        for condition, compiled in self.plan:
+            if condition == "headers":
+                condition_results["headers"] = {}
+                for header, lowercase_header, header_condition in compiled:
+                    if lowercase_header in headers:
+                        result = header_condition.match(headers[lowercase_header])
+                    else:
+                        result = []
+                    condition_results["headers"][header] = result
+                    matched.append(result != [])
+                continue
+            if condition == "responsetime":
+                if compiled and compiled(response["responsetime"]):
+                    result = response["responsetime"]
+                else:
+                    result = []
+            else:
+                result = compiled.match(response[condition])
+            condition_results[condition] = result
+            matched.append(result != [])
+
+        if self.condition_type == "or" and not any(matched):
+            return {}
+        if self.condition_type == "and" and not all(matched):
+            return {}
+        if self.condition_type not in ("or", "and"):
+            return {}
+        if self.log:
+            condition_results["log"] = self.log
+            if "response_dependent" in self.log:
+                condition_results["log"] = replace_dependent_response(self.log, condition_results)
+        return condition_results
+
+    def match(self, response):
+        """
+        Args:
+            response: the response from the engine
+
+        Returns:
+            the condition results, {} when the conditions are not met
+        """
+        if not response:
+            return {}
+        headers = lowercase_headers(response["headers"]) if "headers" in response else {}
+        condition_results = self.match_conditions(response, headers)
+        if self.iterative_response_match and (condition_results or self.condition_type == "or"):
+            for key, matcher in self.iterative_response_match:
+                result = matcher.match_conditions(response, headers)
+                if result:
+                    condition_results[key] = result
+        return condition_results
+
+
+class CompiledCache:
+    """
+    Bounded LRU of objects compiled from the module templates, keyed by the id of the source.
+    The sub-steps of a step share their nested blocks with the step, so the id is the same
+    for all of them. The source is kept alive in the cache so its id can't be reused by
+    another object while the entry is there.
+    """
+
+    def __init__(self, factory, size=512):
+        self.factory = factory
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, source):
+        key = id(source)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] is source:
+                self.entries.move_to_end(key)
+                return entry[1]
+        compiled = self.factory(source)
+        with self.lock:
+            self.entries[key] = (source, compiled)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return compiled
+
+
+condition_matchers = CompiledCache(ConditionMatcher)
+regex_conditions = CompiledCache(
+    lambda conditions: {name: RegexCondition(value) for name, value in conditions.items()}
+)
+
+
+def get_condition_matcher(response):
+    """
+    Returns the compiled ConditionMatcher for the response block of a step
+    """
+    return condition_matchers.get(response)
+
+
+def get_regex_conditions(conditions):
+    """
+    Returns the conditions (name -> {regex, reverse}) as compiled RegexConditions
+    """
+    return regex_conditions.get(conditions)
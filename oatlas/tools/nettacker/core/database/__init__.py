@@ -4,6 +4,8 @@ Database packet for Atlas. Importing functions for easier access
 
 from oatlas.tools.nettacker.core.database.models import (
     HostsLog,
+    ScanPlan,
+    ScanProgress,
     TempEvents,
 )
 from oatlas.tools.nettacker.core.database.mysql_setup import (
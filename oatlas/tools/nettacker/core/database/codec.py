@@ -0,0 +1,126 @@
+"""
+Storage format of the scan_events and temp_events rows.
+
+An event used to be stored twice, as JSON and as a whitespace-collapsed yaml dump for
+reading, and neither was compressed. Now a row keeps the JSON only, compressed with zlib.
+The events are small and look alike, so the compressor is primed with a dictionary of the
+keys and values they all share, which is where most of the saving comes from. The text
+version is made from the JSON when a report asks for it.
+
+The first byte of a compressed event is the format version, a new dictionary gets a new
+version and the old one stays here so older rows can still be read.
+
+The JSON is written with orjson when it's installed (pip install orjson), it's several
+times faster than json.dumps on the events of chatty modules like dir_scan.
+"""
+
+import copy
+import json
+import zlib
+
+import yaml
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# libyaml's dumper when PyYAML was built with it, same output as the pure Python one
+YAML_DUMPER = getattr(yaml, "CDumper", yaml.Dumper)
+
+# zlib uses the end of the dictionary best, so the most common parts go last
+EVENT_DICTIONARY_V1 = (
+    b'"Content-Type": "text/xml", "Content-Type": "application/x-www-form-urlencoded", '
+    b'"Accept": "*/*", "Connection": "close", "data": "", "prefix": "", "suffix": "", '
+    b'"interceptors": null, "usernames": [], "passwords": [], "username": "", '
+    b'"password": "", "user_agent": "", "schema": "https", "schema": "http", '
+    b'"method": "socket_icmp", "method": "tcp_connect_only", '
+    b'"method": "tcp_connect_send_and_receive", "service": {}, "open_port": {}, '
+    b'"http": ["HTTP/1.1 200 OK"], "ssl_flag": true, "ssl_flag": false, '
+    b'"response_time": 0.0, "host": "", "port": 443, "port": 80, '
+    b'"ports": 443, "ports": 80, "reason": "OK", "reason": "Not Found", '
+    b'"status_code": ["200"], "status_code": "200", "status_code": "404", '
+    b'"content": [""], "content": "", "headers": {}, "title": [""], '
+    b'"url": "https://", "url": "http://", "allow_redirects": false, "ssl": false, '
+    b'"method": "post", "method": "get", "timeout": 3, '
+    b'"headers": {"User-Agent": "Nettacker 0.4.0 QUIN"}, '
+    b'"response": {"conditions_results": {'
+)
+
+# Version 2 stores compact JSON (no spaces after the separators, like orjson writes it)
+EVENT_DICTIONARY_V2 = EVENT_DICTIONARY_V1.replace(b": ", b":").replace(b", ", b",")
+
+EVENT_DICTIONARIES = {1: EVENT_DICTIONARY_V1, 2: EVENT_DICTIONARY_V2}
+EVENT_FORMAT_VERSION = 2
+
+
+def dump_event(event):
+    """
+    Args:
+        event: the event, JSON serializable
+
+    Returns:
+        the event as compact JSON bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers over 64 bits, json handles those
+            pass
+    return json.dumps(event, separators=(",", ":")).encode()
+
+
+def compress_event(event):
+    """
+    Args:
+        event: the event, JSON serializable
+
+    Returns:
+        the bytes to store
+    """
+    compressor = zlib.compressobj(level=6, zdict=EVENT_DICTIONARIES[EVENT_FORMAT_VERSION])
+    return (
+        bytes((EVENT_FORMAT_VERSION,))
+        + compressor.compress(dump_event(event))
+        + compressor.flush()
+    )
+
+
+def decompress_event(data):
+    """
+    Args:
+        data: bytes made by compress_event
+
+    Returns:
+        the event as a JSON string
+    """
+    decompressor = zlib.decompressobj(zdict=EVENT_DICTIONARIES[data[0]])
+    return (decompressor.decompress(data[1:]) + decompressor.flush()).decode()
+
+
+def stored_event(compressed_event, json_event):
+    """
+    The event of a row as a JSON string. Rows written before the events were compressed
+    only have the JSON column.
+    """
+    if compressed_event is not None:
+        return decompress_event(compressed_event)
+    return json_event
+
+
+def event_text(event):
+    """
+    The one line, human readable version of an event, as process_conditions used to store
+    it in the event column
+
+    Args:
+        event: the event (a dict)
+    """
+    event_request_keys = copy.deepcopy(event)
+    conditions_results = event_request_keys.pop("response", {}).get("conditions_results")
+    return (
+        " ".join(yaml.dump(event_request_keys, Dumper=YAML_DUMPER).split())
+        + " conditions: "
+        + " ".join(yaml.dump(conditions_results, Dumper=YAML_DUMPER).split())
+    )
@@ -1,13 +1,19 @@
 import json
+import os
+import queue
+import threading
 import time
+from datetime import datetime
 
 import apsw
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from oatlas.config import Database, Config
 from oatlas.logger import get_logger
-from oatlas.tools.nettacker.core.database import HostsLog, TempEvents
+from oatlas.tools.nettacker.core.database import HostsLog, ScanPlan, ScanProgress, TempEvents
+from oatlas.tools.nettacker.core.database.codec import compress_event, event_text, stored_event
 from oatlas.tools.nettacker.core.messages import messages
 
 logging = get_logger()
@@ -57,15 +63,50 @@ def create_connection():
         return connection, cursor
 
     else:
-        db_engine = create_engine(
-            db_inputs(Database.engine),
-            connect_args={},
-            pool_size=50,
-            pool_pre_ping=True,
-        )
-        Session = sessionmaker(bind=db_engine)
+        return get_db_session()
+
+
+_db_engine = None
+_db_engine_pid = None
+_db_sessions = None
+_db_engine_lock = threading.Lock()
 
-        return Session()
+
+def get_db_engine():
+    """
+    The SQLAlchemy engine of the current process, for MySQL and PostgreSQL. It used to be
+    created (with a new pool and new connections) for every query. Now there is one per
+    process, created on first use. A forked process doesn't use the pool it inherited, it
+    leaves those connections to the parent and creates its own engine.
+
+    Returns:
+        the SQLAlchemy engine
+    """
+    global _db_engine, _db_engine_pid, _db_sessions
+    if _db_engine is None or _db_engine_pid != os.getpid():
+        with _db_engine_lock:
+            if _db_engine is None or _db_engine_pid != os.getpid():
+                if _db_engine is not None:
+                    _db_engine.dispose(close=False)
+                _db_engine = create_engine(
+                    db_inputs(Database.engine),
+                    connect_args={},
+                    pool_size=50,
+                    pool_pre_ping=True,
+                )
+                # one session per thread, they all share the engine's pool
+                _db_sessions = scoped_session(sessionmaker(bind=_db_engine))
+                _db_engine_pid = os.getpid()
+    return _db_engine
+
+
+def get_db_session():
+    """
+    Returns the session of the current thread. Close it when done with a query so its
+    connection goes back to the pool, the session itself is reused.
+    """
+    get_db_engine()
+    return _db_sessions()
 
 
 def send_submit_query(session) -> bool:
@@ -110,6 +151,154 @@ def send_submit_query(session) -> bool:
         return False
 
 
+SCAN_EVENTS_INSERT_QUERY = """
+    INSERT INTO scan_events (target, date, module_name, scan_unique_id, port, compressed_event, protocols)
+    VALUES (:target, :date, :module_name, :scan_unique_id, :port, :compressed_event, :protocols)
+"""
+
+TEMP_EVENTS_INSERT_QUERY = """
+    INSERT INTO temp_events (target, date, module_name, scan_unique_id, event_name, port, compressed_event)
+    VALUES (:target, :date, :module_name, :scan_unique_id, :event_name, :port, :compressed_event)
+"""
+
+SCAN_PROGRESS_INSERT_QUERY = """
+    INSERT INTO scan_progress (date, scan_unique_id, target, module_name, completed_requests, finished)
+    VALUES (:date, :scan_unique_id, :target, :module_name, :completed_requests, :finished)
+"""
+
+# table -> (APSW insert query, SQLAlchemy table), in the order they are committed
+EVENT_TABLES = {
+    "scan_events": (SCAN_EVENTS_INSERT_QUERY, HostsLog.__table__),
+    "temp_events": (TEMP_EVENTS_INSERT_QUERY, TempEvents.__table__),
+    "scan_progress": (SCAN_PROGRESS_INSERT_QUERY, ScanProgress.__table__),
+}
+
+
+class EventWriter:
+    """
+    A single writer per process for the events.
+
+    Every engine thread used to open its own connection (and with MySQL/PostgreSQL its own
+    engine) and do BEGIN/INSERT/COMMIT for one row, which is an fsync per event and a lot of
+    "database is locked" retries once a few hundred threads are at it. Now the threads just
+    put their rows on a queue and this writer commits them in group transactions with
+    executemany, bounded by `event_batch_size` and `event_flush_interval`. On SQLite the
+    insert statements stay prepared in APSW's statement cache, on MySQL/PostgreSQL SQLAlchemy
+    turns the batch into multi-row inserts.
+
+    Temp events are committed right away since dependent steps are waiting on them.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.queue = queue.Queue()
+        self.batch_size = Config.nettacker.event_batch_size
+        self.flush_interval = Config.nettacker.event_flush_interval
+        self.sqlite = Database.engine.startswith("sqlite")
+        self.thread = threading.Thread(
+            target=self._run, name="nettacker-event-writer", daemon=True
+        )
+        self.thread.start()
+
+    def put(self, table, row):
+        self.queue.put((table, row))
+
+    def flush(self, timeout=None):
+        """
+        Blocks until everything queued before this call has been committed
+        """
+        flushed = threading.Event()
+        self.queue.put(("flush", flushed))
+        return flushed.wait(timeout)
+
+    def _run(self):
+        connection = create_connection()[0] if self.sqlite else get_db_engine()
+        rows = {table: [] for table in EVENT_TABLES}
+        flush_requests = []
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            queued = 0
+            commit_now = False
+            while queued < self.batch_size and not commit_now:
+                try:
+                    table, item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if table == "flush":
+                    flush_requests.append(item)
+                    commit_now = True
+                    continue
+                rows[table].append(item)
+                queued += 1
+                if table == "temp_events":
+                    commit_now = True
+
+            if queued:
+                self._commit(connection, rows)
+                rows = {table: [] for table in EVENT_TABLES}
+            for flushed in flush_requests:
+                flushed.set()
+            flush_requests = []
+
+    def _execute(self, connection, rows):
+        # The progress rows come after the events they are about, in the same transaction
+        if self.sqlite:
+            with connection:
+                for table, (query, _table) in EVENT_TABLES.items():
+                    if rows[table]:
+                        connection.executemany(query, rows[table])
+        else:
+            with connection.begin() as db_connection:
+                for table, (_query, sqlalchemy_table) in EVENT_TABLES.items():
+                    if rows[table]:
+                        db_connection.execute(sqlalchemy_table.insert(), rows[table])
+
+    def _commit(self, connection, rows):
+        for _ in range(Config.nettacker.max_retries):
+            try:
+                self._execute(connection, rows)
+                return True
+            except (apsw.BusyError, OperationalError):
+                logging.warn(
+                    f"[Retry {_ + 1}/{Config.nettacker.max_retries}] Database is locked. Retrying..."
+                )
+                time.sleep(Config.nettacker.retry_delay)
+            except Exception:
+                break
+        # All retires exhausted but we want to continue operation
+        logging.warn(
+            f"Could not write {sum(len(table_rows) for table_rows in rows.values())} events. "
+            "Skipping them."
+        )
+        return False
+
+
+_event_writer = None
+_event_writer_lock = threading.Lock()
+
+
+def get_event_writer():
+    """
+    Returns the event writer of the current process, the writer thread doesn't survive a
+    fork so every scan process gets its own.
+    """
+    global _event_writer
+    if _event_writer is None or _event_writer.pid != os.getpid():
+        with _event_writer_lock:
+            if _event_writer is None or _event_writer.pid != os.getpid():
+                _event_writer = EventWriter()
+    return _event_writer
+
+
+def flush_events():
+    """
+    Commit whatever is still queued in this process. Call this at the end of a scan.
+    """
+    if _event_writer is not None and _event_writer.pid == os.getpid():
+        return _event_writer.flush()
+    return True
+
+
 # ----------------------------------------------------
 #               Nettacker functions
 # ----------------------------------------------------
@@ -161,15 +350,30 @@ def remove_old_logs(options):
             HostsLog.scan_unique_id != options["scan_id"],
             # Don't remove old logs if they are to be used for the scan reports
         ).delete(synchronize_session=False)
-        return send_submit_query(session)
+        try:
+            return send_submit_query(session)
+        finally:
+            session.close()
+
+
+def extract_protocols(json_event):
+    """
+    The keys of conditions_results, for port_scan these are the services found on the port.
+    Stored in their own column so service discovery can read them without the json_event.
+    """
+    try:
+        return list(json_event["response"]["conditions_results"].keys())
+    except (KeyError, TypeError, AttributeError):
+        return []
 
 
 # All the below functions are important because they are part of the core architecture
 def submit_logs_to_db(log):
     """
     this function created to submit new events into database.
-    This requires a little more robust handling in case of
-    APSW in order to avoid database lock issues.
+    The row is only queued, the process' EventWriter commits it
+    along with the others to avoid database lock issues. Only the
+    compressed json_event is stored, see codec.py.
 
     Args:
         log: log event in JSON type
@@ -179,71 +383,19 @@ def submit_logs_to_db(log):
     """
 
     if isinstance(log, dict):
-        session = create_connection()
-        if isinstance(session, tuple):
-            connection, cursor = session
-            try:
-                for _ in range(Config.nettacker.max_retries):
-                    try:
-                        if not connection.in_transaction:
-                            connection.execute("BEGIN")
-                        cursor.execute(
-                            """
-                            INSERT INTO scan_events (target, date, module_name, scan_unique_id, port, event, json_event)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                log["target"],
-                                str(log["date"]),
-                                log["module_name"],
-                                log["scan_id"],
-                                json.dumps(log["port"]),
-                                json.dumps(log["event"]),
-                                json.dumps(log["json_event"]),
-                            ),
-                        )
-                        return send_submit_query(session)
-
-                    except apsw.BusyError as e:
-                        if "database is locked" in str(e).lower():
-                            logging.warn(
-                                f"[Retry {_ + 1}/{Config.nettacker.max_retries}] Database is locked. Retrying..."
-                            )
-                            if connection.in_transaction:
-                                connection.execute("ROLLBACK")
-                            time.sleep(Config.nettacker.retry_delay)
-                            continue
-                        else:
-                            if connection.in_transaction:
-                                connection.execute("ROLLBACK")
-                            return False
-                    except Exception:
-                        try:
-                            if connection.in_transaction:
-                                connection.execute("ROLLBACK")
-                        except Exception:
-                            pass
-                        return False
-                # All retires exhausted but we want to continue operation
-                logging.warn("All retries exhausted. Skipping this log.")
-                return True
-            finally:
-                cursor.close()
-                connection.close()
-
-        else:
-            session.add(
-                HostsLog(
-                    target=log["target"],
-                    date=log["date"],
-                    module_name=log["module_name"],
-                    scan_unique_id=log["scan_id"],
-                    port=json.dumps(log["port"]),
-                    event=json.dumps(log["event"]),
-                    json_event=json.dumps(log["json_event"]),
-                )
-            )
-            return send_submit_query(session)
+        get_event_writer().put(
+            "scan_events",
+            {
+                "target": log["target"],
+                "date": str(log["date"]) if Database.engine.startswith("sqlite") else log["date"],
+                "module_name": log["module_name"],
+                "scan_unique_id": log["scan_id"],
+                "port": json.dumps(log["port"]),
+                "compressed_event": compress_event(log["json_event"]),
+                "protocols": json.dumps(extract_protocols(log["json_event"])),
+            },
+        )
+        return True
     else:
         logging.warn(messages("invalid_json_type_to_db").format(log))
         return False
@@ -252,8 +404,10 @@ def submit_logs_to_db(log):
 def submit_temp_logs_to_db(log):
     """
     this function created to submit new events into database.
-    This requires a little more robust handling in case of
-    APSW in order to avoid database lock issues.
+    The row is only queued, the process' EventWriter commits it
+    along with the others to avoid database lock issues. The data
+    is the conditions_results of the event, only the compressed
+    event is stored.
 
     Args:
         log: log event in JSON type
@@ -262,78 +416,19 @@ def submit_temp_logs_to_db(log):
         True if success otherwise False
     """
     if isinstance(log, dict):
-        session = create_connection()
-        if isinstance(session, tuple):
-            connection, cursor = session
-
-            try:
-                for _ in range(Config.nettacker.max_retries):
-                    try:
-                        if not connection.in_transaction:
-                            cursor.execute("BEGIN")
-                        cursor.execute(
-                            """
-                            INSERT INTO temp_events (target, date, module_name, scan_unique_id, event_name, port, event, data)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                log["target"],
-                                str(log["date"]),
-                                log["module_name"],
-                                log["scan_id"],
-                                log["event_name"],
-                                json.dumps(log["port"]),
-                                json.dumps(log["event"]),
-                                json.dumps(log["data"]),
-                            ),
-                        )
-                        return send_submit_query(session)
-                    except apsw.BusyError as e:
-                        if "database is locked" in str(e).lower():
-                            logging.warn(
-                                f"[Retry {_ + 1}/{Config.nettacker.max_retries}] Database is locked. Retrying..."
-                            )
-                            try:
-                                if connection.in_transaction:
-                                    connection.execute("ROLLBACK")
-                            except Exception:
-                                pass
-                            time.sleep(Config.nettacker.retry_delay)
-                            continue
-                        else:
-                            try:
-                                if connection.in_transaction:
-                                    connection.execute("ROLLBACK")
-                            except Exception:
-                                pass
-                            return False
-                    except Exception:
-                        try:
-                            if connection.in_transaction:
-                                connection.execute("ROLLBACK")
-                        except Exception:
-                            pass
-                        return False
-                # All retires exhausted but we want to continue operation
-                logging.warn("All retries exhausted. Skipping this log.")
-                return True
-            finally:
-                cursor.close()
-                connection.close()
-        else:
-            session.add(
-                TempEvents(
-                    target=log["target"],
-                    date=log["date"],
-                    module_name=log["module_name"],
-                    scan_unique_id=log["scan_id"],
-                    event_name=log["event_name"],
-                    port=json.dumps(log["port"]),
-                    event=json.dumps(log["event"]),
-                    data=json.dumps(log["data"]),
-                )
-            )
-            return send_submit_query(session)
+        get_event_writer().put(
+            "temp_events",
+            {
+                "target": log["target"],
+                "date": str(log["date"]) if Database.engine.startswith("sqlite") else log["date"],
+                "module_name": log["module_name"],
+                "scan_unique_id": log["scan_id"],
+                "event_name": log["event_name"],
+                "port": json.dumps(log["port"]),
+                "compressed_event": compress_event(log["event"]),
+            },
+        )
+        return True
     else:
         logging.warn(messages("invalid_json_type_to_db").format(log))
         return False
@@ -358,7 +453,7 @@ def find_temp_events(target, module_name, scan_id, event_name):
         try:
             cursor.execute(
                 """
-                SELECT event
+                SELECT compressed_event, event
                 FROM temp_events
                 WHERE target = ? AND module_name = ? AND scan_unique_id = ? AND event_name = ?
                 LIMIT 1
@@ -370,25 +465,27 @@ def find_temp_events(target, module_name, scan_id, event_name):
             cursor.close()
             connection.close()
             if row:
-                return row[0]
+                return stored_event(*row)
             return []
         except Exception:
             logging.warn(messages("database_connect_fail"))
             return []
         return []
     else:
-        result = (
-            session.query(TempEvents)
-            .filter(
-                TempEvents.target == target,
-                TempEvents.module_name == module_name,
-                TempEvents.scan_unique_id == scan_id,
-                TempEvents.event_name == event_name,
+        try:
+            result = (
+                session.query(TempEvents)
+                .filter(
+                    TempEvents.target == target,
+                    TempEvents.module_name == module_name,
+                    TempEvents.scan_unique_id == scan_id,
+                    TempEvents.event_name == event_name,
+                )
+                .first()
             )
-            .first()
-        )
-
-        return result.event if result else []
+            return stored_event(result.compressed_event, result.event) if result else []
+        finally:
+            session.close()
 
 
 def find_events(target, module_name, scan_id):
@@ -410,7 +507,7 @@ def find_events(target, module_name, scan_id):
         try:
             cursor.execute(
                 """
-                SELECT json_event FROM scan_events
+                SELECT compressed_event, json_event FROM scan_events
                 WHERE target = ? AND module_name = ? and scan_unique_id = ?
                 """,
                 (target, module_name, scan_id),
@@ -419,23 +516,365 @@ def find_events(target, module_name, scan_id):
             rows = cursor.fetchall()
             cursor.close()
             connection.close()
-            if rows:
-                return [json.dumps((json.loads(row[0]))) for row in rows]
+            return [stored_event(*row) for row in rows]
+        except Exception:
+            logging.warn("Database query failed...")
             return []
+    else:
+        try:
+            return [
+                stored_event(row.compressed_event, row.json_event)
+                for row in session.query(HostsLog.compressed_event, HostsLog.json_event)
+                .filter(
+                    HostsLog.target == target,
+                    HostsLog.module_name == module_name,
+                    HostsLog.scan_unique_id == scan_id,
+                )
+                .all()
+            ]
+        finally:
+            session.close()
+
+
+def find_services(target, scan_id, module_name="port_scan"):
+    """
+    select the port and the detected protocols of the service discovery events
+
+    Args:
+        target: target
+        scan_id: unique scan identifier
+        module_name: module that did the discovery
+
+    Returns:
+        an array of (port, [protocols]) tuples or an empty array
+    """
+
+    def parse_row(port, protocols, compressed_event, json_event):
+        if protocols is None:
+            # written before the protocols column existed
+            json_event = json.loads(stored_event(compressed_event, json_event))
+            return json_event["port"], extract_protocols(json_event)
+        return json.loads(port), json.loads(protocols)
+
+    session = create_connection()
+    if isinstance(session, tuple):
+        connection, cursor = session
+        try:
+            cursor.execute(
+                """
+                SELECT port, protocols, compressed_event, json_event FROM scan_events
+                WHERE target = ? AND module_name = ? and scan_unique_id = ?
+                """,
+                (target, module_name, scan_id),
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+            return [parse_row(*row) for row in rows]
         except Exception:
             logging.warn("Database query failed...")
             return []
     else:
-        return [
-            row.json_event
-            for row in session.query(HostsLog)
-            .filter(
-                HostsLog.target == target,
-                HostsLog.module_name == module_name,
-                HostsLog.scan_unique_id == scan_id,
+        try:
+            return [
+                parse_row(*row)
+                for row in session.query(
+                    HostsLog.port,
+                    HostsLog.protocols,
+                    HostsLog.compressed_event,
+                    HostsLog.json_event,
+                )
+                .filter(
+                    HostsLog.target == target,
+                    HostsLog.module_name == module_name,
+                    HostsLog.scan_unique_id == scan_id,
+                )
+                .all()
+            ]
+        finally:
+            session.close()
+
+
+# ----------------------------------------------------
+#               Scan checkpoints
+# ----------------------------------------------------
+
+
+def submit_scan_progress(scan_id, target, module_name, completed_requests, finished=False):
+    """
+    Queue a checkpoint of a (target, module) work item. It goes through the EventWriter so
+    it's committed after the events of the requests it covers.
+
+    Args:
+        scan_id: unique scan identifier
+        target: target
+        module_name: module name
+        completed_requests: the first this many sub-steps are done
+        finished: True when the module is done with the target
+    """
+    date = datetime.now()
+    get_event_writer().put(
+        "scan_progress",
+        {
+            "date": str(date) if Database.engine.startswith("sqlite") else date,
+            "scan_unique_id": scan_id,
+            "target": target,
+            "module_name": module_name,
+            "completed_requests": completed_requests,
+            "finished": int(finished),
+        },
+    )
+    return True
+
+
+def save_scan_plan(scan_id, arguments, status="running"):
+    """
+    Save (or update) the arguments and the status of a scan
+
+    Args:
+        scan_id: unique scan identifier
+        arguments: the nettacker_run arguments, JSON serializable
+        status: running, stopped or finished
+
+    Returns:
+        True if success otherwise False
+    """
+    session = create_connection()
+    if isinstance(session, tuple):
+        connection, cursor = session
+        try:
+            cursor.execute("BEGIN")
+            cursor.execute(
+                """
+                INSERT INTO scan_plan (scan_unique_id, date, arguments, status)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (scan_unique_id) DO UPDATE SET status = excluded.status
+                """,
+                (scan_id, str(datetime.now()), json.dumps(arguments), status),
+            )
+            return send_submit_query(session)
+        except Exception:
+            cursor.execute("ROLLBACK")
+            logging.warn("Could not save the scan plan...")
+            return False
+        finally:
+            cursor.close()
+            connection.close()
+    else:
+        try:
+            plan = session.get(ScanPlan, scan_id)
+            if plan is None:
+                session.add(
+                    ScanPlan(
+                        scan_unique_id=scan_id,
+                        date=datetime.now(),
+                        arguments=json.dumps(arguments),
+                        status=status,
+                    )
+                )
+            else:
+                plan.status = status
+            return send_submit_query(session)
+        finally:
+            session.close()
+
+
+def find_scan_plan(scan_id):
+    """
+    Args:
+        scan_id: unique scan identifier
+
+    Returns:
+        (arguments, status) of the scan, None if there is no such scan
+    """
+    session = create_connection()
+    if isinstance(session, tuple):
+        connection, cursor = session
+        try:
+            cursor.execute(
+                "SELECT arguments, status FROM scan_plan WHERE scan_unique_id = ?",
+                (scan_id,),
+            )
+            row = cursor.fetchone()
+            cursor.close()
+            connection.close()
+            return (json.loads(row[0]), row[1]) if row else None
+        except Exception:
+            logging.warn("Database query failed...")
+            return None
+    else:
+        try:
+            plan = session.get(ScanPlan, scan_id)
+            return (json.loads(plan.arguments), plan.status) if plan else None
+        finally:
+            session.close()
+
+
+def find_scan_progress(scan_id):
+    """
+    Args:
+        scan_id: unique scan identifier
+
+    Returns:
+        a dict of (target, module_name) -> (completed_requests, finished) with the latest
+        checkpoint of every work item the scan got to
+    """
+    session = create_connection()
+    if isinstance(session, tuple):
+        connection, cursor = session
+        try:
+            cursor.execute(
+                """
+                SELECT target, module_name, MAX(completed_requests), MAX(finished)
+                FROM scan_progress WHERE scan_unique_id = ?
+                GROUP BY target, module_name
+                """,
+                (scan_id,),
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+        except Exception:
+            logging.warn("Database query failed...")
+            return {}
+    else:
+        try:
+            rows = (
+                session.query(
+                    ScanProgress.target,
+                    ScanProgress.module_name,
+                    func.max(ScanProgress.completed_requests),
+                    func.max(ScanProgress.finished),
+                )
+                .filter(ScanProgress.scan_unique_id == scan_id)
+                .group_by(ScanProgress.target, ScanProgress.module_name)
+                .all()
+            )
+        finally:
+            session.close()
+    return {
+        (target, module_name): (completed_requests, bool(finished))
+        for target, module_name, completed_requests, finished in rows
+    }
+
+
+# ----------------------------------------------------
+#               Compaction
+# ----------------------------------------------------
+
+
+def purge_temp_events():
+    """
+    Delete the temp events of the finished scans, nothing is going to wait on them anymore.
+    A stopped scan keeps them however old they are, its producing steps are not run again
+    when it's resumed and the dependent steps need their events.
+
+    Returns:
+        the number of deleted rows, None if it failed
+    """
+    session = create_connection()
+    if isinstance(session, tuple):
+        connection, cursor = session
+        try:
+            cursor.execute("BEGIN")
+            cursor.execute(
+                """
+                DELETE FROM temp_events
+                WHERE scan_unique_id IN (
+                    SELECT scan_unique_id FROM scan_plan WHERE status = 'finished'
+                )
+                """
+            )
+            deleted = connection.changes()
+            return deleted if send_submit_query(session) else None
+        except Exception:
+            cursor.execute("ROLLBACK")
+            logging.warn("Could not remove the temp events...")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
+    else:
+        finished_scans = select(ScanPlan.scan_unique_id).where(ScanPlan.status == "finished")
+        try:
+            deleted = (
+                session.query(TempEvents)
+                .filter(TempEvents.scan_unique_id.in_(finished_scans))
+                .delete(synchronize_session=False)
             )
-            .all()
-        ]
+            return deleted if send_submit_query(session) else None
+        finally:
+            session.close()
+
+
+def incremental_vacuum(pages_per_step):
+    """
+    Give the free pages of the SQLite file back to the file system. SQLite only reuses the
+    pages of deleted rows, the file never shrinks on its own. This goes `pages_per_step` at
+    a time, a transaction each, so the writers of a running scan don't wait on one long
+    vacuum. Needs auto_vacuum=INCREMENTAL (see sqlite_setup), MySQL and PostgreSQL reclaim
+    space themselves.
+
+    Returns:
+        the number of pages freed
+    """
+    if not Database.engine.startswith("sqlite"):
+        return 0
+    connection, cursor = create_connection()
+    freed = 0
+    try:
+        # 2 is INCREMENTAL, with anything else the free pages would never go down
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        while True:
+            free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_pages:
+                break
+            cursor.execute(f"PRAGMA incremental_vacuum({int(pages_per_step)})").fetchall()
+            freed += min(free_pages, pages_per_step)
+    except apsw.BusyError:
+        # A scan is writing, the rest is done on the next compaction
+        pass
+    finally:
+        cursor.close()
+        connection.close()
+    return freed
+
+
+def compact_database():
+    """
+    Purge the temp events that are not needed anymore and shrink the SQLite file
+    """
+    deleted = purge_temp_events()
+    freed = incremental_vacuum(Config.nettacker.vacuum_pages_per_step)
+    logging.verbose_info(messages("database_compacted").format(deleted or 0, freed))
+
+
+_compaction_lock = threading.Lock()
+
+
+def start_database_compaction():
+    """
+    Run compact_database on a background thread, unless it's disabled or already running in
+    this process
+
+    Returns:
+        the thread, None when it didn't start one
+    """
+    if not Config.nettacker.database_compaction or not _compaction_lock.acquire(blocking=False):
+        return None
+
+    def compact():
+        try:
+            compact_database()
+        except Exception as e:
+            logging.warn(f"Database compaction failed: {e}")
+        finally:
+            _compaction_lock.release()
+
+    thread = threading.Thread(target=compact, name="nettacker-compaction", daemon=True)
+    thread.start()
+    return thread
 
 
 # This funciton MIGHT be useful but I am not 100% sure if I will need to. So keeping this here for now
@@ -457,7 +896,7 @@ def logs_to_report_json(target):
 
             cursor.execute(
                 """
-                SELECT scan_unique_id, target, port, event, json_event
+                SELECT scan_unique_id, target, port, compressed_event, json_event
                 FROM scan_events WHERE target = ?
                 """,
                 (target,),
@@ -467,12 +906,13 @@ def logs_to_report_json(target):
             connection.close()
             if rows:
                 for log in rows:
+                    json_event = json.loads(stored_event(log[3], log[4]))
                     data = {
                         "scan_id": log[0],
                         "target": log[1],
                         "port": json.loads(log[2]),
-                        "event": json.loads(log[3]),
-                        "json_event": json.loads(log[4]),
+                        "event": event_text(json_event),
+                        "json_event": json_event,
                     }
                     return_logs.append(data)
                 return return_logs
@@ -481,14 +921,16 @@ def logs_to_report_json(target):
             return_logs = []
             logs = session.query(HostsLog).filter(HostsLog.target == target)
             for log in logs:
+                json_event = json.loads(stored_event(log.compressed_event, log.json_event))
                 data = {
                     "scan_id": log.scan_unique_id,
                     "target": log.target,
                     "port": json.loads(log.port),
-                    "event": json.loads(log.event),
-                    "json_event": json.loads(log.json_event),
+                    "event": event_text(json_event),
+                    "json_event": json_event,
                 }
                 return_logs.append(data)
+            session.close()
             return return_logs
 
     except Exception:
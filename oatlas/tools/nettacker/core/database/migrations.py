@@ -0,0 +1,126 @@
+"""
+Versioned schema migrations for the Nettacker tables.
+
+`create_all` only creates missing tables, it never touches the ones that already exist, so
+anything that changes an existing table (new columns, new indexes) goes in here. Every
+migration has a version number and is applied once, in order, and recorded in the
+`schema_version` table. A fresh database gets the latest schema straight from the models
+and is just stamped with the latest version.
+
+To add a migration write a function that takes a SQLAlchemy connection and append it to
+MIGRATIONS with the next version number. Keep them idempotent where you can, the same code
+runs on SQLite, MySQL and PostgreSQL.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, text
+
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.database.models import (
+    Base,
+    HostsLog,
+    ScanPlan,
+    ScanProgress,
+    SchemaVersion,
+    TempEvents,
+)
+
+log = get_logger()
+
+
+def add_column_if_missing(connection, table_name, column_name, column_type):
+    columns = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    if column_name not in columns:
+        connection.execute(
+            text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+        )
+
+
+def create_indexes_if_missing(connection, table):
+    existing_indexes = {index["name"] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing_indexes:
+            index.create(connection)
+
+
+def migration_1_lookup_indexes(connection):
+    """
+    Composite indexes for find_events, find_temp_events and remove_old_logs, and the
+    extracted protocols column on scan_events. Rows written before this migration have no
+    protocols, the readers fall back to parsing json_event for those.
+    """
+    add_column_if_missing(connection, HostsLog.__tablename__, "protocols", "TEXT")
+    create_indexes_if_missing(connection, HostsLog.__table__)
+    create_indexes_if_missing(connection, TempEvents.__table__)
+
+
+def migration_2_scan_checkpoints(connection):
+    """
+    scan_plan and scan_progress, for resuming interrupted scans. create_all makes the
+    tables, this is here for the index and to keep the version history in one place.
+    """
+    ScanPlan.__table__.create(connection, checkfirst=True)
+    ScanProgress.__table__.create(connection, checkfirst=True)
+    create_indexes_if_missing(connection, ScanProgress.__table__)
+
+
+def migration_3_compressed_events(connection):
+    """
+    compressed_event on scan_events and temp_events, the rows written from now on keep the
+    event there only. The old rows stay as they are, the readers look at both.
+    """
+    for table in (HostsLog.__table__, TempEvents.__table__):
+        add_column_if_missing(
+            connection,
+            table.name,
+            "compressed_event",
+            table.c.compressed_event.type.compile(dialect=connection.dialect),
+        )
+
+
+MIGRATIONS = [
+    (1, migration_1_lookup_indexes),
+    (2, migration_2_scan_checkpoints),
+    (3, migration_3_compressed_events),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def upgrade_schema(db_engine):
+    """
+    Create the tables if needed and bring an existing database up to the latest schema
+
+    Args:
+        db_engine: SQLAlchemy engine for the database
+
+    Returns:
+        the schema version the database is at now
+    """
+    fresh_database = not inspect(db_engine).has_table(HostsLog.__tablename__)
+    Base.metadata.create_all(db_engine)
+
+    with db_engine.begin() as connection:
+        current_version = connection.execute(select(func.max(SchemaVersion.version))).scalar()
+        if fresh_database:
+            connection.execute(
+                SchemaVersion.__table__.insert(),
+                [{"version": LATEST_SCHEMA_VERSION, "date": datetime.now()}],
+            )
+            return LATEST_SCHEMA_VERSION
+
+    current_version = current_version or 0
+    for version, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        log.info(f"Upgrading the Nettacker database schema to version {version}")
+        with db_engine.begin() as connection:
+            migration(connection)
+            connection.execute(
+                SchemaVersion.__table__.insert(),
+                [{"version": version, "date": datetime.now()}],
+            )
+        current_version = version
+
+    return current_version
@@ -1,8 +1,15 @@
-from sqlalchemy import Column, Text, Integer, DateTime, JSON
+from sqlalchemy import Column, Text, Integer, DateTime, JSON, Index, LargeBinary, String
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+# MySQL can't index TEXT columns without a prefix length, the other two ignore this
+INDEX_PREFIX_LENGTH = 191
+
+# The events compressed by database/codec.py, a plain BLOB is only 64KB on MySQL
+CompressedEvent = LargeBinary().with_variant(LONGBLOB(), "mysql")
+
 # ---------------------------------------------------------------------
 #                   Nettacker's required tables
 # ---------------------------------------------------------------------
@@ -17,6 +24,17 @@ class TempEvents(Base):
     """
 
     __tablename__ = "temp_events"
+    __table_args__ = (
+        # find_temp_events always filters on all four of these
+        Index(
+            "ix_temp_events_lookup",
+            "target",
+            "module_name",
+            "scan_unique_id",
+            "event_name",
+            mysql_length=INDEX_PREFIX_LENGTH,
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(DateTime)
@@ -25,8 +43,11 @@ class TempEvents(Base):
     scan_unique_id = Column(Text)
     event_name = Column(Text)
     port = Column(Text)
+    # event and data are only set on rows written before compressed_event, the data is the
+    # conditions_results of the event anyway
     event = Column(Text)
     data = Column(Text)
+    compressed_event = Column(CompressedEvent)
 
     def __repr__(self):
         """
@@ -56,6 +77,16 @@ class HostsLog(Base):
     """
 
     __tablename__ = "scan_events"
+    __table_args__ = (
+        # find_events and remove_old_logs filter on (target, module_name[, scan_unique_id])
+        Index(
+            "ix_scan_events_lookup",
+            "target",
+            "module_name",
+            "scan_unique_id",
+            mysql_length=INDEX_PREFIX_LENGTH,
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(DateTime)
@@ -63,8 +94,14 @@ class HostsLog(Base):
     module_name = Column(Text)
     scan_unique_id = Column(Text)
     port = Column(Text)
+    # event and json_event are only set on rows written before compressed_event, the text
+    # version is made from the JSON when it's read (codec.event_text)
     event = Column(Text)
     json_event = Column(Text)
+    compressed_event = Column(CompressedEvent)
+    # JSON list of the conditions_results keys (the detected services for port_scan) so
+    # that service discovery doesn't have to parse json_event again
+    protocols = Column(Text)
 
     def __repr__(self):
         """
@@ -72,7 +109,7 @@ class HostsLog(Base):
         """
         return """
             <scan_events(id={0}, target={1}, date={2}, module_name={3}, scan_unqiue_id={4},
-            port={5}, event={6}, json_event={7})>
+            port={5}, event={6}, json_event={7}, protocols={8})>
         """.format(
             self.id,
             self.target,
@@ -82,9 +119,81 @@ class HostsLog(Base):
             self.port,
             self.event,
             self.json_event,
+            self.protocols,
+        )
+
+
+class ScanPlan(Base):
+    """
+    One row per scan with the nettacker_run arguments it was started with, so an
+    interrupted scan can be started again with resume_scan_id.
+    """
+
+    __tablename__ = "scan_plan"
+
+    # The scan ids are 32 characters, a TEXT primary key doesn't work on MySQL
+    scan_unique_id = Column(String(64), primary_key=True)
+    date = Column(DateTime)
+    arguments = Column(Text)
+    # running, stopped or finished
+    status = Column(Text)
+
+    def __repr__(self):
+        return (
+            f"<ScanPlan(scan_unique_id={self.scan_unique_id}, date={self.date}, "
+            f"status={self.status})>"
         )
 
 
+class ScanProgress(Base):
+    """
+    Checkpoints of the (target, module) work items of a scan. A row says the first
+    `completed_requests` sub-steps of the module are done on the target, `finished` is set
+    once all of them are. Rows are only ever inserted, the highest one counts.
+    """
+
+    __tablename__ = "scan_progress"
+    __table_args__ = (
+        Index(
+            "ix_scan_progress_lookup",
+            "scan_unique_id",
+            "target",
+            "module_name",
+            mysql_length=INDEX_PREFIX_LENGTH,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    date = Column(DateTime)
+    scan_unique_id = Column(Text)
+    target = Column(Text)
+    module_name = Column(Text)
+    completed_requests = Column(Integer)
+    finished = Column(Integer)
+
+    def __repr__(self):
+        return (
+            f"<ScanProgress(scan_unique_id={self.scan_unique_id}, target={self.target}, "
+            f"module_name={self.module_name}, completed_requests={self.completed_requests}, "
+            f"finished={self.finished})>"
+        )
+
+
+class SchemaVersion(Base):
+    """
+    Holds the versions of the schema migrations (see migrations.py) that have been
+    applied to this database, one row per migration.
+    """
+
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    date = Column(DateTime)
+
+    def __repr__(self):
+        return f"<SchemaVersion(version={self.version}, date={self.date})>"
+
+
 # --------------------------------------------------------------------
 #               Databases for Browser Automations
 # --------------------------------------------------------------------
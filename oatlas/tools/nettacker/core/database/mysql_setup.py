@@ -1,7 +1,7 @@
 from sqlalchemy import create_engine, text
 
 from oatlas.config import Database
-from oatlas.tools.nettacker.core.database.models import Base
+from oatlas.tools.nettacker.core.database.migrations import upgrade_schema
 
 
 def mysql_create_database() -> None:
@@ -28,7 +28,8 @@ def mysql_create_database() -> None:
 def mysql_create_tables() -> None:
     """
     when using mysql database, this is the function that is used to create the
-    tables in the database for the first time when you run the nettacker module.
+    tables in the database for the first time when you run the nettacker module
+    (and to apply the pending schema migrations afterwards).
 
     Args:
         None
@@ -39,4 +40,4 @@ def mysql_create_tables() -> None:
     db_engine = create_engine(
         "mysql+pymysql://{username}:{password}@{host}:{port}/{name}".format(**Database.as_dict())
     )
-    Base.metadata.create_all(db_engine)
+    upgrade_schema(db_engine)
@@ -2,7 +2,7 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.exc import OperationalError
 
 from oatlas.config import Database
-from oatlas.tools.nettacker.core.database.models import Base
+from oatlas.tools.nettacker.core.database.migrations import upgrade_schema
 
 
 def postgres_create_database():
@@ -15,7 +15,7 @@ def postgres_create_database():
                 **Database.as_dict()
             )
         )
-        Base.metadata.create_all(engine)
+        upgrade_schema(engine)
     except OperationalError:
         # if the database does not exist, revert to the default
         engine = create_engine(
@@ -32,4 +32,4 @@ def postgres_create_database():
                 **Database.as_dict()
             )
         )
-        Base.metadata.create_all(engine)
+        upgrade_schema(engine)
@@ -1,17 +1,40 @@
 from sqlalchemy import create_engine
 
 from oatlas.config import Database
-from oatlas.tools.nettacker.core.database.models import Base
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.database.migrations import upgrade_schema
+
+log = get_logger()
+
+# PRAGMA auto_vacuum value
+INCREMENTAL_AUTO_VACUUM = 2
+
+
+def enable_incremental_vacuum(db_engine):
+    """
+    The compaction (database.incremental_vacuum) can only shrink the file with
+    auto_vacuum=INCREMENTAL. SQLite takes the setting when the first table is created, an
+    existing file has to be rebuilt with VACUUM once for it.
+    """
+    with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == INCREMENTAL_AUTO_VACUUM:
+            return
+        connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        if connection.exec_driver_sql("PRAGMA page_count").scalar():
+            log.info("Rebuilding the Nettacker database once for incremental vacuum")
+            connection.exec_driver_sql("VACUUM")
 
 
 def sqlite_create_tables():
     """
     when using sqlite database, this is the function that is used to create
-    the database schema for the first time when you run the nettacker module.
+    the database schema for the first time when you run the nettacker module,
+    and to apply the pending schema migrations on the runs after that.
 
     """
     db_engine = create_engine(
         "sqlite:///{name}".format(**Database.as_dict()),
         connect_args={"check_same_thread": False},
     )
-    Base.metadata.create_all(db_engine)
+    enable_incremental_vacuum(db_engine)
+    upgrade_schema(db_engine)
@@ -0,0 +1,67 @@
+import json
+import re
+from functools import lru_cache
+
+from oatlas.tools.nettacker.core.database.database import find_events
+from oatlas.tools.nettacker.core.template import TemplateLoader
+
+# The module whose events tell us what runs on a target. http_html_title_scan and
+# server_version_vuln only see a page title or the Server header, a WordPress behind nginx
+# is just "nginx" to them, so their results can't rule a product out
+FINGERPRINT_MODULE = "web_technologies_scan"
+
+
+def get_module_requirements(module_name):
+    """
+    Args:
+        module_name: name of the module
+
+    Returns:
+        the `requires` block of the module info, None when it has none
+    """
+    try:
+        return TemplateLoader(module_name).load_template()["info"].get("requires")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def get_fingerprints(target, scan_id):
+    """
+    The results of the fingerprint module for a target. It runs before everything else and
+    is done by the time any other module asks, so this is read once per process.
+
+    Returns:
+        the conditions results of the fingerprint events as lowercase text, None if there
+        are no fingerprint events for the target
+    """
+    fingerprints = [
+        json.dumps(json.loads(row)["response"]["conditions_results"], default=str)
+        for row in find_events(target, FINGERPRINT_MODULE, scan_id)
+    ]
+    return "\n".join(fingerprints).lower() if fingerprints else None
+
+
+@lru_cache(maxsize=None)
+def compile_requirement(regex):
+    return re.compile(regex, re.IGNORECASE)
+
+
+def requirements_met(requires, target, scan_id):
+    """
+    Args:
+        requires: the `requires` block of a module
+        target: target
+        scan_id: unique scan identifier
+
+    Returns:
+        False only when the target was fingerprinted and nothing matches what the module
+        needs. Without fingerprints we don't know, so the module runs.
+    """
+    fingerprint = requires.get("fingerprint")
+    if not fingerprint:
+        return True
+    fingerprints = get_fingerprints(target, scan_id)
+    if fingerprints is None:
+        return True
+    return bool(compile_requirement(fingerprint["regex"]).search(fingerprints))
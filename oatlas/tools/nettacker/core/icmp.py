@@ -0,0 +1,132 @@
+import os
+import select
+import socket
+import struct
+import time
+
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.resolver import resolve_address
+
+log = get_logger()
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+# Same packet size as socket_icmp, 8 bytes of header and 68 of data
+ICMP_PAYLOAD = b"Q" * 60
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def echo_request(identifier, sequence):
+    payload = struct.pack("!d", time.time()) + ICMP_PAYLOAD
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    header = struct.pack(
+        "!BBHHH", ICMP_ECHO_REQUEST, 0, checksum(header + payload), identifier, sequence
+    )
+    return header + payload
+
+
+def parse_echo_reply(packet):
+    """
+    Args:
+        packet: what the raw socket received, IP header included
+
+    Returns:
+        (identifier, sequence) of an echo reply, None for any other ICMP message
+    """
+    header_length = (packet[0] & 0x0F) * 4
+    if len(packet) < header_length + 8:
+        return None
+    packet_type, _code, _checksum, identifier, sequence = struct.unpack(
+        "!BBHHH", packet[header_length : header_length + 8]
+    )
+    if packet_type != ICMP_ECHO_REPLY:
+        return None
+    return identifier, sequence
+
+
+def resolve(target):
+    try:
+        return resolve_address(target)
+    except (OSError, UnicodeError):
+        return None
+
+
+def icmp_sweep(targets, timeout, packets_per_second):
+    """
+    Ping all the targets from one raw socket. socket_icmp opens a socket per target and
+    waits for its reply on a thread, here the echo requests go out at `packets_per_second`
+    and the replies are matched to the targets by (address, sequence) on a single receive
+    loop between the sends. Needs root, same as socket_icmp.
+
+    Args:
+        targets: the targets (iterated once, lazily)
+        timeout: seconds to wait for the reply of a target
+        packets_per_second: how fast the echo requests are sent
+
+    Returns:
+        a dict of target -> response time (seconds) for the targets that replied
+    """
+    identifier = os.getpid() & 0xFFFF
+    raw_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    raw_socket.setblocking(False)
+    interval = 1 / max(packets_per_second, 1)
+    # (address, sequence) -> (target, sent at), in the order they were sent
+    pending = {}
+    alive = {}
+
+    def receive(until):
+        while True:
+            ready, _write, _error = select.select(
+                [raw_socket], [], [], max(until - time.monotonic(), 0)
+            )
+            if not ready:
+                break
+            while True:
+                try:
+                    packet, (address, _port) = raw_socket.recvfrom(2048)
+                except (BlockingIOError, InterruptedError):
+                    break
+                reply = parse_echo_reply(packet)
+                if reply is None or reply[0] != identifier:
+                    continue
+                sent = pending.pop((address, reply[1]), None)
+                if sent is not None:
+                    alive[sent[0]] = time.monotonic() - sent[1]
+        # The oldest requests come first, drop the ones that won't get a reply anymore
+        now = time.monotonic()
+        for key in list(pending):
+            if now - pending[key][1] < timeout:
+                break
+            del pending[key]
+
+    try:
+        sequence = 0
+        next_send = time.monotonic()
+        for target in targets:
+            address = resolve(target)
+            if address is None:
+                continue
+            sequence = (sequence + 1) & 0xFFFF
+            try:
+                raw_socket.sendto(echo_request(identifier, sequence), (address, 0))
+            except OSError as e:
+                log.verbose_info(_("icmp_send_failed").format(target, e))
+                continue
+            pending[address, sequence] = (target, time.monotonic())
+            next_send += interval
+            receive(next_send)
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            receive(min(deadline, time.monotonic() + 0.1))
+    finally:
+        raw_socket.close()
+    return alive
@@ -4,6 +4,33 @@ import netaddr
 import requests
 
 
+def ip_range_to_intervals(ip_range):
+    """
+    The addresses of an IP range or CIDR as integer intervals, the same addresses
+    generate_ip_range gives without listing them
+
+    Args:
+        ip_range: IP range or CIDR
+
+    Returns:
+        an array of (ip version, first, last) tuples
+    """
+    if "/" in ip_range:
+        network = netaddr.IPNetwork(ip_range)
+        return [(network.version, network.first, network.last)]
+    intervals = []
+    for cidr in netaddr.iprange_to_cidrs(*ip_range.rsplit("-")):
+        first, last = cidr.first, cidr.last
+        # iter_hosts() leaves out the network address (and the broadcast address for IPv4)
+        # of every CIDR the range is split into
+        if cidr.size >= 4:
+            first += 1
+            if cidr.version == 4:
+                last -= 1
+        intervals.append((cidr.version, first, last))
+    return intervals
+
+
 def generate_ip_range(ip_range):
     """
     IP range to CIDR and IPNetwork type
@@ -12,18 +39,11 @@ def generate_ip_range(ip_range):
         ip_range: IP range
 
     Returns:
-        an array with CIDRs
+        a generator of the IPs in the range
     """
-    if "/" in ip_range:
-        return [ip.format() for ip in [cidr for cidr in netaddr.IPNetwork(ip_range)]]
-    else:
-        ips = []
-        for generator_ip_range in [
-            cidr.iter_hosts() for cidr in netaddr.iprange_to_cidrs(*ip_range.rsplit("-"))
-        ]:
-            for ip in generator_ip_range:
-                ips.append(ip.format())
-        return ips
+    for version, first, last in ip_range_to_intervals(ip_range):
+        for value in range(first, last + 1):
+            yield str(netaddr.IPAddress(value, version))
 
 
 def get_ip_range(ip):
@@ -34,18 +54,18 @@ def get_ip_range(ip):
         ip: IP address
 
     Returns:
-        IP Range
+        IP Range (the IP itself if it can't be found)
     """
     try:
-        return generate_ip_range(
-            json.loads(
-                requests.get(
-                    f"https://rest.db.ripe.net/search.json?query-string={ip}&flags=no-filtering"
-                ).content
-            )["objects"]["object"][0]["primary-key"]["attribute"][0]["value"].replace(" ", "")
-        )
+        ip_range = json.loads(
+            requests.get(
+                f"https://rest.db.ripe.net/search.json?query-string={ip}&flags=no-filtering"
+            ).content
+        )["objects"]["object"][0]["primary-key"]["attribute"][0]["value"].replace(" ", "")
+        ip_range_to_intervals(ip_range)
+        return ip_range
     except Exception:
-        return [ip]
+        return ip
 
 
 def is_single_ipv4(ip):
@@ -1,27 +1,38 @@
+import asyncio
 import copy
 import json
-import re
 import time
 from abc import ABC
 from datetime import datetime
 
-import yaml
-
-from oatlas.core.database.database import (
+from oatlas.config import Config
+from oatlas.logger import get_logger, TerminalCodes
+from oatlas.tools.nettacker.core.database.database import (
     find_temp_events,
     submit_temp_logs_to_db,
     submit_logs_to_db,
 )
-from oatlas.logger import get_logger, TerminalCodes
 from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.temp_events import get_temp_event_store
 from oatlas.tools.nettacker.core.utils.common import (
+    log_tokens,
     merge_logs_to_list,
     remove_sensitive_header_keys,
 )
+from oatlas.tools.nettacker.core.utils.expressions import compile_template
 
 log = get_logger()
 
 
+def check_dependent_event_deadline(deadline, target, module_name, event_name):
+    if time.monotonic() >= deadline:
+        raise TimeoutError(
+            _("dependent_event_missing").format(
+                event_name, module_name, target, Config.nettacker.dependent_event_max_wait
+            )
+        )
+
+
 class BaseLibrary(ABC):
     """Nettacker library base class."""
 
@@ -53,63 +64,78 @@ class BaseEngine(ABC):
             return content
 
     def get_dependent_results_from_database(self, target, module_name, scan_id, event_names):
+        """
+        Wait for the temp events this step depends on. They are published to the in-process
+        store by the producing step, the database is only checked when one doesn't show up
+        within `dependent_event_timeout` (e.g. it was saved by another process).
+
+        Raises:
+            TimeoutError: when an event doesn't show up in `dependent_event_max_wait`
+                seconds, the step fails instead of holding its worker for good
+        """
         events = []
+        store = get_temp_event_store()
+        deadline = time.monotonic() + Config.nettacker.dependent_event_max_wait
         for event_name in event_names.split(","):
             while True:
+                check_dependent_event_deadline(deadline, target, module_name, event_name)
+                event = store.wait(
+                    (target, module_name, scan_id, event_name),
+                    Config.nettacker.dependent_event_timeout,
+                )
+                if event is not None:
+                    events.append(event)
+                    break
                 event = find_temp_events(target, module_name, scan_id, event_name)
                 if event:
                     events.append(json.loads(event)["response"]["conditions_results"])
                     break
-                time.sleep(0.1)
+        return events
+
+    async def get_dependent_results_async(self, target, module_name, scan_id, event_names):
+        """
+        Coroutine version of get_dependent_results_from_database for the async engines
+        """
+        events = []
+        store = get_temp_event_store()
+        deadline = time.monotonic() + Config.nettacker.dependent_event_max_wait
+        for event_name in event_names.split(","):
+            while True:
+                check_dependent_event_deadline(deadline, target, module_name, event_name)
+                event = await store.wait_async(
+                    (target, module_name, scan_id, event_name),
+                    Config.nettacker.dependent_event_timeout,
+                )
+                if event is not None:
+                    events.append(event)
+                    break
+                event = await asyncio.to_thread(
+                    find_temp_events, target, module_name, scan_id, event_name
+                )
+                if event:
+                    events.append(json.loads(event)["response"]["conditions_results"])
+                    break
         return events
 
     def find_and_replace_dependent_values(self, sub_step, dependent_on_temp_event):
+        """
+        Fill in the dependent_on_temp_event[...] paths in the sub-step. New containers are
+        built on the way, the nested parts of a sub-step are shared with its step.
+        """
         if isinstance(sub_step, dict):
-            for key in copy.deepcopy(sub_step):
-                if not isinstance(sub_step[key], (str, float, int, bytes)):
-                    sub_step[key] = self.find_and_replace_dependent_values(
-                        copy.deepcopy(sub_step[key]), dependent_on_temp_event
-                    )
-                else:
-                    if isinstance(sub_step[key], str):
-                        if "dependent_on_temp_event" in sub_step[key]:
-                            globals().update(locals())
-                            generate_new_step = copy.deepcopy(sub_step[key])
-                            key_name = re.findall(
-                                re.compile(
-                                    "dependent_on_temp_event\\[\\S+\\]\\['\\S+\\]\\[\\S+\\]"
-                                ),
-                                generate_new_step,
-                            )[0]
-                            try:
-                                key_value = eval(key_name)
-                            except Exception:
-                                key_value = "error"
-                            sub_step[key] = sub_step[key].replace(key_name, key_value)
+            return {
+                key: self.find_and_replace_dependent_values(value, dependent_on_temp_event)
+                for key, value in sub_step.items()
+            }
         if isinstance(sub_step, list):
-            value_index = 0
-            for key in copy.deepcopy(sub_step):
-                if type(sub_step[value_index]) not in [str, float, int, bytes]:
-                    sub_step[key] = self.find_and_replace_dependent_values(
-                        copy.deepcopy(sub_step[value_index]), dependent_on_temp_event
-                    )
-                else:
-                    if isinstance(sub_step[value_index], str):
-                        if "dependent_on_temp_event" in sub_step[value_index]:
-                            globals().update(locals())
-                            generate_new_step = copy.deepcopy(sub_step[key])
-                            key_name = re.findall(
-                                re.compile("dependent_on_temp_event\\['\\S+\\]\\[\\S+\\]"),
-                                generate_new_step,
-                            )[0]
-                            try:
-                                key_value = eval(key_name)
-                            except Exception:
-                                key_value = "error"
-                            sub_step[value_index] = sub_step[value_index].replace(
-                                key_name, key_value
-                            )
-                value_index += 1
+            return [
+                self.find_and_replace_dependent_values(value, dependent_on_temp_event)
+                for value in sub_step
+            ]
+        if isinstance(sub_step, str) and "dependent_on_temp_event" in sub_step:
+            return compile_template(sub_step, "dependent_on_temp_event").render(
+                dependent_on_temp_event
+            )
         return sub_step
 
     def process_conditions(
@@ -129,6 +155,11 @@ class BaseEngine(ABC):
         # Remove sensitive keys from headers before submitting to DB
         event = remove_sensitive_header_keys(event)
         if "save_to_temp_events_only" in event.get("response", ""):
+            # Publish before the DB write, the dependent steps of this module are waiting on it
+            get_temp_event_store().publish(
+                (target, module_name, scan_id, event["response"]["save_to_temp_events_only"]),
+                copy.deepcopy(event["response"]["conditions_results"]),
+            )
             submit_temp_logs_to_db(
                 {
                     "date": datetime.now(),
@@ -138,22 +169,16 @@ class BaseEngine(ABC):
                     "event_name": event["response"]["save_to_temp_events_only"],
                     "port": event.get("ports", ""),
                     "event": event,
-                    "data": response,
                 }
             )
         if event["response"]["conditions_results"] and "save_to_temp_events_only" not in event.get(
             "response", ""
         ):
             # remove sensitive information before submitting to db
-
-            options = copy.deepcopy(options)
-
             del event["response"]["conditions"]
             del event["response"]["condition_type"]
             if "log" in event["response"]:
                 del event["response"]["log"]
-            event_request_keys = copy.deepcopy(event)
-            del event_request_keys["response"]
             submit_logs_to_db(
                 {
                     "date": datetime.now(),
@@ -169,38 +194,30 @@ class BaseEngine(ABC):
                         and event.get("url").split(":")[2].split("/")[0].isdigit()
                         else ""
                     ),
-                    "event": " ".join(yaml.dump(event_request_keys).split())
-                    + " conditions: "
-                    + " ".join(yaml.dump(event["response"]["conditions_results"]).split()),
+                    # The text version is made from json_event when it's read
                     "json_event": event,
                 }
             )
-            log_list = merge_logs_to_list(event["response"]["conditions_results"])
-            if log_list:
-                log.success_event_info(
-                    _("send_success_event_from_module").format(
-                        process_number,
-                        module_name,
-                        target,
-                        module_thread_number,
-                        total_module_thread_number,
-                        request_number_counter,
-                        total_number_of_requests,
-                        " ",
-                        self.filter_large_content(
-                            "\n".join(
-                                [
-                                    TerminalCodes.PURPLE.value + key + TerminalCodes.RESET.value
-                                    for key in log_list
-                                ]
-                            ),
-                            filter_rate=100000,
-                        ),
-                    )
+            if Config.nettacker.log_success_events:
+                self.log_success_event(
+                    event,
+                    module_name,
+                    target,
+                    process_number,
+                    module_thread_number,
+                    total_module_thread_number,
+                    request_number_counter,
+                    total_number_of_requests,
                 )
-            else:
-                log.success_event_info(
-                    _("send_success_event_from_module").format(
+            # These run for every request, don't build the message when it's not printed
+            if log.verbose_mode_is_enabled:
+                log.verbose_info(json.dumps(event))
+            return True
+        else:
+            del event["response"]["conditions"]
+            if log.verbose_mode_is_enabled:
+                log.verbose_info(
+                    _("send_unsuccess_event_from_module").format(
                         process_number,
                         module_name,
                         target,
@@ -208,38 +225,29 @@ class BaseEngine(ABC):
                         total_module_thread_number,
                         request_number_counter,
                         total_number_of_requests,
-                        " ".join(
-                            [
-                                TerminalCodes.YELLOW.value + key + TerminalCodes.RESET.value
-                                if ":" in key
-                                else TerminalCodes.GREEN.value + key + TerminalCodes.RESET.value
-                                for key in yaml.dump(event_request_keys).split()
-                            ]
-                        ),
-                        self.filter_large_content(
-                            "conditions: "
-                            + " ".join(
-                                [
-                                    TerminalCodes.PURPLE.value + key + TerminalCodes.RESET.value
-                                    if ":" in key
-                                    else TerminalCodes.GREEN.value
-                                    + key
-                                    + TerminalCodes.RESET.value
-                                    for key in yaml.dump(
-                                        event["response"]["conditions_results"]
-                                    ).split()
-                                ]
-                            ),
-                            filter_rate=150,
-                        ),
                     )
                 )
-            log.verbose_info(json.dumps(event))
-            return True
-        else:
-            del event["response"]["conditions"]
-            log.verbose_info(
-                _("send_unsuccess_event_from_module").format(
+                log.verbose_info(json.dumps(event))
+            return "save_to_temp_events_only" in event["response"]
+
+    def log_success_event(
+        self,
+        event,
+        module_name,
+        target,
+        process_number,
+        module_thread_number,
+        total_module_thread_number,
+        request_number_counter,
+        total_number_of_requests,
+    ):
+        """
+        Print a found event with the request keys and the results coloured in
+        """
+        log_list = merge_logs_to_list(event["response"]["conditions_results"])
+        if log_list:
+            log.success_event_info(
+                _("send_success_event_from_module").format(
                     process_number,
                     module_name,
                     target,
@@ -247,10 +255,53 @@ class BaseEngine(ABC):
                     total_module_thread_number,
                     request_number_counter,
                     total_number_of_requests,
+                    " ",
+                    self.filter_large_content(
+                        "\n".join(
+                            [
+                                TerminalCodes.PURPLE.value + key + TerminalCodes.RESET.value
+                                for key in log_list
+                            ]
+                        ),
+                        filter_rate=100000,
+                    ),
                 )
             )
-            log.verbose_info(json.dumps(event))
-            return "save_to_temp_events_only" in event["response"]
+            return
+
+        # Only the top level is left out, nothing is changed so no need for a deep copy
+        event_request_keys = {key: value for key, value in event.items() if key != "response"}
+        log.success_event_info(
+            _("send_success_event_from_module").format(
+                process_number,
+                module_name,
+                target,
+                module_thread_number,
+                total_module_thread_number,
+                request_number_counter,
+                total_number_of_requests,
+                " ".join(
+                    [
+                        TerminalCodes.YELLOW.value + key + TerminalCodes.RESET.value
+                        if ":" in key
+                        else TerminalCodes.GREEN.value + key + TerminalCodes.RESET.value
+                        for key in log_tokens(event_request_keys)
+                    ]
+                ),
+                self.filter_large_content(
+                    "conditions: "
+                    + " ".join(
+                        [
+                            TerminalCodes.PURPLE.value + key + TerminalCodes.RESET.value
+                            if ":" in key
+                            else TerminalCodes.GREEN.value + key + TerminalCodes.RESET.value
+                            for key in log_tokens(event["response"]["conditions_results"])
+                        ]
+                    ),
+                    filter_rate=150,
+                ),
+            )
+        )
 
     def replace_dependent_values(self, sub_step, dependent_on_temp_event):
         return self.find_and_replace_dependent_values(sub_step, dependent_on_temp_event)
@@ -269,10 +320,10 @@ class BaseEngine(ABC):
         total_number_of_requests,
     ):
         """Engine entry point."""
-        backup_method = copy.deepcopy(sub_step["method"])
-        backup_response = copy.deepcopy(sub_step["response"])
-        del sub_step["method"]
-        del sub_step["response"]
+        backup_method = sub_step.pop("method")
+        # Only the top level of the response block is changed below, the nested parts are
+        # shared with the other sub-steps and are used as keys of the compiled conditions
+        backup_response = dict(sub_step.pop("response"))
 
         for attr_name in ("ports", "usernames", "passwords"):
             if attr_name in sub_step:
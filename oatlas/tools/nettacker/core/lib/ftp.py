@@ -1,23 +1,33 @@
 import ftplib
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.brute import BruteForceLibrary
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.proxy import create_connection
 
 
-class FtpLibrary(BaseLibrary):
+class FtpLibrary(BruteForceLibrary):
     client = ftplib.FTP
 
-    def brute_force(self, host, port, username, password, timeout):
+    def connect(self, host, port, timeout):
         connection = self.client(timeout=timeout)
-        connection.connect(host, port)
+        # What FTP.connect does, on a connection through the scan's proxies
+        connection.host, connection.port = host, port
+        connection.sock = create_connection(host, port, timeout)
+        try:
+            connection.af = connection.sock.family
+            connection.file = connection.sock.makefile("r", encoding=connection.encoding)
+            connection.welcome = connection.getresp()
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def login(self, connection, username, password):
+        # After a 530 the server waits for the next USER on the same connection
         connection.login(username, password)
-        connection.close()
-
-        return {
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-        }
+
+    def is_auth_failure(self, error):
+        return isinstance(error, ftplib.error_perm)
 
 
 class FtpEngine(BaseEngine):
@@ -1,24 +1,72 @@
 #!/usr/bin/env python
 
 import asyncio
-import copy
+import errno
+import functools
+import json
 import random
-import re
+import socket
 import time
+from collections import OrderedDict
 
 import aiohttp
 import uvloop
+from aiohttp.abc import AbstractResolver
+from aiohttp_socks import ProxyConnectionError, ProxyConnector
 
+from oatlas.config import Config
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.concurrency import get_host_concurrency
+from oatlas.tools.nettacker.core.conditions import ConditionMatcher, get_condition_matcher
 from oatlas.tools.nettacker.core.lib.base import BaseEngine
-from oatlas.tools.nettacker.core.utils.common import (
-    replace_dependent_response,
-    reverse_and_regex_condition,
-    get_http_header_key,
-    get_http_header_value,
-)
+from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.proxy import get_proxy_pool
+from oatlas.tools.nettacker.core.resolver import get_dns_cache
+from oatlas.tools.nettacker.core.scheduler import get_scheduler
+from oatlas.tools.nettacker.core.utils.common import get_http_header_key, get_http_header_value
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
+log = get_logger()
+
+# Only these are safe to answer from another module's request
+CACHEABLE_METHODS = ("get", "head")
+# Request options and headers that don't change what the server sends back
+IGNORED_CACHE_OPTIONS = ("timeout",)
+IGNORED_CACHE_HEADERS = ("user-agent",)
+# The target is overloaded or rate limiting us, back off (see concurrency.py)
+CONGESTION_STATUS_CODES = ("429", "503")
+CONGESTION_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+
+def is_congestion_error(error, connected):
+    """
+    Timeouts and connections the target dropped after it took the connection. A connect
+    that times out or is refused is a filtered or closed port (service discovery is skipped
+    by default, the HTTP modules run into those all the time), not a busy target, and
+    neither is a bad certificate.
+
+    Args:
+        error: what the request raised
+        connected: the request got a connection to the target (see create_trace_config)
+    """
+    if not connected:
+        return False
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.ServerDisconnectedError)):
+        return True
+    return isinstance(error, OSError) and error.errno in CONGESTION_ERRNOS
+
+
+def parse_retry_after(value):
+    """
+    Returns:
+        the seconds of a Retry-After header, None when it's missing or an HTTP date
+    """
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
 
 async def perform_request_action(action, request_options):
     start_time = time.time()
@@ -33,106 +81,215 @@ async def perform_request_action(action, request_options):
         }
 
 
-async def send_request(request_options, method):
-    async with aiohttp.ClientSession() as session:
-        action = getattr(session, method, None)
-        response = await asyncio.gather(
-            *[asyncio.ensure_future(perform_request_action(action, request_options))]
+class CachedResolver(AbstractResolver):
+    """
+    aiohttp's resolver on the scan's DNS cache, the other libraries resolve the targets
+    from the same one. aiohttp's own cache is per session, so a name was looked up again by
+    the HTTP modules.
+    """
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        addresses = [
+            {
+                "hostname": host,
+                "host": address[0],
+                "port": port,
+                "family": info_family,
+                "proto": info_proto,
+                "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+            }
+            for info_family, _type, info_proto, _canonname, address in (
+                await get_dns_cache().resolve_async(host)
+            )
+            if family in (socket.AF_UNSPEC, info_family)
+        ]
+        if not addresses:
+            raise OSError(socket.EAI_NONAME, f"could not resolve {host}")
+        return addresses
+
+    async def close(self):
+        pass
+
+
+async def mark_connected(session, trace_config_ctx, params):
+    if trace_config_ctx.trace_request_ctx is not None:
+        trace_config_ctx.trace_request_ctx["connected"] = True
+
+
+def create_trace_config():
+    """
+    Tells a request that timed out while connecting from one that timed out waiting for the
+    answer, aiohttp raises the same asyncio.TimeoutError for both with a total timeout. The
+    request's trace_request_ctx dict gets connected=True once it has a connection, a new one
+    (after the TLS or proxy handshake) or a keep-alive one from the pool.
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(mark_connected)
+    trace_config.on_connection_reuseconn.append(mark_connected)
+    return trace_config
+
+
+async def create_client_session(proxy=None):
+    """
+    One session per process (per proxy with the scan's proxies), shared by every module. The
+    connector pools keep-alive connections per (host, port, ssl) so we only pay for the
+    TCP/TLS handshake once per host. Cookies are not shared between requests, same as when
+    every request had its own session.
+
+    Args:
+        proxy: the Proxy the session's connections go through
+    """
+    if proxy is None:
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=0,
+            keepalive_timeout=30,
+            resolver=CachedResolver(),
+            use_dns_cache=False,
+        )
+    else:
+        # The proxy resolves the names
+        connector = ProxyConnector.from_url(
+            proxy.url, rdns=True, limit=0, limit_per_host=0, keepalive_timeout=30
+        )
+    return aiohttp.ClientSession(
+        connector=connector,
+        cookie_jar=aiohttp.DummyCookieJar(),
+        trace_configs=[create_trace_config()],
+    )
+
+
+def is_proxy_failure(error):
+    """
+    The proxy couldn't be reached (not the target), aiohttp hands the connector's error over
+    in os_error
+    """
+    return isinstance(error, ProxyConnectionError) or isinstance(
+        getattr(error, "os_error", None), ProxyConnectionError
+    )
+
+
+async def send_request(request_options, method, request_state=None):
+    """
+    Args:
+        request_options: url, headers, body and the rest of the aiohttp arguments
+        method: the HTTP method
+        request_state: a dict that gets connected=True once the request has a connection
+    """
+    request_options = dict(request_options, trace_request_ctx=request_state)
+    proxy_pool = get_proxy_pool()
+    if proxy_pool is None:
+        session = await get_scheduler().resource("http_session", create_client_session)
+        return await perform_request_action(getattr(session, method, None), request_options)
+
+    proxy = proxy_pool.acquire()
+    failed = False
+    try:
+        session = await get_scheduler().resource(
+            f"http_session_{proxy.url}", functools.partial(create_client_session, proxy)
         )
-        return response[0]
+        return await perform_request_action(getattr(session, method, None), request_options)
+    except Exception as e:
+        failed = is_proxy_failure(e)
+        raise
+    finally:
+        proxy_pool.release(proxy, failed)
+
 
+def response_cache_key(scan_id, method, request_options):
+    """
+    Args:
+        scan_id: the scan the request belongs to
+        method: the HTTP method
+        request_options: url, headers, body and the rest of the aiohttp arguments
 
-def response_conditions_matched(sub_step, response):
+    Returns:
+        a hashable key, the same for two requests that get the same response
+    """
+    options = {
+        key: value for key, value in request_options.items() if key not in IGNORED_CACHE_OPTIONS
+    }
+    options["headers"] = {
+        key.lower(): value
+        for key, value in request_options.get("headers", {}).items()
+        if key.lower() not in IGNORED_CACHE_HEADERS
+    }
+    return scan_id, method, json.dumps(options, sort_keys=True, default=str)
+
+
+def copy_response(response):
+    # Every module gets its own copy, nothing can change the cached one
     if not response:
-        return {}
-    condition_type = sub_step["response"]["condition_type"]
-    conditions = sub_step["response"]["conditions"]
-    condition_results = {}
-    for condition in conditions:
-        if condition in ["reason", "status_code", "content", "url"]:
-            regex = re.findall(re.compile(conditions[condition]["regex"]), response[condition])
-            reverse = conditions[condition]["reverse"]
-            condition_results[condition] = reverse_and_regex_condition(regex, reverse)
-        if condition == "headers":
-            # convert headers to case insensitive dict
-            for key in response["headers"].copy():
-                response["headers"][key.lower()] = response["headers"][key]
-            condition_results["headers"] = {}
-            for header in conditions["headers"]:
-                reverse = conditions["headers"][header]["reverse"]
-                try:
-                    regex = re.findall(
-                        re.compile(conditions["headers"][header]["regex"]),
-                        response["headers"][header.lower()]
-                        if header.lower() in response["headers"]
-                        else False,
-                    )
-                    condition_results["headers"][header] = reverse_and_regex_condition(
-                        regex, reverse
-                    )
-                except TypeError:
-                    condition_results["headers"][header] = []
-        if condition == "responsetime":
-            if len(conditions[condition].split()) == 2 and conditions[condition].split()[0] in [
-                "==",
-                "!=",
-                ">=",
-                "<=",
-                ">",
-                "<",
-            ]:
-                exec(
-                    "condition_results['responsetime'] = response['responsetime'] if ("
-                    + "response['responsetime'] {0} float(conditions['responsetime'].split()[-1])".format(
-                        conditions["responsetime"].split()[0]
-                    )
-                    + ") else []"
-                )
-            else:
-                condition_results["responsetime"] = []
-    if condition_type.lower() == "or":
-        # if one of the values are matched, it will be a string or float object in the array
-        # we count False in the array and if it's not all []; then we know one of the conditions
-        # is matched.
-        if (
-            "headers" not in condition_results
-            and (
-                list(condition_results.values()).count([]) != len(list(condition_results.values()))
-            )
-        ) or (
-            "headers" in condition_results
-            and (
-                len(list(condition_results.values()))
-                + len(list(condition_results["headers"].values()))
-                - list(condition_results.values()).count([])
-                - list(condition_results["headers"].values()).count([])
-                - 1
-                != 0
-            )
-        ):
-            if sub_step["response"].get("log", False):
-                condition_results["log"] = sub_step["response"]["log"]
-                if "response_dependent" in condition_results["log"]:
-                    condition_results["log"] = replace_dependent_response(
-                        condition_results["log"], condition_results
-                    )
-            return condition_results
-        else:
-            return {}
-    if condition_type.lower() == "and":
-        if [] in condition_results.values() or (
-            "headers" in condition_results and [] in condition_results["headers"].values()
-        ):
-            return {}
-        else:
-            if sub_step["response"].get("log", False):
-                condition_results["log"] = sub_step["response"]["log"]
-                if "response_dependent" in condition_results["log"]:
-                    condition_results["log"] = replace_dependent_response(
-                        condition_results["log"], condition_results
-                    )
-            return condition_results
-    return {}
+        return []
+    return dict(response, headers=dict(response["headers"]))
+
+
+class ResponseCache:
+    """
+    The HTTP responses of the scans running in this process, shared by every module. A lot
+    of modules fetch the same URL of the same target (the index page for the headers, title,
+    CSP, HSTS, server version...), now the first one sends the request and the rest get its
+    response. A request that is still in flight is not sent again, the other modules wait
+    for it.
+
+    Lives on the scheduler loop, so there is no locking. It holds at most `size` responses,
+    the oldest finished ones are dropped first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.responses = OrderedDict()
+        self.requests = 0
+        self.hits = 0
+
+    async def fetch(self, key, send):
+        """
+        Args:
+            key: the response_cache_key of the request
+            send: coroutine function that sends the request
+
+        Returns:
+            a copy of the response ([] if the request failed)
+        """
+        self.requests += 1
+        future = self.responses.get(key)
+        if future is not None:
+            self.hits += 1
+            self.responses.move_to_end(key)
+            # shield, so a module that is cancelled doesn't cancel the request of another
+            return copy_response(await asyncio.shield(future))
+
+        future = asyncio.get_running_loop().create_future()
+        self.responses[key] = future
+        self.evict()
+        try:
+            # Failed requests are kept as well, the retries are already spent on them
+            response = await send()
+        except BaseException:
+            if self.responses.get(key) is future:
+                del self.responses[key]
+            future.cancel()
+            raise
+        future.set_result(response)
+        return copy_response(response)
+
+    def evict(self):
+        for key in list(self.responses):
+            if len(self.responses) <= self.size:
+                break
+            if self.responses[key].done():
+                del self.responses[key]
+
+    async def close(self):
+        if self.requests:
+            log.verbose_info(_("http_cache_stats").format(self.hits, self.requests))
+        for future in self.responses.values():
+            future.cancel()
+        self.responses.clear()
+
+
+async def create_response_cache():
+    return ResponseCache(Config.nettacker.http_response_cache_size)
 
 
 class HttpEngine(BaseEngine):
@@ -149,6 +306,42 @@ class HttpEngine(BaseEngine):
         request_number_counter,
         total_number_of_requests,
     ):
+        return get_scheduler().run(
+            self.run_async(
+                sub_step,
+                module_name,
+                target,
+                scan_id,
+                options,
+                process_number,
+                module_thread_number,
+                total_module_thread_number,
+                request_number_counter,
+                total_number_of_requests,
+            )
+        )
+
+    async def run_async(
+        self,
+        sub_step,
+        module_name,
+        target,
+        scan_id,
+        options,
+        process_number,
+        module_thread_number,
+        total_module_thread_number,
+        request_number_counter,
+        total_number_of_requests,
+    ):
+        """
+        Same as run, but as a coroutine for the process' scheduler loop. The requests in
+        flight per target are adjusted to how it copes (concurrency.py), up to
+        thread_per_host. Temp events are awaited on the in-process
+        store and the database write is pushed to the loop's executor.
+        """
+        # The headers are shared with the other sub-steps of the step, change a copy
+        sub_step["headers"] = dict(sub_step["headers"])
         if options["http_header"] is not None:
             for header in options["http_header"]:
                 key = get_http_header_key(header).strip()
@@ -157,60 +350,73 @@ class HttpEngine(BaseEngine):
                     sub_step["headers"][key] = value.strip()
                 else:
                     sub_step["headers"][key] = ""
-        backup_method = copy.deepcopy(sub_step["method"])
-        backup_response = copy.deepcopy(sub_step["response"])
-        backup_iterative_response_match = copy.deepcopy(
-            sub_step["response"]["conditions"].get("iterative_response_match", None)
-        )
+        backup_method = sub_step["method"]
         if options["user_agent"] == "random_user_agent":
             sub_step["headers"]["User-Agent"] = random.choice(options["user_agents"])
         del sub_step["method"]
-        if "dependent_on_temp_event" in backup_response:
-            temp_event = self.get_dependent_results_from_database(
+        if "dependent_on_temp_event" in sub_step["response"]:
+            temp_event = await self.get_dependent_results_async(
                 target,
                 module_name,
                 scan_id,
-                backup_response["dependent_on_temp_event"],
+                sub_step["response"]["dependent_on_temp_event"],
             )
             sub_step = self.replace_dependent_values(sub_step, temp_event)
-        backup_response = copy.deepcopy(sub_step["response"])
-        del sub_step["response"]
-        for _i in range(options["retries"]):
-            try:
-                response = asyncio.run(send_request(sub_step, backup_method))
-                response["content"] = response["content"].decode(errors="ignore")
-                break
-            except Exception:
-                response = []
-        sub_step["method"] = backup_method
-        sub_step["response"] = backup_response
-
-        if backup_iterative_response_match is not None:
-            backup_iterative_response_match = copy.deepcopy(
-                sub_step["response"]["conditions"].get("iterative_response_match")
-            )
-            del sub_step["response"]["conditions"]["iterative_response_match"]
+            # The conditions can have dependent values in them, these don't go in the cache
+            matcher = ConditionMatcher(sub_step["response"])
+        else:
+            matcher = get_condition_matcher(sub_step["response"])
+        backup_response = sub_step.pop("response")
 
-        sub_step["response"]["conditions_results"] = response_conditions_matched(
-            sub_step, response
-        )
+        async def send():
+            concurrency = await get_host_concurrency(target, options["thread_per_host"])
+            retries = options["retries"]
+            # A request the target turned down (429/503, a reset) gets sent again after the
+            # back off, on top of the retries, the target being busy doesn't mean there is
+            # nothing there. Timeouts only get the retries.
+            congestion_retries = Config.nettacker.congestion_retries
+            response = []
+            while retries > 0:
+                started = await concurrency.acquire()
+                congested, timed_out, retry_after = False, False, None
+                request_state = {"connected": False}
+                try:
+                    response = await send_request(sub_step, backup_method, request_state)
+                    response["content"] = response["content"].decode(errors="ignore")
+                    if response["status_code"] not in CONGESTION_STATUS_CODES:
+                        return response
+                    congested = True
+                    retry_after = parse_retry_after(response["headers"].get("Retry-After"))
+                except Exception as e:
+                    congested = is_congestion_error(e, request_state["connected"])
+                    timed_out = isinstance(e, asyncio.TimeoutError)
+                    response = []
+                finally:
+                    concurrency.release(started, congested, retry_after)
+                if congested and not timed_out and congestion_retries > 0:
+                    congestion_retries -= 1
+                else:
+                    retries -= 1
+            # The last 429/503 is still an answer, the conditions may look for it
+            return response
 
-        if backup_iterative_response_match is not None and (
-            sub_step["response"]["conditions_results"]
-            or sub_step["response"]["condition_type"] == "or"
+        if (
+            backup_method.lower() in CACHEABLE_METHODS
+            and Config.nettacker.http_response_cache_size
         ):
-            sub_step["response"]["conditions"][
-                "iterative_response_match"
-            ] = backup_iterative_response_match
-            for key in sub_step["response"]["conditions"]["iterative_response_match"]:
-                result = response_conditions_matched(
-                    sub_step["response"]["conditions"]["iterative_response_match"][key],
-                    response,
-                )
-                if result:
-                    sub_step["response"]["conditions_results"][key] = result
-
-        return self.process_conditions(
+            cache = await get_scheduler().resource("http_response_cache", create_response_cache)
+            response = await cache.fetch(
+                response_cache_key(scan_id, backup_method.lower(), sub_step), send
+            )
+        else:
+            response = await send()
+        sub_step["method"] = backup_method
+        # The response block is shared with the other sub-steps of the step
+        sub_step["response"] = dict(backup_response)
+        sub_step["response"]["conditions_results"] = matcher.match(response)
+
+        return await asyncio.to_thread(
+            self.process_conditions,
             sub_step,
             module_name,
             target,
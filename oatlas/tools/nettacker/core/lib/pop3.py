@@ -1,23 +1,40 @@
 import poplib
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.brute import BruteForceLibrary
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.proxy import create_connection
 
 
-class Pop3Library(BaseLibrary):
-    client = poplib.POP3
+class POP3(poplib.POP3):
+    def _create_socket(self, timeout):
+        # Through the scan's proxies
+        return create_connection(self.host, self.port, timeout)
 
-    def brute_force(self, host, port, username, password, timeout):
-        connection = self.client(host, port=port, timeout=timeout)
+
+class Pop3Library(BruteForceLibrary):
+    client = POP3
+
+    def connect(self, host, port, timeout):
+        return self.client(host, port=port, timeout=timeout)
+
+    def login(self, connection, username, password):
+        # The server is back in the AUTHORIZATION state after a -ERR on PASS
         connection.user(username)
         connection.pass_(password)
-        connection.quit()
-
-        return {
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-        }
+
+    def is_auth_failure(self, error):
+        # The -ERR lines of the server come as bytes, a closed connection is '-ERR EOF'
+        return (
+            isinstance(error, poplib.error_proto)
+            and bool(error.args)
+            and isinstance(error.args[0], bytes)
+        )
+
+    def close(self, connection):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
 
 
 class Pop3Engine(BaseEngine):
@@ -1,10 +1,19 @@
 import poplib
 
 from oatlas.tools.nettacker.core.lib.pop3 import Pop3Engine, Pop3Library
+from oatlas.tools.nettacker.core.proxy import create_connection
+
+
+class POP3_SSL(poplib.POP3_SSL):
+    def _create_socket(self, timeout):
+        # Through the scan's proxies, POP3_SSL calls POP3._create_socket by name
+        return self.context.wrap_socket(
+            create_connection(self.host, self.port, timeout), server_hostname=self.host
+        )
 
 
 class Pop3sLibrary(Pop3Library):
-    client = poplib.POP3_SSL
+    client = POP3_SSL
 
 
 class Pop3sEngine(Pop3Engine):
@@ -1,13 +1,16 @@
 from impacket.smbconnection import SMBConnection
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.brute import BruteForceLibrary
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.resolver import resolve_address
 
 
 def create_connection(host, port):
-    return SMBConnection(host, remoteHost=host, sess_port=port)
+    # impacket connects by itself, the address comes from the scan's DNS cache
+    return SMBConnection(host, remoteHost=resolve_address(host), sess_port=port)
 
 
-class SmbLibrary(BaseLibrary):
+class SmbLibrary(BruteForceLibrary):
     def brute_force(self, *args, **kwargs):
         host = kwargs["host"]
         port = kwargs["port"]
@@ -39,8 +42,14 @@ class SmbLibrary(BaseLibrary):
             nt = kwargs["nt"]
             response.update({"nt": nt})
 
-        connection = create_connection(host, port)
-        connection.login(username, password, domain, lm, nt)
+        def login():
+            connection = create_connection(host, port)
+            try:
+                connection.login(username, password, domain, lm, nt)
+            finally:
+                self.close(connection)
+
+        self.attempt(host, port, username, login)
 
         return response
 
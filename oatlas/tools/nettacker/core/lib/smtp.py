@@ -1,22 +1,28 @@
 import smtplib
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.brute import BruteForceLibrary
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.proxy import create_connection
 
 
-class SmtpLibrary(BaseLibrary):
-    client = smtplib.SMTP
+class SMTP(smtplib.SMTP):
+    def _get_socket(self, host, port, timeout):
+        # Through the scan's proxies
+        return create_connection(host, port, timeout)
 
-    def brute_force(self, host, port, username, password, timeout):
-        connection = self.client(host, port, timeout=timeout)
+
+class SmtpLibrary(BruteForceLibrary):
+    client = SMTP
+
+    def connect(self, host, port, timeout):
+        return self.client(host, port, timeout=timeout)
+
+    def login(self, connection, username, password):
+        # A failed AUTH can be followed by another one on the same connection
         connection.login(username, password)
-        connection.close()
-
-        return {
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-        }
+
+    def is_auth_failure(self, error):
+        return isinstance(error, smtplib.SMTPAuthenticationError)
 
 
 class SmtpEngine(BaseEngine):
@@ -1,22 +1,12 @@
-import smtplib
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.lib.smtp import SmtpLibrary
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
 
-
-class SmtpsLibrary(BaseLibrary):
-    client = smtplib.SMTP
-
-    def brute_force(self, host, port, username, password, timeout):
-        connection = self.client(host, port, timeout=timeout)
+class SmtpsLibrary(SmtpLibrary):
+    def connect(self, host, port, timeout):
+        connection = super().connect(host, port, timeout)
         connection.starttls()
-        connection.login(username, password)
-        connection.close()
-        return {
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-        }
+        return connection
 
 
 class SmtpsEngine(BaseEngine):
@@ -1,46 +1,151 @@
 #!/usr/bin/env python
 
-import copy
+import asyncio
 import logging
 import os
-import re
 import select
 import socket
 import ssl
 import struct
 import time
 
+from oatlas.tools.nettacker.core.conditions import get_regex_conditions
 from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
-from oatlas.tools.nettacker.core.utils.common import (
-    reverse_and_regex_condition,
-    replace_dependent_response,
-)
+from oatlas.tools.nettacker.core.proxy import create_connection, get_proxy_pool
+from oatlas.tools.nettacker.core.resolver import resolve_address, resolve_addresses_async
+from oatlas.tools.nettacker.core.utils.common import replace_dependent_response
 
 log = logging.getLogger(__name__)
 
+ASYNC_METHODS = {"tcp_connect_only", "tcp_connect_send_and_receive"}
+SEND_AND_RECEIVE_PAYLOAD = b"ABC\x00\r\n\r\n\r\n" * 10
+
+
+def create_ssl_context():
+    # Same as the old ssl.wrap_socket defaults, we only want to know if it speaks TLS
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+SSL_CONTEXT = create_ssl_context()
+
+
+def get_service_name(port):
+    try:
+        return socket.getservbyport(port)
+    except OSError:
+        return "unknown"
+
 
 def create_tcp_socket(host, port, timeout):
     try:
-        socket_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        socket_connection.settimeout(timeout)
-        socket_connection.connect((host, port))
+        socket_connection = create_connection(host, port, timeout)
         ssl_flag = False
     except ConnectionRefusedError:
         return None
 
     try:
-        socket_connection = ssl.wrap_socket(socket_connection)
+        socket_connection = SSL_CONTEXT.wrap_socket(socket_connection)
         ssl_flag = True
     except Exception:
-        socket_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        socket_connection.settimeout(timeout)
-        socket_connection.connect((host, port))
+        socket_connection = create_connection(host, port, timeout)
     # finally:
     #     socket_connection.shutdown()
 
     return socket_connection, ssl_flag
 
 
+async def connect_tcp_socket(host, port, timeout):
+    """
+    Connect to host:port from the scheduler loop, every address of the host is tried in
+    turn. Through a proxy of the scan the proxy resolves the name.
+
+    Returns:
+        the connected non-blocking socket
+
+    Raises:
+        ConnectionRefusedError: when the port is closed
+        OSError, asyncio.TimeoutError: when the host can't be reached
+    """
+    if get_proxy_pool() is not None:
+        # pysocks blocks, the proxy handshake is done on a thread
+        connection = await asyncio.to_thread(create_connection, host, port, timeout)
+        connection.setblocking(False)
+        return connection
+    loop = asyncio.get_running_loop()
+    error = None
+    for family, address in await resolve_addresses_async(host):
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        connection.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(connection, (address, port)), timeout)
+            return connection
+        except (OSError, asyncio.TimeoutError) as e:
+            connection.close()
+            error = e
+    raise error
+
+
+async def open_tcp_connection(connection, host, timeout, ssl_context=None):
+    # Streams over a connected socket, after the TLS handshake with ssl_context (the name
+    # is still sent for SNI)
+    return await asyncio.wait_for(
+        asyncio.open_connection(
+            sock=connection, ssl=ssl_context, server_hostname=host if ssl_context else None
+        ),
+        timeout,
+    )
+
+
+async def close_tcp_connection(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+async def create_tcp_connection(host, port, timeout, keep_open=True):
+    """
+    Non-blocking version of create_tcp_socket. TLS is tried on the first connection, a port
+    that doesn't speak it is connected to again in plain text only when the connection is
+    kept open.
+
+    Args:
+        host: target host
+        port: target port
+        timeout: timeout of each connect and handshake
+        keep_open: False if only the peer name and the ssl flag are needed
+
+    Returns:
+        (peer_name, ssl_flag, reader, writer), reader and writer are None when keep_open is
+        False. None if the connection was refused.
+    """
+    try:
+        connection = await connect_tcp_socket(host, port, timeout)
+    except ConnectionRefusedError:
+        return None
+    peer_name = connection.getpeername()[:2]
+
+    try:
+        reader, writer = await open_tcp_connection(connection, host, timeout, SSL_CONTEXT)
+        ssl_flag = True
+    except Exception:
+        connection.close()
+        if not keep_open:
+            return peer_name, False, None, None
+        reader, writer = await open_tcp_connection(
+            await connect_tcp_socket(host, port, timeout), host, timeout
+        )
+        ssl_flag = False
+    if not keep_open:
+        await close_tcp_connection(writer)
+        return peer_name, ssl_flag, None, None
+    return peer_name, ssl_flag, reader, writer
+
+
 class SocketLibrary(BaseLibrary):
     def tcp_connect_only(self, host, port, timeout):
         tcp_socket = create_tcp_socket(host, port, timeout)
@@ -51,14 +156,9 @@ class SocketLibrary(BaseLibrary):
         peer_name = socket_connection.getpeername()
         socket_connection.close()
 
-        try:
-            service = socket.getservbyport(port)
-        except OSError:
-            service = "unknown"
-
         return {
             "peer_name": peer_name,
-            "service": service,
+            "service": get_service_name(port),
             "ssl_flag": ssl_flag,
         }
 
@@ -70,7 +170,7 @@ class SocketLibrary(BaseLibrary):
         socket_connection, ssl_flag = tcp_socket
         peer_name = socket_connection.getpeername()
         try:
-            socket_connection.send(b"ABC\x00\r\n\r\n\r\n" * 10)
+            socket_connection.send(SEND_AND_RECEIVE_PAYLOAD)
             response = socket_connection.recv(1024 * 1024 * 10)
             socket_connection.close()
         # except ConnectionRefusedError:
@@ -82,15 +182,43 @@ class SocketLibrary(BaseLibrary):
             except Exception:
                 response = b""
 
+        return {
+            "peer_name": peer_name,
+            "response": response.decode(errors="ignore"),
+            "service": get_service_name(port),
+            "ssl_flag": ssl_flag,
+        }
+
+    async def tcp_connect_only_async(self, host, port, timeout):
+        tcp_connection = await create_tcp_connection(host, port, timeout, keep_open=False)
+        if tcp_connection is None:
+            return None
+
+        peer_name, ssl_flag, _reader, _writer = tcp_connection
+        return {
+            "peer_name": peer_name,
+            "service": get_service_name(port),
+            "ssl_flag": ssl_flag,
+        }
+
+    async def tcp_connect_send_and_receive_async(self, host, port, timeout):
+        tcp_connection = await create_tcp_connection(host, port, timeout)
+        if tcp_connection is None:
+            return None
+
+        peer_name, ssl_flag, reader, writer = tcp_connection
         try:
-            service = socket.getservbyport(port)
-        except OSError:
-            service = "unknown"
+            writer.write(SEND_AND_RECEIVE_PAYLOAD)
+            await asyncio.wait_for(writer.drain(), timeout)
+            response = await asyncio.wait_for(reader.read(1024 * 1024 * 10), timeout)
+        except Exception:
+            response = b""
+        await close_tcp_connection(writer)
 
         return {
             "peer_name": peer_name,
             "response": response.decode(errors="ignore"),
-            "service": service,
+            "service": get_service_name(port),
             "ssl_flag": ssl_flag,
         }
 
@@ -205,7 +333,7 @@ class SocketLibrary(BaseLibrary):
             1,
         )
         socket_connection.sendto(
-            header + data, (socket.gethostbyname(host), 1)
+            header + data, (resolve_address(host), 1)
         )  # Don't know about the 1
 
         while True:
@@ -240,6 +368,82 @@ class SocketLibrary(BaseLibrary):
 class SocketEngine(BaseEngine):
     library = SocketLibrary
 
+    async def run_async(
+        self,
+        sub_step,
+        module_name,
+        target,
+        scan_id,
+        options,
+        process_number,
+        module_thread_number,
+        total_module_thread_number,
+        request_number_counter,
+        total_number_of_requests,
+    ):
+        """
+        Same as run, on the process' scheduler loop. The TCP methods connect without blocking
+        so a port scan is thousands of coroutines instead of a thread per port, socket_icmp
+        still runs the blocking version on a thread.
+        """
+        if sub_step["method"] not in ASYNC_METHODS:
+            return await asyncio.to_thread(
+                self.run,
+                sub_step,
+                module_name,
+                target,
+                scan_id,
+                options,
+                process_number,
+                module_thread_number,
+                total_module_thread_number,
+                request_number_counter,
+                total_number_of_requests,
+            )
+
+        backup_method = sub_step.pop("method")
+        backup_response = dict(sub_step.pop("response"))
+
+        for attr_name in ("ports", "usernames", "passwords"):
+            if attr_name in sub_step:
+                value = sub_step.pop(attr_name)
+                sub_step[attr_name.rstrip("s")] = int(value) if attr_name == "ports" else value
+
+        if "dependent_on_temp_event" in backup_response:
+            temp_event = await self.get_dependent_results_async(
+                target, module_name, scan_id, backup_response["dependent_on_temp_event"]
+            )
+            sub_step = self.replace_dependent_values(sub_step, temp_event)
+
+        action = getattr(self.library(), f"{backup_method}_async")
+        for _i in range(options["retries"]):
+            try:
+                response = await action(**sub_step)
+                break
+            except Exception:
+                response = []
+
+        sub_step["method"] = backup_method
+        sub_step["response"] = backup_response
+        sub_step["response"]["conditions_results"] = response
+
+        self.apply_extra_data(sub_step, response)
+
+        return await asyncio.to_thread(
+            self.process_conditions,
+            sub_step,
+            module_name,
+            target,
+            scan_id,
+            options,
+            response,
+            process_number,
+            module_thread_number,
+            total_module_thread_number,
+            request_number_counter,
+            total_number_of_requests,
+        )
+
     def response_conditions_matched(self, sub_step, response):
         conditions = sub_step["response"]["conditions"].get(
             "service", sub_step["response"]["conditions"]
@@ -250,15 +454,13 @@ class SocketEngine(BaseEngine):
             return response
         if sub_step["method"] == "tcp_connect_send_and_receive":
             if response:
-                for condition in conditions:
-                    regex = re.findall(
-                        re.compile(conditions[condition]["regex"]),
+                expected_conditions = len(conditions)
+                for condition, compiled in get_regex_conditions(conditions).items():
+                    condition_results[condition] = compiled.match(
                         response["response"]
                         if condition != "open_port"
-                        else str(response["peer_name"][1]),
+                        else str(response["peer_name"][1])
                     )
-                    reverse = conditions[condition]["reverse"]
-                    condition_results[condition] = reverse_and_regex_condition(regex, reverse)
 
                     if condition_results[condition]:
                         default_service = response["service"]
@@ -272,15 +474,18 @@ class SocketEngine(BaseEngine):
                             "ssl_flag": ssl_flag,
                         }
                         condition_results["service"] = [str(log_response)]
-                for condition in copy.deepcopy(condition_results):
+                for condition in list(condition_results):
                     if not condition_results[condition]:
                         del condition_results[condition]
 
                 if "open_port" in condition_results and len(condition_results) > 1:
                     del condition_results["open_port"]
-                    del conditions["open_port"]
+                    # The conditions are shared with the other sub-steps, don't remove it there
+                    expected_conditions -= 1
                 if condition_type.lower() == "and":
-                    return condition_results if len(condition_results) == len(conditions) else []
+                    return (
+                        condition_results if len(condition_results) == expected_conditions else []
+                    )
                 if condition_type.lower() == "or":
                     if sub_step["response"].get("log", False):
                         condition_results["log"] = sub_step["response"]["log"]
@@ -1,40 +1,45 @@
 import logging
 
-from paramiko import SSHClient, AutoAddPolicy
-from paramiko.auth_strategy import NoneAuth, Password
+import paramiko
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.brute import BruteForceLibrary
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.proxy import create_connection
 
 logging.getLogger("paramiko.transport").disabled = True
 
 
-class SshLibrary(BaseLibrary):
-    client = SSHClient
-
-    def brute_force(self, *args, **kwargs):
-        host = kwargs["host"]
-        port = kwargs["port"]
-        username = kwargs["username"]
-        password = kwargs["password"]
-
-        connection = self.client()
-        connection.set_missing_host_key_policy(AutoAddPolicy())
-        connection.connect(
-            **{
-                "hostname": host,
-                "port": port,
-                "auth_strategy": Password(username=username, password_getter=lambda: password)
-                if password
-                else NoneAuth(username=username),
-            }
-        )
-
-        return {
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-        }
+class SshLibrary(BruteForceLibrary):
+    client = paramiko.Transport
+
+    def session_key(self, host, port, username):
+        # OpenSSH drops the connection when the username changes between attempts
+        return host, port, username
+
+    def connect(self, host, port, timeout):
+        transport = self.client(create_connection(host, port, timeout))
+        transport.banner_timeout = timeout
+        transport.auth_timeout = timeout
+        try:
+            transport.start_client(timeout=timeout)
+        except Exception:
+            transport.close()
+            raise
+        return transport
+
+    def login(self, transport, username, password):
+        # The key exchange is done once, the server allows a few attempts (MaxAuthTries) on
+        # the same transport
+        if password:
+            transport.auth_password(username, password)
+        else:
+            transport.auth_none(username)
+        if not transport.is_authenticated():
+            # partial success, another factor is needed
+            raise paramiko.AuthenticationException("authentication incomplete")
+
+    def is_auth_failure(self, error):
+        return isinstance(error, paramiko.AuthenticationException)
 
 
 class SshEngine(BaseEngine):
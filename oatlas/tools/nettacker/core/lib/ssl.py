@@ -1,11 +1,18 @@
+import concurrent.futures
 import logging
 import socket
 import ssl
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 
 from OpenSSL import crypto
 
+from oatlas.config import Config
 from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.proxy import create_connection
+from oatlas.tools.nettacker.core.workers import get_worker_pool
 
 log = logging.getLogger(__name__)
 
@@ -18,115 +25,247 @@ def is_weak_hash_algo(algo):
     return False
 
 
-def create_socket_connection(context, host, port, timeout):
-    socket_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    socket_connection.settimeout(timeout)
-    socket_connection.connect((host, port))
-    socket_connection = context.wrap_socket(socket_connection, server_hostname=host)
-    return socket_connection
+# Probes of a host:port, they run at the same time
+SSL_VERSIONS = (
+    ssl.PROTOCOL_TLS_CLIENT,  # TLS 1.3
+    ssl.PROTOCOL_TLSv1_2,
+    ssl.PROTOCOL_TLSv1_1,
+    ssl.PROTOCOL_TLSv1,
+)
+CIPHER_SUITES = (
+    "HIGH",  # OpenSSL cipher strings
+    "MEDIUM",
+    "LOW",
+    "EXP",
+    "eNULL",
+    "aNULL",
+    "RC4",
+    "DES",
+    "MD5",
+    "SHA1",
+    "DH",
+    "ADH",
+    "DHE",
+    "ECDH",
+    "ECDHE",
+    "TLSv1",
+    "TLSv1.1",
+    "TLSv1.2",
+    "TLSv1.3",
+)
+WEAK_CIPHERS = {"LOW", "EXP", "eNULL", "aNULL", "RC4", "DES", "MD5", "DH", "ADH"}
+
+
+def create_ssl_context(ssl_version=ssl.PROTOCOL_TLS_CLIENT, cipher=None):
+    # We only want to know what the server speaks, nothing gets verified
+    context = ssl.SSLContext(ssl_version)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    if cipher:
+        context.set_ciphers(cipher)
+    return context
+
+
+SSL_CONTEXT = create_ssl_context()
+
+
+def remaining_time(deadline):
+    return max(deadline - time.monotonic(), 0.001)
+
+
+def create_socket_connection(context, host, port, deadline):
+    # connect and handshake both have to be done by the deadline
+    socket_connection = create_connection(host, port, remaining_time(deadline))
+    try:
+        socket_connection.settimeout(remaining_time(deadline))
+        return context.wrap_socket(socket_connection, server_hostname=host)
+    except BaseException:
+        socket_connection.close()
+        raise
 
 
-def is_weak_ssl_version(host, port, timeout):
-    def test_ssl_version(host, port, timeout, ssl_version=None):
-        try:
-            context = ssl.SSLContext(ssl_version)
-            socket_connection = create_socket_connection(context, host, port, timeout)
+def test_ssl_version(host, port, ssl_version, deadline):
+    try:
+        with create_socket_connection(
+            create_ssl_context(ssl_version), host, port, deadline
+        ) as socket_connection:
             return socket_connection.version()
+    except ssl.SSLError:
+        return False
+    except (socket.timeout, ConnectionRefusedError, ConnectionResetError):
+        return None
 
-        except ssl.SSLError:
-            return False
 
-        except (socket.timeout, ConnectionRefusedError, ConnectionResetError):
-            return None
+def test_single_cipher(host, port, cipher, deadline):
+    try:
+        context = create_ssl_context(cipher=cipher)
+    except ssl.SSLError:
+        # this OpenSSL doesn't know the cipher string at all
+        return False
+    try:
+        with create_socket_connection(context, host, port, deadline):
+            return True
+    except ssl.SSLError:
+        return False
+    except (socket.timeout, ConnectionRefusedError, ConnectionResetError):
+        return None
 
-    ssl_versions = (
-        ssl.PROTOCOL_TLS_CLIENT,  # TLS 1.3
-        ssl.PROTOCOL_TLSv1_2,
-        ssl.PROTOCOL_TLSv1_1,
-        ssl.PROTOCOL_TLSv1,
-    )
-    supported_versions = []
-    lowest_version = ""
-    for ssl_version in ssl_versions:
-        version = test_ssl_version(host, port, timeout, ssl_version=ssl_version)
-        if version:
-            lowest_version = version
-            supported_versions.append(version)
 
-    return supported_versions, lowest_version not in {"TLSv1.2", "TLSv1.3"}
+def run_probe(function, args, timeout):
+    # The deadline starts when the probe gets a worker, not when it was queued behind the
+    # probes of the other hosts
+    return function(*args, time.monotonic() + timeout)
 
 
-def is_weak_cipher_suite(host, port, timeout):
-    def test_single_cipher(host, port, cipher, timeout):
+def run_probes(probes, timeout):
+    """
+    Run the probes at the same time on the process' TLS probe pool, so the whole batch
+    takes about as long as the slowest handshake instead of the sum of all of them. Each
+    probe has `timeout` for its connect and handshake from when it starts running, a busy
+    pool delays the probes instead of timing them out (which reads as not supported).
+
+    Args:
+        probes: (function, *args) tuples, the deadline is passed as the last argument
+        timeout: seconds for each probe
+
+    Returns:
+        the results in the order of the probes, None for the ones that failed
+    """
+    executor = get_worker_pool().executor("tls_probes", Config.nettacker.tls_probe_workers)
+    futures = []
+    for function, *args in probes:
         try:
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-            context.set_ciphers(cipher)
-            create_socket_connection(context, host, port, timeout)
-            return True
+            futures.append(executor.submit(run_probe, function, args, timeout))
+        except RuntimeError:
+            # the pool was stopped (Ctrl-C)
+            futures.append(None)
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result() if future else None)
+        except Exception:
+            results.append(None)
+    return results
 
-        except ssl.SSLError:
-            return False
 
-        except (socket.timeout, ConnectionRefusedError, ConnectionResetError):
-            return None
+def is_weak_ssl_version(host, port, timeout):
+    versions = run_probes(
+        [(test_ssl_version, host, port, ssl_version) for ssl_version in SSL_VERSIONS], timeout
+    )
+    supported_versions = [version for version in versions if version]
+    lowest_version = supported_versions[-1] if supported_versions else ""
+    return supported_versions, lowest_version not in {"TLSv1.2", "TLSv1.3"}
 
-    cipher_suites = [
-        "HIGH",  # OpenSSL cipher strings
-        "MEDIUM",
-        "LOW",
-        "EXP",
-        "eNULL",
-        "aNULL",
-        "RC4",
-        "DES",
-        "MD5",
-        "SHA1",
-        "DH",
-        "ADH",
-        "DHE",
-        "ECDH",
-        "ECDHE",
-        "TLSv1",
-        "TLSv1.1",
-        "TLSv1.2",
-        "TLSv1.3",
-    ]
-
-    supported_ciphers = []
-    for cipher in cipher_suites:
-        if test_single_cipher(host, port, cipher, timeout):
-            supported_ciphers.append(cipher)
-
-    weak_ciphers = {"LOW", "EXP", "eNULL", "aNULL", "RC4", "DES", "MD5", "DH", "ADH"}
-    for cipher in supported_ciphers:
-        if cipher in weak_ciphers:
-            return supported_ciphers, True
-
-    return supported_ciphers, False
+
+def is_weak_cipher_suite(host, port, timeout):
+    results = run_probes(
+        [(test_single_cipher, host, port, cipher) for cipher in CIPHER_SUITES], timeout
+    )
+    supported_ciphers = [cipher for cipher, result in zip(CIPHER_SUITES, results) if result]
+    return supported_ciphers, any(cipher in WEAK_CIPHERS for cipher in supported_ciphers)
 
 
 def create_tcp_socket(host, port, timeout):
     try:
-        socket_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        socket_connection.settimeout(timeout)
-        socket_connection.connect((host, port))
+        socket_connection = create_connection(host, port, timeout)
         ssl_flag = False
     except ConnectionRefusedError:
         return None
 
     try:
-        socket_connection = ssl.wrap_socket(socket_connection)
+        socket_connection = SSL_CONTEXT.wrap_socket(socket_connection, server_hostname=host)
         ssl_flag = True
     except Exception:
-        socket_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        socket_connection.settimeout(timeout)
-        socket_connection.connect((host, port))
+        socket_connection.close()
+        socket_connection = create_connection(host, port, timeout)
 
     return socket_connection, ssl_flag
 
 
+class SharedResults:
+    """
+    Results computed once per key and shared by the modules of the process (a scan process
+    only lives for one scan). A caller that asks while the result is being computed waits
+    for it instead of doing the same work again. At most `size` results are kept.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, function, *args):
+        with self.lock:
+            future = self.results.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.results[key] = future
+                for old_key in list(self.results):
+                    if len(self.results) <= self.size:
+                        break
+                    if self.results[old_key].done():
+                        del self.results[old_key]
+            else:
+                self.results.move_to_end(key)
+        if owner:
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                # not kept, the next caller tries again
+                with self.lock:
+                    if self.results.get(key) is future:
+                        del self.results[key]
+                future.set_exception(e)
+        return future.result()
+
+
+tls_handshakes = SharedResults(Config.nettacker.tls_cache_size)
+tls_probes = SharedResults(Config.nettacker.tls_cache_size)
+
+
+def fetch_tls_info(host, port, timeout):
+    """
+    One connection to host:port, the certificate comes from the same handshake
+
+    Returns:
+        a dict with ssl_flag, peer_name and cert_info (None without TLS or certificate), None
+        if the port is closed
+    """
+    tcp_socket = create_tcp_socket(host, port, timeout)
+    if tcp_socket is None:
+        return None
+    socket_connection, ssl_flag = tcp_socket
+    with socket_connection:
+        peer_name = socket_connection.getpeername()
+        cert = socket_connection.getpeercert(binary_form=True) if ssl_flag else None
+    return {
+        "ssl_flag": ssl_flag,
+        "peer_name": peer_name,
+        "cert_info": get_cert_info(ssl.DER_cert_to_PEM_cert(cert)) if cert else None,
+    }
+
+
+def get_tls_info(host, port, timeout):
+    """
+    fetch_tls_info, done once per host:port and shared by all the ssl modules
+    """
+    return tls_handshakes.get((host, port), fetch_tls_info, host, port, timeout)
+
+
+def probe_versions_and_ciphers(host, port, timeout):
+    ssl_versions, weak_version = is_weak_ssl_version(host, port, timeout)
+    cipher_suite, weak_cipher_suite = is_weak_cipher_suite(host, port, timeout)
+    return ssl_versions, weak_version, cipher_suite, weak_cipher_suite
+
+
+def get_versions_and_ciphers(host, port, timeout):
+    """
+    The version and cipher probes of host:port, done once and shared by all the ssl modules
+    """
+    return tls_probes.get((host, port), probe_versions_and_ciphers, host, port, timeout)
+
+
 def get_cert_info(cert):
     x509 = crypto.load_certificate(crypto.FILETYPE_PEM, cert)
     weak_signing_algo = is_weak_hash_algo(str(x509.get_signature_algorithm()))
@@ -154,44 +293,33 @@ def get_cert_info(cert):
 
 class SslLibrary(BaseLibrary):
     def ssl_certificate_scan(self, host, port, timeout):
-        tcp_socket = create_tcp_socket(host, port, timeout)
-        if tcp_socket is None:
+        tls_info = get_tls_info(host, port, timeout)
+        if tls_info is None:
             return None
 
-        socket_connection, ssl_flag = tcp_socket
-        peer_name = socket_connection.getpeername()
         scan_info = {
-            "ssl_flag": ssl_flag,
-            "peer_name": peer_name,
+            "ssl_flag": tls_info["ssl_flag"],
+            "peer_name": tls_info["peer_name"],
             "service": socket.getservbyport(int(port)),
         }
 
-        if ssl_flag:
-            cert = ssl.get_server_certificate((host, port))
-            cert_info = get_cert_info(cert)
-            scan_info = cert_info | scan_info
-            return scan_info
+        if tls_info["ssl_flag"]:
+            if tls_info["cert_info"] is None:
+                return None
+            return tls_info["cert_info"] | scan_info
 
         return scan_info
 
     def ssl_version_and_cipher_scan(self, host, port, timeout):
-        tcp_socket = create_tcp_socket(host, port, timeout)
-        if tcp_socket is None:
+        tls_info = get_tls_info(host, port, timeout)
+        if tls_info is None:
             return None
 
-        socket_connection, ssl_flag = tcp_socket
-        peer_name = socket_connection.getpeername()
-
-        if ssl_flag:
-            try:
-                cert = ssl.get_server_certificate((host, port))
-            except ssl.SSLError:
-                cert = None
-            except socket.gaierror:
-                cert = None
-            cert_info = get_cert_info(cert) if cert else None
-            ssl_ver, weak_version = is_weak_ssl_version(host, port, timeout)
-            cipher_suite, weak_cipher_suite = is_weak_cipher_suite(host, port, timeout)
+        if tls_info["ssl_flag"]:
+            cert_info = tls_info["cert_info"]
+            ssl_ver, weak_version, cipher_suite, weak_cipher_suite = get_versions_and_ciphers(
+                host, port, timeout
+            )
 
             return {
                 "ssl_version": ssl_ver,
@@ -201,15 +329,15 @@ class SslLibrary(BaseLibrary):
                 "issuer": cert_info["issuer"] if cert_info else "NA",
                 "subject": cert_info["subject"] if cert_info else "NA",
                 "expiration_date": cert_info["expiration_date"] if cert_info else "NA",
-                "ssl_flag": ssl_flag,
-                "peer_name": peer_name,
+                "ssl_flag": tls_info["ssl_flag"],
+                "peer_name": tls_info["peer_name"],
                 "service": socket.getservbyport(int(port)),
             }
 
         return {
-            "ssl_flag": ssl_flag,
+            "ssl_flag": tls_info["ssl_flag"],
             "service": socket.getservbyport(int(port)),
-            "peer_name": peer_name,
+            "peer_name": tls_info["peer_name"],
         }
 
 
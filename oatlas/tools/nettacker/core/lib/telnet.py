@@ -1,25 +1,26 @@
 import telnetlib
 
-from oatlas.tools.nettacker.core.lib.base import BaseEngine, BaseLibrary
+from oatlas.tools.nettacker.core.brute import BruteForceLibrary
+from oatlas.tools.nettacker.core.lib.base import BaseEngine
+from oatlas.tools.nettacker.core.proxy import create_connection
 
 
-class TelnetLibrary(BaseLibrary):
+class TelnetLibrary(BruteForceLibrary):
     client = telnetlib.Telnet
+    reuse_sessions = False
 
-    def brute_force(self, host, port, username, password, timeout):
-        connection = self.client(host, port, timeout)
+    def connect(self, host, port, timeout):
+        # What Telnet.open does, on a connection through the scan's proxies
+        connection = self.client()
+        connection.host, connection.port, connection.timeout = host, port, timeout
+        connection.sock = create_connection(host, port, timeout)
+        return connection
+
+    def login(self, connection, username, password):
         connection.read_until(b"login: ")
         connection.write(username.encode("utf-8") + b"\n")
         connection.read_until(b"Password: ")
         connection.write(password.encode("utf-8") + b"\n")
-        connection.close()
-
-        return {
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-        }
 
 
 class TelnetEngine(BaseEngine):
@@ -1,23 +1,49 @@
 import copy
 import importlib
-import json
 import os
 import time
-from threading import Thread
+from functools import lru_cache
 
 from oatlas.config import Config
 from oatlas.logger import get_logger
-from oatlas.tools.nettacker.core.database.database import find_events
+from oatlas.tools.nettacker.core.database.database import find_services
+from oatlas.tools.nettacker.core.fingerprints import requirements_met
 from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.scheduler import get_scheduler
 from oatlas.tools.nettacker.core.template import TemplateLoader
-from oatlas.tools.nettacker.core.utils.common import (
-    expand_module_steps,
-    wait_for_threads_to_finish,
-)
+from oatlas.tools.nettacker.core.utils.common import expand_module_steps
+from oatlas.tools.nettacker.core.workers import get_worker_pool
 
 log = get_logger()
 
 
+@lru_cache(maxsize=None)
+def get_service_discovery_signatures():
+    """
+    The services port_scan can detect. Same for every module thread so it's read once.
+    """
+    contents = TemplateLoader("port_scan", {"target": ""}).load()
+    return tuple(
+        set(
+            contents["payloads"][0]["steps"][0]["response"]["conditions"]
+            .get("service", set(contents["payloads"][0]["steps"][0]["response"]["conditions"]))
+            .keys()
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def get_libraries():
+    """
+    Names of the protocol libraries in core/lib
+    """
+    return tuple(
+        module_protocol.split(".py")[0]
+        for module_protocol in os.listdir(Config.path.nettacker_module_protocols_dir)
+        if module_protocol.endswith(".py") and module_protocol not in {"__init__.py", "base.py"}
+    )
+
+
 class Module:
     def __init__(
         self,
@@ -55,30 +81,28 @@ class Module:
             "ssl_expiring_certificate_scan",
         ]
 
-        contents = TemplateLoader("port_scan", {"target": ""}).load()
-        self.service_discovery_signatures = list(
-            set(
-                contents["payloads"][0]["steps"][0]["response"]["conditions"]
-                .get("service", set(contents["payloads"][0]["steps"][0]["response"]["conditions"]))
-                .keys()
-            )
-        )
-
-        self.libraries = [
-            module_protocol.split(".py")[0]
-            for module_protocol in os.listdir(Config.path.nettacker_module_protocols_dir)
-            if module_protocol.endswith(".py")
-            and module_protocol not in {"__init__.py", "base.py"}
-        ]
+        self.service_discovery_signatures = list(get_service_discovery_signatures())
+        self.libraries = list(get_libraries())
+        # ModuleCheckpoint of the work item, set by the scan (the dry-run planner has none)
+        self.checkpoint = None
 
     def load(self):
         self.module_content = TemplateLoader(self.module_name, self.module_inputs).load()
+        requires = self.module_content["info"].get("requires")
+        if (
+            requires
+            and Config.nettacker.prune_modules_by_fingerprint
+            and not requirements_met(requires, self.target, self.scan_id)
+        ):
+            # e.g. the WordPress modules on a host that runs something else
+            log.verbose_info(
+                _("module_requirements_not_met").format(self.module_name, self.target)
+            )
+            self.module_content["payloads"] = []
+            return
         if not self.skip_service_discovery and self.module_name not in self.ignored_core_modules:
             services = {}
-            for service in find_events(self.target, "port_scan", self.scan_id):
-                service_event = json.loads(service.json_event)
-                port = service_event["port"]
-                protocols = service_event["response"]["conditions_results"].keys()
+            for port, protocols in find_services(self.target, self.scan_id):
                 for protocol in protocols:
                     if protocol and protocol in self.libraries:
                         if protocol in services:
@@ -109,36 +133,39 @@ class Module:
     def generate_loops(self):
         if self.module_inputs["excluded_ports"]:
             excluded_port_set = set(self.module_inputs["excluded_ports"])
-            if self.module_content and "ports" in self.module_content["payloads"][0]["steps"][0]:
+            if (
+                self.module_content["payloads"]
+                and "ports" in self.module_content["payloads"][0]["steps"][0]
+            ):
                 all_ports = self.module_content["payloads"][0]["steps"][0]["ports"]
                 all_ports[:] = [port for port in all_ports if port not in excluded_port_set]
 
         self.module_content["payloads"] = expand_module_steps(self.module_content["payloads"])
 
     def sort_loops(self):
-        steps = []
-        for index in range(len(self.module_content["payloads"])):
-            for step in copy.deepcopy(self.module_content["payloads"][index]["steps"]):
-                if "dependent_on_temp_event" not in step[0]["response"]:
-                    steps.append(step)
-
-            for step in copy.deepcopy(self.module_content["payloads"][index]["steps"]):
-                if (
-                    "dependent_on_temp_event" in step[0]["response"]
-                    and "save_to_temp_events_only" in step[0]["response"]
-                ):
-                    steps.append(step)
-
-            for step in copy.deepcopy(self.module_content["payloads"][index]["steps"]):
-                if (
-                    "dependent_on_temp_event" in step[0]["response"]
-                    and "save_to_temp_events_only" not in step[0]["response"]
-                ):
-                    steps.append(step)
-            self.module_content["payloads"][index]["steps"] = steps
+        """
+        Independent steps first, then the ones that save temp events and then the ones that
+        depend on those. Only looks at the step templates, nothing gets expanded here.
+        """
+        for payload in self.module_content["payloads"]:
+            independent_steps, temp_event_steps, dependent_steps = [], [], []
+            for step in payload["steps"]:
+                response = step.template["response"]
+                if "dependent_on_temp_event" not in response:
+                    independent_steps.append(step)
+                elif "save_to_temp_events_only" in response:
+                    temp_event_steps.append(step)
+                else:
+                    dependent_steps.append(step)
+            payload["steps"] = independent_steps + temp_event_steps + dependent_steps
 
     def start(self):
-        active_threads = []
+        worker_pool = get_worker_pool()
+        # At most thread_per_host requests of this module in flight, sync engines run on the
+        # process' request pool and async ones on the scheduler loop
+        requests = worker_pool.task_group(self.module_inputs["thread_per_host"])
+        scheduler = None
+        executor = None
 
         # counting total number of requests
         total_number_of_requests = 0
@@ -149,31 +176,35 @@ class Module:
             for step in payload["steps"]:
                 total_number_of_requests += len(step)
 
+        # Sub-steps a resumed scan already did
+        resumed_requests = self.checkpoint.completed_requests if self.checkpoint else 0
         request_number_counter = 0
         for payload in self.module_content["payloads"]:
             library = payload["library"]
             engine = getattr(
-                importlib.import_module(f"atlas.tools.nettacker.core.lib.{library.lower()}"),
+                importlib.import_module(f"oatlas.tools.nettacker.core.lib.{library.lower()}"),
                 f"{library.capitalize()}Engine",
             )()
             for step in payload["steps"]:
                 for sub_step in step:
-                    thread = Thread(
-                        target=engine.run,
-                        args=(
-                            sub_step,
-                            self.module_name,
-                            self.target,
-                            self.scan_id,
-                            self.module_inputs,
-                            self.process_number,
-                            self.module_thread_number,
-                            self.total_module_thread_number,
-                            request_number_counter,
-                            total_number_of_requests,
-                        ),
+                    if worker_pool.stopping.is_set():
+                        requests.cancel()
+                        return None
+                    if request_number_counter < resumed_requests:
+                        request_number_counter += 1
+                        continue
+                    args = (
+                        sub_step,
+                        self.module_name,
+                        self.target,
+                        self.scan_id,
+                        self.module_inputs,
+                        self.process_number,
+                        self.module_thread_number,
+                        self.total_module_thread_number,
+                        request_number_counter,
+                        total_number_of_requests,
                     )
-                    thread.name = f"{self.target} -> {self.module_name} -> {sub_step}"
                     request_number_counter += 1
                     log.verbose_event_info(
                         _("sending_module_request").format(
@@ -186,13 +217,23 @@ class Module:
                             total_number_of_requests,
                         )
                     )
-                    thread.start()
+                    if hasattr(engine, "run_async"):
+                        scheduler = scheduler or get_scheduler()
+                        future = requests.submit(
+                            lambda args=args: scheduler.submit(engine.run_async(*args))
+                        )
+                    else:
+                        executor = executor or worker_pool.executor(
+                            "requests",
+                            self.module_inputs["thread_per_host"]
+                            * self.module_inputs["parallel_module_scan"],
+                        )
+                        future = requests.submit(executor.submit, engine.run, *args)
+                    if future is not None and self.checkpoint:
+                        self.checkpoint.track(future, request_number_counter - 1)
                     time.sleep(self.module_inputs["time_sleep_between_requests"])
-                    active_threads.append(thread)
-                    wait_for_threads_to_finish(
-                        active_threads,
-                        maximum=self.module_inputs["thread_per_host"],
-                        terminable=True,
-                    )
 
-        wait_for_threads_to_finish(active_threads, maximum=None, terminable=True)
+        finished = requests.wait()
+        if finished and self.checkpoint:
+            self.checkpoint.finish()
+        return finished
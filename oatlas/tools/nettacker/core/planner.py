@@ -0,0 +1,121 @@
+import copy
+import math
+import os
+
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.module import Module
+from oatlas.tools.nettacker.core.template import TemplateLoader
+
+log = get_logger()
+
+# The http engine keeps its connections alive, the other engines open one per sub-step
+CONNECTION_POOLING_LIBRARIES = ("http",)
+
+
+def plan_module(options, module_name, target):
+    """
+    Count what a module sends to one target. The steps are expanded the same way as for the
+    scan, but only their lengths are used, so no sub-step (or wordlist line) is generated.
+
+    Args:
+        options: the scan options
+        module_name: name of the module
+        target: a target of the scan, the counts don't depend on which one
+
+    Returns:
+        a dict with the sub-steps, requests, connections and worst case duration (seconds)
+    """
+    module = Module(module_name, copy.copy(options), target, None, 0, 0, 0)
+    module.module_content = TemplateLoader(module_name, module.module_inputs).load()
+    module.generate_loops()
+
+    sub_steps = 0
+    connections = 0
+    for payload in module.module_content["payloads"]:
+        payload_sub_steps = sum(len(step) for step in payload["steps"])
+        sub_steps += payload_sub_steps
+        if payload["library"] in CONNECTION_POOLING_LIBRARIES:
+            connections += min(payload_sub_steps, options.thread_per_host)
+        else:
+            connections += payload_sub_steps
+    return {
+        "sub_steps": sub_steps,
+        # Every retry is another request when the target doesn't answer
+        "requests": sub_steps * options.retries,
+        "connections": connections,
+        # thread_per_host requests at a time that all run into the timeout, plus the sleep
+        # between requests that is done one after the other
+        "duration": math.ceil(sub_steps / max(options.thread_per_host, 1))
+        * options.timeout
+        * options.retries
+        + sub_steps * options.time_sleep_between_requests,
+    }
+
+
+def plan_scan(options):
+    """
+    The cost of a scan, without sending anything. Targets are counted, not listed, so
+    planning an IP range costs as much as planning a single IP.
+
+    Args:
+        options: the scan options, with the targets already parsed into a TargetSet
+
+    Returns:
+        a dict with the per module counts (for one target) and the totals of the scan
+    """
+    number_of_targets = options.targets.size()
+    target = next(iter(options.targets))
+    modules = {}
+    for module_name in options.selected_modules:
+        try:
+            modules[module_name] = plan_module(options, module_name, target)
+        except Exception as e:
+            log.warn(_("plan_module_failed").format(module_name, e))
+
+    total_number_of_modules = number_of_targets * len(modules)
+    number_of_processes = max(
+        min(options.set_hardware_usage, os.cpu_count() or 1, total_number_of_modules), 1
+    )
+    work = sum(module["duration"] for module in modules.values()) * number_of_targets
+    per_target = {
+        key: sum(module[key] for module in modules.values())
+        for key in ("sub_steps", "requests", "connections", "duration")
+    }
+    return {
+        "targets": number_of_targets,
+        "modules": modules,
+        "per_target": per_target,
+        "total": {
+            key: value * number_of_targets
+            for key, value in per_target.items()
+            if key != "duration"
+        },
+        "processes": number_of_processes,
+        # Worst case, every request runs into the timeout
+        "estimated_duration": work / (number_of_processes * max(options.parallel_module_scan, 1)),
+    }
+
+
+def log_scan_plan(plan):
+    for module_name, module in plan["modules"].items():
+        log.info(
+            _("plan_module").format(
+                module_name,
+                module["sub_steps"],
+                module["requests"],
+                module["connections"],
+                round(module["duration"], 2),
+            )
+        )
+    log.info(
+        _("plan_total").format(
+            plan["targets"],
+            plan["per_target"]["requests"],
+            plan["total"]["sub_steps"],
+            plan["total"]["requests"],
+            plan["total"]["connections"],
+            plan["processes"],
+            round(plan["estimated_duration"], 2),
+        )
+    )
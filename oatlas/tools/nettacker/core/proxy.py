@@ -0,0 +1,244 @@
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+import urllib.parse
+
+import socks
+
+from oatlas.config import Config
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.resolver import create_direct_connection
+
+log = get_logger()
+
+# Proxy URL scheme -> pysocks proxy type, an URL without one is a SOCKS4 proxy (as it was
+# with the old --socks-proxy)
+PROXY_TYPES = {
+    "socks": socks.SOCKS4,
+    "socks4": socks.SOCKS4,
+    "socks5": socks.SOCKS5,
+    "http": socks.HTTP,
+}
+# The schemes aiohttp-socks knows them by
+PROXY_SCHEMES = {socks.SOCKS4: "socks4", socks.SOCKS5: "socks5", socks.HTTP: "http"}
+# Raw ICMP and impacket's own NetBIOS sockets can't go through a proxy, these modules would
+# reach the targets directly
+UNPROXIED_MODULES = ("icmp_scan", "smb_brute")
+
+
+class Proxy:
+    """
+    A SOCKS4, SOCKS5 or HTTP (CONNECT) proxy of the pool and how it's doing
+
+    Args:
+        url: scheme://[user:password@]host:port
+    """
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url if "://" in url else f"socks4://{url}")
+        if parsed.scheme not in PROXY_TYPES or not parsed.hostname or not parsed.port:
+            raise ValueError(url)
+        self.proxy_type = PROXY_TYPES[parsed.scheme]
+        self.url = parsed._replace(scheme=PROXY_SCHEMES[self.proxy_type]).geturl()
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.username = urllib.parse.unquote(parsed.username) if parsed.username else None
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        # Connections being opened and requests in flight through it
+        self.in_flight = 0
+        self.connections = 0
+        # Failures in a row, it's taken out of the pool until down_until after too many
+        self.failures = 0
+        self.down_until = 0.0
+
+    def __str__(self):
+        # Without the credentials, this goes to the logs
+        return f"{self.host}:{self.port}"
+
+    def connect(self, host, port, timeout):
+        """
+        Returns:
+            a socket connected to host:port through the proxy, the proxy resolves the name
+
+        Raises:
+            socks.ProxyConnectionError: when the proxy can't be reached
+            OSError: when the connection to the target fails
+        """
+        connection = socks.create_connection(
+            (host, port),
+            timeout=timeout,
+            proxy_type=self.proxy_type,
+            proxy_addr=self.host,
+            proxy_port=self.port,
+            proxy_rdns=True,
+            proxy_username=self.username,
+            proxy_password=self.password,
+        )
+        # After the handshake it's a plain TCP stream, the clients and the event loop get a
+        # plain socket
+        plain_connection = socket.socket(
+            connection.family, socket.SOCK_STREAM, 0, connection.detach()
+        )
+        plain_connection.settimeout(timeout)
+        return plain_connection
+
+    def is_reachable(self, timeout):
+        try:
+            socket.create_connection((self.host, self.port), timeout).close()
+            return True
+        except OSError:
+            return False
+
+
+class ProxyPool:
+    """
+    The proxies of a scan. The connections and HTTP requests of the engines take a proxy
+    from the pool one at a time, round robin or the least loaded one (the fewest connections
+    being opened and requests in flight) with `proxy_selection`. The old --socks-proxy set
+    socket.socket for the whole process from every scan thread and sent everything through
+    one proxy.
+
+    A proxy that can't be reached `proxy_failure_threshold` times in a row is left out for
+    `proxy_down_time` seconds, the first connection after that decides if it's back. When
+    all of them are down the one that went down first is tried, the scan never connects
+    to a target directly.
+
+    Args:
+        proxies: the Proxy objects
+    """
+
+    def __init__(self, proxies):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.proxies = proxies
+        self.next_proxy = 0
+
+    def copy(self):
+        # For a forked process, the parent's lock could have been held during the fork
+        proxies = []
+        for proxy in self.proxies:
+            proxies.append(Proxy(proxy.url))
+            proxies[-1].failures, proxies[-1].down_until = proxy.failures, proxy.down_until
+        return ProxyPool(proxies)
+
+    def check(self):
+        """
+        Connect to every proxy at once, the unreachable ones are taken out of the pool
+
+        Returns:
+            how many of them are reachable
+        """
+        timeout = Config.nettacker.proxy_check_timeout
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.proxies)) as executor:
+            reachable = list(executor.map(lambda proxy: proxy.is_reachable(timeout), self.proxies))
+        for proxy, is_reachable in zip(self.proxies, reachable):
+            if not is_reachable:
+                self.release(proxy, failed=True, in_flight=False, down=True)
+        return sum(reachable)
+
+    def acquire(self):
+        """
+        Returns:
+            the proxy for the next connection or request, hand it back to release
+        """
+        with self.lock:
+            now = time.monotonic()
+            proxies = [proxy for proxy in self.proxies if proxy.down_until <= now] or [
+                min(self.proxies, key=lambda proxy: proxy.down_until)
+            ]
+            if Config.nettacker.proxy_selection == "least_loaded":
+                proxy = min(proxies, key=lambda proxy: (proxy.in_flight, proxy.connections))
+            else:
+                proxy = proxies[self.next_proxy % len(proxies)]
+                self.next_proxy += 1
+            proxy.in_flight += 1
+            proxy.connections += 1
+            return proxy
+
+    def release(self, proxy, failed=False, in_flight=True, down=False):
+        """
+        Args:
+            proxy: what acquire returned
+            failed: the proxy couldn't be reached (not the target)
+            in_flight: False when it wasn't acquired, for the health checks
+            down: take it out of the pool on this failure
+        """
+        with self.lock:
+            if in_flight:
+                proxy.in_flight -= 1
+            if not failed:
+                if proxy.failures >= Config.nettacker.proxy_failure_threshold:
+                    log.info(_("proxy_up").format(proxy))
+                proxy.failures = 0
+                return
+            proxy.failures += 1
+            if down or proxy.failures >= Config.nettacker.proxy_failure_threshold:
+                proxy.failures = max(proxy.failures, Config.nettacker.proxy_failure_threshold)
+                if proxy.down_until <= time.monotonic():
+                    log.warn(_("proxy_down").format(proxy, Config.nettacker.proxy_down_time))
+                proxy.down_until = time.monotonic() + Config.nettacker.proxy_down_time
+
+    def connect(self, host, port, timeout):
+        """
+        Returns:
+            a socket connected to host:port through a proxy of the pool
+        """
+        proxy = self.acquire()
+        failed = False
+        try:
+            return proxy.connect(host, port, timeout)
+        except socks.ProxyConnectionError:
+            failed = True
+            raise
+        finally:
+            self.release(proxy, failed)
+
+
+_proxy_pool = None
+_proxy_pool_lock = threading.Lock()
+
+
+def get_proxy_pool():
+    """
+    Returns the proxy pool of the current process, None when the scan has no proxies
+    """
+    global _proxy_pool
+    if _proxy_pool is not None and _proxy_pool.pid != os.getpid():
+        with _proxy_pool_lock:
+            if _proxy_pool.pid != os.getpid():
+                _proxy_pool = _proxy_pool.copy()
+    return _proxy_pool
+
+
+def install_proxy_pool(proxy_urls):
+    """
+    Set the proxies of a scan, before the scan processes are forked
+
+    Args:
+        proxy_urls: comma separated proxy URLs, None for no proxy
+
+    Raises:
+        ValueError: for an URL that isn't a proxy
+    """
+    global _proxy_pool
+    proxies = [Proxy(url.strip()) for url in (proxy_urls or "").split(",") if url.strip()]
+    with _proxy_pool_lock:
+        _proxy_pool = ProxyPool(proxies) if proxies else None
+    return _proxy_pool
+
+
+def create_connection(host, port, timeout):
+    """
+    socket.create_connection for the engines, through a proxy of the scan when it has them
+    and with the name from the scan's DNS cache when it doesn't
+
+    Returns:
+        the connected socket
+    """
+    proxy_pool = get_proxy_pool()
+    if proxy_pool is not None:
+        return proxy_pool.connect(host, port, timeout)
+    return create_direct_connection(host, port, timeout)
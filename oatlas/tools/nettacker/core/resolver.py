@@ -0,0 +1,242 @@
+import asyncio
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+
+from oatlas.config import Config
+from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.messages import messages as _
+
+log = get_logger()
+
+# The flags a cached answer is still right for, anything else goes to the system resolver
+CACHEABLE_FLAGS = socket.AI_ADDRCONFIG | socket.AI_V4MAPPED
+
+
+class DnsCache:
+    """
+    getaddrinfo answers of a scan. Every connection of every library used to resolve the
+    target again, tens of thousands of lookups of the same name for a big module set. The
+    answer for a name is kept for `dns_cache_ttl` seconds (`dns_negative_ttl` for names that
+    don't resolve) with all its addresses, the family, type and port of a lookup are applied
+    to the cached answer. Threads that look up a name that is being resolved wait for that
+    answer instead of sending another query.
+
+    A scan process gets a copy of the parent's answers when it's forked, so the names
+    resolved up front (prefetch) are resolved once for the whole scan.
+    """
+
+    def __init__(self, entries=None):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        # host -> (expires, getaddrinfo answer or the socket.gaierror it raised)
+        self.entries = entries if entries is not None else {}
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prune(self):
+        with self.lock:
+            now = time.monotonic()
+            for host in [host for host, entry in self.entries.items() if entry[0] <= now]:
+                del self.entries[host]
+
+    def fresh_entry(self, host):
+        entry = self.entries.get(host)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry
+        return None
+
+    def resolve(self, host):
+        """
+        Returns:
+            the cached getaddrinfo(host, 0) answer
+
+        Raises:
+            socket.gaierror: when the name doesn't resolve
+        """
+        while True:
+            with self.lock:
+                entry = self.fresh_entry(host)
+                if entry is not None:
+                    self.hits += 1
+                    return answer(entry)
+                resolving = self.pending.get(host)
+                if resolving is None:
+                    resolving = self.pending[host] = threading.Event()
+                    self.misses += 1
+                    break
+            resolving.wait()
+
+        entry = None
+        try:
+            try:
+                entry = (
+                    time.monotonic() + Config.nettacker.dns_cache_ttl,
+                    socket.getaddrinfo(host, 0, 0, socket.SOCK_STREAM),
+                )
+            except socket.gaierror as e:
+                entry = (time.monotonic() + Config.nettacker.dns_negative_ttl, e)
+        finally:
+            with self.lock:
+                if entry is not None:
+                    self.entries[host] = entry
+                del self.pending[host]
+            resolving.set()
+        return answer(entry)
+
+    async def resolve_async(self, host):
+        """
+        resolve for the scheduler loop, a name that isn't cached is resolved on a thread
+        """
+        entry = self.fresh_entry(host)
+        if entry is not None:
+            self.hits += 1
+            return answer(entry)
+        return await asyncio.to_thread(self.resolve, host)
+
+    def prefetch(self, hosts):
+        """
+        Resolve the hosts in parallel
+
+        Returns:
+            how many of them resolved
+        """
+        hosts = list(hosts)
+        if not hosts:
+            return 0
+
+        def resolves(host):
+            try:
+                self.resolve(host)
+                return True
+            except (OSError, UnicodeError):
+                return False
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(Config.nettacker.dns_prefetch_workers, len(hosts)),
+            thread_name_prefix="nettacker-dns",
+        ) as executor:
+            return sum(executor.map(resolves, hosts))
+
+
+def answer(entry):
+    if isinstance(entry[1], socket.gaierror):
+        # A new one every time, the cached one is raised in many threads
+        raise socket.gaierror(*entry[1].args)
+    return entry[1]
+
+
+_dns_cache = None
+_dns_cache_lock = threading.Lock()
+
+
+def get_dns_cache():
+    """
+    Returns the DNS cache of the current process. A forked process starts from a copy of the
+    parent's answers with its own lock, the parent's could have been held during the fork.
+    """
+    global _dns_cache
+    if _dns_cache is None or _dns_cache.pid != os.getpid():
+        with _dns_cache_lock:
+            if _dns_cache is None:
+                _dns_cache = DnsCache()
+            elif _dns_cache.pid != os.getpid():
+                _dns_cache = DnsCache(dict(_dns_cache.entries))
+    return _dns_cache
+
+
+def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """
+    socket.getaddrinfo answered from the DNS cache. It's passed around explicitly
+    (create_direct_connection, resolve_address), socket.getaddrinfo stays the system one
+    for the other tools and threads of the process.
+    """
+    if (
+        not isinstance(host, str)
+        or flags & ~CACHEABLE_FLAGS
+        or not (port is None or isinstance(port, int) or str(port).isdigit())
+    ):
+        return socket.getaddrinfo(host, port, family, type, proto, flags)
+    port = int(port or 0)
+    infos = [
+        (info_family, info_type, info_proto, canonname, (address[0], port) + address[2:])
+        for info_family, info_type, info_proto, canonname, address in get_dns_cache().resolve(host)
+        if (not family or info_family == family) and (not proto or info_proto == proto)
+    ]
+    if not infos:
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    if type and type != socket.SOCK_STREAM:
+        # Cached for TCP only, the other types get the same addresses
+        infos = [(info[0], type, 0) + info[3:] for info in infos]
+    return infos
+
+
+def resolve_address(host, family=socket.AF_INET):
+    """
+    The address the raw sockets (ICMP) and the libraries that connect by themselves
+    (impacket) are sent to, from the DNS cache
+
+    Raises:
+        socket.gaierror: when the name doesn't resolve
+    """
+    return getaddrinfo(host, None, family, socket.SOCK_STREAM)[0][4][0]
+
+
+def create_direct_connection(host, port, timeout):
+    """
+    socket.create_connection with the name looked up in the DNS cache, every address of the
+    host is tried in turn
+
+    Returns:
+        the connected socket
+    """
+    error = None
+    for family, type, proto, _canonname, address in getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        connection = socket.socket(family, type, proto)
+        try:
+            connection.settimeout(timeout)
+            connection.connect(address)
+            return connection
+        except OSError as e:
+            connection.close()
+            error = e
+    raise error
+
+
+async def resolve_addresses_async(host):
+    """
+    The addresses of the host for the scheduler loop, in the order getaddrinfo gave them so
+    a connection can go on with the next one when one doesn't answer
+
+    Returns:
+        a list of (family, address)
+
+    Raises:
+        socket.gaierror: when the name doesn't resolve
+    """
+    infos = await get_dns_cache().resolve_async(host)
+    return list(
+        dict.fromkeys(
+            (info_family, address[0]) for info_family, _type, _proto, _canonname, address in infos
+        )
+    )
+
+
+def prefetch_target_names(targets):
+    """
+    Resolve the target names (not the IPs) of the scan in parallel before it starts, the
+    answers of the earlier scans of the process that expired are dropped first
+    """
+    started = time.monotonic()
+    get_dns_cache().prune()
+    names = list(targets.names)
+    resolved = get_dns_cache().prefetch(names)
+    if names:
+        log.verbose_info(
+            _("dns_prefetch_done").format(
+                resolved, len(names), round(time.monotonic() - started, 2)
+            )
+        )
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+
+import uvloop
+
+from oatlas.logger import get_logger
+
+log = get_logger()
+
+
+class AsyncScheduler:
+    """
+    A single long-lived event loop per process that the engines can hand coroutines to.
+
+    Earlier every HTTP sub-step did an `asyncio.run(...)` on its own thread, which meant a new
+    loop, a new ClientSession and a new TLS handshake for every request. Now the loop lives on
+    one daemon thread and anything that wants to do async I/O submits a coroutine to it.
+
+    Long-lived objects that belong to the loop (like the aiohttp session) are kept as named
+    resources so that they get closed along with the loop.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = uvloop.new_event_loop()
+        self.resources = {}
+        self.resource_locks = {}
+        self.thread = threading.Thread(
+            target=self._run_forever, name="nettacker-async-scheduler", daemon=True
+        )
+        self.thread.start()
+
+    def _run_forever(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """
+        Schedule a coroutine on the loop from any thread
+
+        Args:
+            coroutine: the coroutine object to run
+
+        Returns:
+            a concurrent.futures.Future with the result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        """
+        Blocking version of submit, for the callers that are still on worker threads
+        """
+        return self.submit(coroutine).result()
+
+    async def resource(self, name, factory):
+        """
+        Get or lazily create a loop-bound resource (sessions, connectors and the like)
+
+        Args:
+            name: name of the resource
+            factory: coroutine function that builds the resource when it doesn't exist
+
+        Returns:
+            the resource
+        """
+        if name not in self.resources:
+            lock = self.resource_locks.setdefault(name, asyncio.Lock())
+            async with lock:
+                if name not in self.resources:
+                    self.resources[name] = await factory()
+        return self.resources[name]
+
+    async def release_resource(self, name):
+        """
+        Close and drop a resource before the scheduler shuts down, the next `resource` call
+        for the name creates it again
+
+        Args:
+            name: name of the resource
+        """
+        self.resource_locks.pop(name, None)
+        resource = self.resources.pop(name, None)
+        if resource is None:
+            return
+        try:
+            await resource.close()
+        except Exception:
+            log.warn(f"could not close the {name} resource")
+
+    async def _close_resources(self):
+        for name, resource in list(self.resources.items()):
+            try:
+                await resource.close()
+            except Exception:
+                log.warn(f"could not close the {name} resource")
+        self.resources.clear()
+
+    def shutdown(self):
+        if not self.loop.is_running():
+            return
+        try:
+            self.submit(self._close_resources()).result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the scheduler of the current process. Nettacker forks a process per target group
+    and a loop (or its thread) doesn't survive a fork, so a new one is created when the pid
+    changes.
+    """
+    global _scheduler
+    if _scheduler is None or _scheduler.pid != os.getpid():
+        with _scheduler_lock:
+            if _scheduler is None or _scheduler.pid != os.getpid():
+                _scheduler = AsyncScheduler()
+    return _scheduler
+
+
+def shutdown_scheduler():
+    global _scheduler
+    if _scheduler is not None and _scheduler.pid == os.getpid():
+        _scheduler.shutdown()
+        _scheduler = None
@@ -0,0 +1,180 @@
+import bisect
+import itertools
+
+import netaddr
+
+from oatlas.tools.nettacker.core.ip import (
+    ip_range_to_intervals,
+    is_ipv4_cidr,
+    is_ipv4_range,
+    is_ipv6_cidr,
+    is_ipv6_range,
+    is_single_ipv4,
+    is_single_ipv6,
+)
+
+IP_VERSIONS = (4, 6)
+
+
+def target_to_intervals(target):
+    """
+    Args:
+        target: a target string
+
+    Returns:
+        the (ip version, first, last) intervals of an IP, IP range or CIDR, None for anything
+        else (domains and the like)
+    """
+    if is_single_ipv4(target) or is_single_ipv6(target):
+        address = netaddr.IPAddress(target)
+        return [(address.version, int(address), int(address))]
+    if (
+        is_ipv4_range(target)
+        or is_ipv6_range(target)
+        or is_ipv4_cidr(target)
+        or is_ipv6_cidr(target)
+    ):
+        return ip_range_to_intervals(target)
+    return None
+
+
+def merge_intervals(intervals):
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def subtract_intervals(intervals, excluded):
+    """
+    Both sorted and merged, returns what's left of intervals
+    """
+    remaining = []
+    excluded_index = 0
+    for first, last in intervals:
+        while excluded_index < len(excluded) and excluded[excluded_index][1] < first:
+            excluded_index += 1
+        index = excluded_index
+        while index < len(excluded) and excluded[index][0] <= last:
+            if excluded[index][0] > first:
+                remaining.append((first, excluded[index][0] - 1))
+            first = max(first, excluded[index][1] + 1)
+            index += 1
+        if first <= last:
+            remaining.append((first, last))
+    return remaining
+
+
+class TargetSet:
+    """
+    The targets of a scan.
+
+    IPs, IP ranges and CIDRs are kept as merged (first, last) integer intervals per IP version
+    and are only turned into strings one at a time while iterating, so a /8 (or an IPv6
+    range) takes as much memory as a single IP. Everything else is kept as is. Adding the same
+    target twice, or overlapping ranges, doesn't duplicate anything and exclusions are
+    subtracted from the intervals.
+
+    It supports iteration and slicing (the slices are TargetSets as well). size() is the
+    number of targets, len() works too as long as that fits in an index (it doesn't for an
+    IPv6 /64).
+    """
+
+    def __init__(self, targets=()):
+        self.names = {}
+        self.intervals = {version: [] for version in IP_VERSIONS}
+        self.merged = True
+        for target in targets:
+            self.add(target)
+
+    def add(self, target):
+        intervals = target_to_intervals(target)
+        if intervals is None:
+            self.names[target] = None
+            return
+        for version, first, last in intervals:
+            self.intervals[version].append((first, last))
+        self.merged = False
+
+    def exclude(self, targets):
+        """
+        Args:
+            targets: targets (IPs, ranges, CIDRs or names) to remove from the set
+        """
+        excluded = {version: [] for version in IP_VERSIONS}
+        for target in targets:
+            intervals = target_to_intervals(target)
+            if intervals is None:
+                self.names.pop(target, None)
+                continue
+            for version, first, last in intervals:
+                excluded[version].append((first, last))
+        self.merge()
+        for version in IP_VERSIONS:
+            self.intervals[version] = subtract_intervals(
+                self.intervals[version], merge_intervals(excluded[version])
+            )
+
+    def merge(self):
+        if not self.merged:
+            for version in IP_VERSIONS:
+                self.intervals[version] = merge_intervals(self.intervals[version])
+            self.merged = True
+
+    def size(self):
+        self.merge()
+        return len(self.names) + sum(
+            last - first + 1 for version in IP_VERSIONS for first, last in self.intervals[version]
+        )
+
+    def __len__(self):
+        return self.size()
+
+    def __bool__(self):
+        return bool(self.names) or any(self.intervals.values())
+
+    def __contains__(self, target):
+        intervals = target_to_intervals(target)
+        if intervals is None:
+            return target in self.names
+        self.merge()
+        for version, first, last in intervals:
+            ranges = self.intervals[version]
+            index = bisect.bisect_right(ranges, (first, float("inf"))) - 1
+            if index < 0 or ranges[index][1] < last:
+                return False
+        return True
+
+    def __iter__(self):
+        self.merge()
+        yield from list(self.names)
+        for version in IP_VERSIONS:
+            for first, last in self.intervals[version]:
+                for value in range(first, last + 1):
+                    yield str(netaddr.IPAddress(value, version))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("TargetSet only supports slices")
+        start, stop, _step = index.indices(self.size())
+        part = TargetSet()
+        names_start = min(start, len(self.names))
+        names_stop = min(stop, len(self.names))
+        part.names = dict.fromkeys(itertools.islice(self.names, names_start, names_stop))
+        position = len(self.names)
+        for version in IP_VERSIONS:
+            for first, last in self.intervals[version]:
+                size = last - first + 1
+                if position + size > start and position < stop:
+                    part.intervals[version].append(
+                        (
+                            first + max(start - position, 0),
+                            first + min(stop - position, size) - 1,
+                        )
+                    )
+                position += size
+        return part
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import threading
+
+
+def set_future_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class TempEventStore:
+    """
+    In-process copy of the temp events, keyed by (target, module_name, scan_id, event_name).
+
+    Dependent steps used to poll the temp_events table every 100ms until the event they need
+    showed up. The producer and the dependent steps of a module always run in the same
+    process, so process_conditions publishes the results here and the dependent steps wait
+    on a condition (threads) or a future (coroutines on the scheduler loop). The database
+    copy stays for persistence and as the fallback when an event is not published in this
+    process.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.events = {}
+        self.async_waiters = {}
+        self.condition = threading.Condition()
+
+    def publish(self, key, conditions_results):
+        with self.condition:
+            # The first one wins, same as the LIMIT 1 in find_temp_events
+            self.events.setdefault(key, conditions_results)
+            result = self.events[key]
+            waiters = self.async_waiters.pop(key, [])
+            self.condition.notify_all()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(set_future_result, future, result)
+
+    def wait(self, key, timeout):
+        """
+        Blocks until the event is published or the timeout runs out
+
+        Returns:
+            the conditions_results of the event, None on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: key in self.events, timeout)
+            return self.events.get(key)
+
+    async def wait_async(self, key, timeout):
+        """
+        Same as wait, without blocking the loop it is awaited on
+        """
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            if key in self.events:
+                return self.events[key]
+            future = loop.create_future()
+            self.async_waiters.setdefault(key, []).append((loop, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self.condition:
+                waiters = self.async_waiters.get(key, [])
+                if (loop, future) in waiters:
+                    waiters.remove((loop, future))
+            return None
+
+    def discard_scan(self, scan_id):
+        with self.condition:
+            for key in [key for key in self.events if key[2] == scan_id]:
+                del self.events[key]
+
+
+_temp_event_store = None
+_temp_event_store_lock = threading.Lock()
+
+
+def get_temp_event_store():
+    """
+    Returns the temp event store of the current process
+    """
+    global _temp_event_store
+    if _temp_event_store is None or _temp_event_store.pid != os.getpid():
+        with _temp_event_store_lock:
+            if _temp_event_store is None or _temp_event_store.pid != os.getpid():
+                _temp_event_store = TempEventStore()
+    return _temp_event_store
@@ -1,11 +1,30 @@
 import copy
+import re
+import threading
 
 import yaml
 
 from oatlas.config import Config
 
+INPUT_PLACEHOLDER = "__nettacker_input_{0}__"
+INPUT_PLACEHOLDER_REGEX = re.compile(r"__nettacker_input_(\w+?)__")
+
+
+class InputPlaceholders(dict):
+    """
+    Used with str.format_map so that every {input} in a module file becomes a placeholder
+    token. The file can then be parsed once without knowing the inputs.
+    """
+
+    def __missing__(self, key):
+        return INPUT_PLACEHOLDER.format(key)
+
 
 class TemplateLoader:
+    # module name -> (file mtime, parsed template with placeholders), shared by the process
+    parsed_templates = {}
+    parsed_templates_lock = threading.Lock()
+
     def __init__(self, name, inputs=None) -> None:
         self.name = name
         self.inputs = inputs or {}
@@ -27,16 +46,60 @@ class TemplateLoader:
 
         return module_content
 
-    def open(self):
+    @staticmethod
+    def substitute(template, module_inputs):
+        """
+        Replace the placeholders with the inputs. This walks the whole template and builds
+        new containers, so the cached template is never handed out or modified.
+        """
+        if isinstance(template, dict):
+            return {
+                TemplateLoader.substitute(key, module_inputs): TemplateLoader.substitute(
+                    value, module_inputs
+                )
+                for key, value in template.items()
+            }
+        if isinstance(template, list):
+            return [TemplateLoader.substitute(value, module_inputs) for value in template]
+        if isinstance(template, str) and "__nettacker_input_" in template:
+            return INPUT_PLACEHOLDER_REGEX.sub(
+                lambda match: str(module_inputs[match.group(1)]), template
+            )
+        return template
+
+    @property
+    def path(self):
         module_name_parts = self.name.split("_")
         action = module_name_parts[-1]
         library = "_".join(module_name_parts[:-1])
+        return Config.path.nettacker_modules_dir / action / f"{library}.yaml"
 
-        with open(Config.path.nettacker_modules_dir / action / f"{library}.yaml") as yaml_file:
+    def open(self):
+        with open(self.path) as yaml_file:
             return yaml_file.read()
 
     def format(self):
         return self.open().format(**self.inputs)
 
+    def load_template(self):
+        """
+        Returns the parsed module file with placeholders in place of the inputs. Parsed once
+        per process and parsed again only when the file changes.
+        """
+        modified_time = self.path.stat().st_mtime_ns
+        cached = TemplateLoader.parsed_templates.get(self.name)
+        if cached and cached[0] == modified_time:
+            return cached[1]
+
+        with TemplateLoader.parsed_templates_lock:
+            cached = TemplateLoader.parsed_templates.get(self.name)
+            if not cached or cached[0] != modified_time:
+                cached = (
+                    modified_time,
+                    yaml.safe_load(self.open().format_map(InputPlaceholders())),
+                )
+                TemplateLoader.parsed_templates[self.name] = cached
+        return cached[1]
+
     def load(self):
-        return self.parse(yaml.safe_load(self.format()), self.inputs)
+        return self.parse(self.substitute(self.load_template(), self.inputs), self.inputs)
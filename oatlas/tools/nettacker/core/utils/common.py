@@ -1,32 +1,41 @@
+import ast
+import concurrent.futures
 import copy
 import ctypes
-import hashlib
 import importlib
+import math
 import random
-import re
 import string
 import time
-from itertools import product
 
 from oatlas.logger import get_logger
+from oatlas.tools.nettacker.core.messages import messages as _
+from oatlas.tools.nettacker.core.utils.expressions import (
+    apply_interceptors,
+    compile_interceptors,
+    compile_template,
+)
 
 log = get_logger()
 
 
 def replace_dependent_response(log, response_dependent):
-    """The `response_dependent` is needed for `eval` below."""
-    if str(log):
-        key_name = re.findall(re.compile("response_dependent\\['\\S+\\]"), log)
-        for i in key_name:
-            try:
-                key_value = eval(i)
-            except Exception:
-                key_value = "response dependent error"
-            log = log.replace(i, " ".join(key_value))
-        return log
-
-
-def merge_logs_to_list(result, log_list=[]):
+    """
+    Fill in the response_dependent['...'] paths in a log with the values from the response
+    """
+    if str(log) and "response_dependent" in log:
+        return compile_template(log, "response_dependent").render(
+            response_dependent,
+            formatter=lambda value: " ".join(value) if isinstance(value, list) else str(value),
+            error="response dependent error",
+        )
+    return log
+
+
+def merge_logs_to_list(result, log_list=None):
+    # A new list per call, with a [] default every event's logs piled up in the same one
+    if log_list is None:
+        log_list = []
     if isinstance(result, dict):
         for i in result:
             if "log" == i:
@@ -36,6 +45,37 @@ def merge_logs_to_list(result, log_list=[]):
     return list(set(log_list))
 
 
+def log_tokens(value):
+    """
+    The words of an event for the terminal log, what yaml.dump(value).split() gives for the
+    JSON types an event is made of (keys sorted, "key:" before the value, "-" before list
+    items) minus yaml's quotes, without paying for a yaml dump per found event.
+
+    Args:
+        value: the event or a part of it
+
+    Returns:
+        a list of words
+    """
+    if isinstance(value, dict):
+        tokens = []
+        for key in sorted(value, key=str):
+            tokens.append(f"{key}:")
+            tokens += log_tokens(value[key]) if value[key] not in ({}, []) else [str(value[key])]
+        return tokens
+    if isinstance(value, list):
+        tokens = []
+        for item in value:
+            tokens.append("-")
+            tokens += log_tokens(item)
+        return tokens
+    if isinstance(value, bool):
+        return ["true" if value else "false"]
+    if value is None:
+        return ["null"]
+    return str(value).split() or ["''"]
+
+
 def reverse_and_regex_condition(regex, reverse):
     if regex:
         if reverse:
@@ -50,9 +90,7 @@ def reverse_and_regex_condition(regex, reverse):
 def wait_for_threads_to_finish(threads, maximum=None, terminable=False, sub_process=False):
     while threads:
         try:
-            for thread in threads:
-                if not thread.is_alive():
-                    threads.remove(thread)
+            threads[:] = [thread for thread in threads if thread.is_alive()]
             if maximum and len(threads) < maximum:
                 break
             time.sleep(0.01)
@@ -67,6 +105,31 @@ def wait_for_threads_to_finish(threads, maximum=None, terminable=False, sub_proc
     return True
 
 
+def wait_for_futures_to_finish(futures, maximum=None):
+    """
+    Same idea as wait_for_threads_to_finish but for futures (scheduler and worker pools).
+    Finished futures are dropped from the set, pending ones are cancelled on Ctrl-C.
+
+    Args:
+        futures: set of concurrent futures
+        maximum: return as soon as less than this many are pending, None waits for all
+
+    Returns:
+        True if finished, False if it was interrupted
+    """
+    try:
+        while futures and (maximum is None or len(futures) >= maximum):
+            done, _pending = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            futures.difference_update(done)
+    except KeyboardInterrupt:
+        for future in futures:
+            future.cancel()
+        return False
+    return True
+
+
 def terminate_thread(thread, verbose=True):
     """
     kill a thread https://stackoverflow.com/a/15274929
@@ -146,113 +209,18 @@ def remove_sensitive_header_keys(event):
     if "headers" in event:
         if not isinstance(event["headers"], dict):
             return event
-        for key in list(event["headers"].keys()):
-            if key.lower() in sensitive_headers:
-                del event["headers"][key]
+        if not any(key.lower() in sensitive_headers for key in event["headers"]):
+            return event
+        # A new dict, the headers can be shared with the other sub-steps of the step
+        event["headers"] = {
+            key: value
+            for key, value in event["headers"].items()
+            if key.lower() not in sensitive_headers
+        }
 
     return event
 
 
-def re_address_repeaters_key_name(key_name):
-    return "".join(["['" + _key + "']" for _key in key_name.split("/")[:-1]])
-
-
-def generate_new_sub_steps(sub_steps, data_matrix, arrays):
-    original_sub_steps = copy.deepcopy(sub_steps)
-    steps_array = []
-    for array in data_matrix:
-        array_name_position = 0
-        for array_name in arrays:
-            for sub_step in sub_steps:
-                exec(
-                    "original_sub_steps{key_name} = {matrix_value}".format(
-                        key_name=re_address_repeaters_key_name(array_name),
-                        matrix_value=(
-                            '"' + str(array[array_name_position]) + '"'
-                            if isinstance(array[array_name_position], int)
-                            or isinstance(array[array_name_position], str)
-                            else array[array_name_position]
-                        ),
-                    )
-                )
-            array_name_position += 1
-        steps_array.append(copy.deepcopy(original_sub_steps))
-    return steps_array
-
-
-def find_repeaters(sub_content, root, arrays):
-    if isinstance(sub_content, dict) and "nettacker_fuzzer" not in sub_content:
-        temporary_content = copy.deepcopy(sub_content)
-        original_root = root
-        for key in sub_content:
-            root = original_root
-            root += key + "/"
-            temporary_content[key], _root, arrays = find_repeaters(sub_content[key], root, arrays)
-        sub_content = copy.deepcopy(temporary_content)
-        root = original_root
-    if (not isinstance(sub_content, (bool, int, float))) and (
-        isinstance(sub_content, list) or "nettacker_fuzzer" in sub_content
-    ):
-        arrays[root] = sub_content
-    return (sub_content, root, arrays) if root != "" else arrays
-
-
-class value_to_class:
-    def __init__(self, value):
-        self.value = value
-
-
-def class_to_value(arrays):
-    original_arrays = copy.deepcopy(arrays)
-    array_index = 0
-    for array in arrays:
-        value_index = 0
-        for value in array:
-            if isinstance(value, value_to_class):
-                original_arrays[array_index][value_index] = value.value
-            value_index += 1
-        array_index += 1
-    return original_arrays
-
-
-def generate_and_replace_md5(content):
-    # todo: make it betetr and document it
-    md5_content = content.split("NETTACKER_MD5_GENERATOR_START")[1].split(
-        "NETTACKER_MD5_GENERATOR_STOP"
-    )[0]
-    md5_content_backup = md5_content
-    if isinstance(md5_content, str):
-        md5_content = md5_content.encode()
-    md5_hash = hashlib.md5(md5_content).hexdigest()
-    return content.replace(
-        "NETTACKER_MD5_GENERATOR_START" + md5_content_backup + "NETTACKER_MD5_GENERATOR_STOP",
-        md5_hash,
-    )
-
-
-def generate_target_groups(targets, set_hardware_usage):
-    """
-    Split a list of targets into smaller sublists based on a specified size.
-    """
-    if not targets:
-        return targets
-
-    targets_total = len(targets)
-    split_size = min(set_hardware_usage, targets_total)
-
-    # Calculate the size of each chunk.
-    chunk_size = (targets_total + split_size - 1) // split_size
-
-    return [targets[i : i + chunk_size] for i in range(0, targets_total, chunk_size)]
-
-
-def arrays_to_matrix(arrays):
-    """
-    Generate a Cartesian product of input arrays as a list of lists.
-    """
-    return [list(item) for item in product(*[arrays[array_name] for array_name in arrays])]
-
-
 AVAILABLE_DATA_FUNCTIONS = {
     "passwords": {"read_from_file"},
     "paths": {"read_from_file"},
@@ -267,98 +235,147 @@ def apply_data_functions(data):
 
         for fn_name in data[item]:
             if fn_name in AVAILABLE_DATA_FUNCTIONS[item]:
-                fn = getattr(importlib.import_module("atlas.tools.nettacker.core.fuzzer"), fn_name)
+                fn = getattr(
+                    importlib.import_module("oatlas.tools.nettacker.core.fuzzer"), fn_name
+                )
                 if fn is not None:
                     original_data[item] = fn(data[item][fn_name])
 
-    def apply_data_functions_old():
-        function_results = {}
-        globals().update(locals())
-        exec(
-            "fuzzer_function = {fuzzer_function}".format(fuzzer_function=data[item]),
-            globals(),
-            function_results,
-        )
-        original_data[item] = function_results["fuzzer_function"]
-
     original_data = copy.deepcopy(data)
     for item in data:
         if isinstance((data[item]), str) and data[item].startswith("fuzzer_function"):
-            apply_data_functions_old()
+            # These were exec'd as python, which isn't supported anymore
+            log.warn(_("fuzzer_function_removed").format(item))
         else:
             apply_data_functions_new()
 
     return original_data
 
 
-def fuzzer_repeater_perform(arrays):
-    original_arrays = copy.deepcopy(arrays)
-    for array_name in arrays:
-        if "nettacker_fuzzer" not in arrays[array_name]:
-            continue
-
-        data = arrays[array_name]["nettacker_fuzzer"]["data"]
-        data_matrix = arrays_to_matrix(apply_data_functions(data))
-        prefix = arrays[array_name]["nettacker_fuzzer"]["prefix"]
-        input_format = arrays[array_name]["nettacker_fuzzer"]["input_format"]
-        interceptors = copy.deepcopy(arrays[array_name]["nettacker_fuzzer"]["interceptors"])
-        if interceptors:
-            interceptors = interceptors.split(",")
-        suffix = arrays[array_name]["nettacker_fuzzer"]["suffix"]
-        processed_array = []
-
-        for sub_data in data_matrix:
-            formatted_data = {}
-            index_input = 0
-            for value in sub_data:
-                formatted_data[list(data.keys())[index_input]] = value
-                index_input += 1
-            interceptors_function = ""
-            interceptors_function_processed = ""
-
-            if interceptors:
-                interceptors_function += "interceptors_function_processed = "
-                for interceptor in interceptors[::-1]:
-                    interceptors_function += "{interceptor}(".format(interceptor=interceptor)
-                interceptors_function += "input_format.format(**formatted_data)" + str(
-                    ")" * interceptors_function.count("(")
-                )
-                expected_variables = {}
-                globals().update(locals())
-                exec(interceptors_function, globals(), expected_variables)
-                interceptors_function_processed = expected_variables[
-                    "interceptors_function_processed"
-                ]
-            else:
-                interceptors_function_processed = input_format.format(**formatted_data)
+def lazy_product(arrays):
+    """
+    Cartesian product of the arrays, same order as itertools.product. Unlike product this
+    doesn't turn the inputs into tuples first, so they can be lazy sequences themselves.
+    """
+    if not arrays:
+        yield ()
+        return
+    for value in arrays[0]:
+        for combination in lazy_product(arrays[1:]):
+            yield (value,) + combination
+
+
+def product_length(arrays):
+    return math.prod(len(array) for array in arrays)
+
+
+class FuzzerSequence:
+    """
+    The values a nettacker_fuzzer block expands to. They are generated when iterated over,
+    only the data (e.g. the wordlist) is held in memory.
+    """
 
-            processed_sub_data = interceptors_function_processed
-            if prefix:
-                processed_sub_data = prefix + processed_sub_data
-            if suffix:
-                processed_sub_data = processed_sub_data + suffix
-            processed_array.append(copy.deepcopy(processed_sub_data))
-        original_arrays[array_name] = processed_array
+    def __init__(self, fuzzer):
+        self.data = apply_data_functions(fuzzer["data"])
+        self.input_format = fuzzer["input_format"]
+        self.prefix = fuzzer["prefix"]
+        self.suffix = fuzzer["suffix"]
+        interceptors = fuzzer["interceptors"]
+        self.interceptors = compile_interceptors(interceptors) if interceptors else ()
+
+    def __len__(self):
+        return product_length(list(self.data.values()))
+
+    def __iter__(self):
+        keys = list(self.data.keys())
+        for sub_data in lazy_product(list(self.data.values())):
+            processed_sub_data = self.input_format.format(**dict(zip(keys, sub_data)))
+            if self.interceptors:
+                processed_sub_data = apply_interceptors(self.interceptors, processed_sub_data)
+            if self.prefix:
+                processed_sub_data = self.prefix + processed_sub_data
+            if self.suffix:
+                processed_sub_data = processed_sub_data + self.suffix
+            yield processed_sub_data
+
+
+def find_repeaters(sub_content, path=(), arrays=None):
+    """
+    Find the values a step gets expanded over, the lists and the nettacker_fuzzer blocks
 
-    return original_arrays
+    Returns:
+        a dict of key path (tuple of keys) -> value, in the order they appear in the step
+    """
+    arrays = {} if arrays is None else arrays
+    if isinstance(sub_content, dict) and "nettacker_fuzzer" not in sub_content:
+        for key in sub_content:
+            find_repeaters(sub_content[key], path + (key,), arrays)
+    elif path and isinstance(sub_content, (list, dict)):
+        arrays[path] = sub_content
+    return arrays
+
+
+def repeater_value(value):
+    """
+    The value as it is set in a sub-step. Strings and ints used to be assigned through an
+    exec, so they end up as strings unescaped like a python string literal (some module files
+    depend on that, e.g. the \\" in waf.yaml).
+    """
+    if not isinstance(value, (int, str)):
+        return value
+    value = str(value)
+    if "\\" in value:
+        try:
+            return ast.literal_eval('"' + value + '"')
+        except (SyntaxError, ValueError):
+            pass
+    return value
+
+
+class ExpandedStep:
+    """
+    All the sub-steps of a step, produced on demand. Every sub-step is a new dict but only
+    the path down to the expanded values is copied, the rest (response, headers, etc.) is
+    shared with the template. The engines must not modify those in place.
+    """
+
+    def __init__(self, step):
+        self.template = step
+        self.repeaters = [
+            (
+                path,
+                FuzzerSequence(values["nettacker_fuzzer"]) if isinstance(values, dict) else values,
+            )
+            for path, values in find_repeaters(step).items()
+        ]
+
+    def __len__(self):
+        return product_length([values for _path, values in self.repeaters])
+
+    def __iter__(self):
+        paths = [path for path, _values in self.repeaters]
+        for combination in lazy_product([values for _path, values in self.repeaters]):
+            sub_step = dict(self.template)
+            for path, value in zip(paths, combination):
+                node = sub_step
+                for key in path[:-1]:
+                    node[key] = dict(node[key])
+                    node = node[key]
+                node[path[-1]] = repeater_value(value)
+            yield sub_step
 
 
 def expand_module_steps(content):
-    return [expand_protocol(x) for x in copy.deepcopy(content)]
+    return [expand_protocol(x) for x in content]
 
 
 def expand_protocol(protocol):
-    protocol["steps"] = [expand_step(x) for x in protocol["steps"]]
-    return protocol
+    return dict(protocol, steps=[expand_step(x) for x in protocol["steps"]])
 
 
 def expand_step(step):
-    arrays = fuzzer_repeater_perform(find_repeaters(step, "", {}))
-    if arrays:
-        return generate_new_sub_steps(step, class_to_value(arrays_to_matrix(arrays)), arrays)
-    else:
-        # Minimum 1 step in array
-        return [step]
+    # Minimum 1 step, a step without repeaters expands to itself
+    return ExpandedStep(step)
 
 
 def generate_random_token(length=10):
@@ -0,0 +1,168 @@
+"""
+The small expression language the module files use, compiled once and applied many times.
+
+Module files have three kinds of expressions in them:
+
+- interceptors in nettacker_fuzzer blocks (e.g. `interceptors: generate_and_replace_md5`)
+  which are applied to every generated payload
+- access paths into earlier results, `dependent_on_temp_event[0]['content'][0]` in the
+  dependent steps and `response_dependent['headers']['server']` in the logs
+- comparisons like `responsetime: "> 5"`
+
+These used to be built into python source and run with exec/eval for every payload and
+every response. Now each one is parsed once (and cached) into a small object, and only the
+interceptors in the registry below can be used.
+"""
+
+import hashlib
+import operator
+import re
+from functools import lru_cache
+
+INTERCEPTORS = {}
+
+
+def register_interceptor(function):
+    """
+    Makes a function usable as an interceptor in the module files, under its own name
+    """
+    INTERCEPTORS[function.__name__] = function
+    return function
+
+
+@register_interceptor
+def generate_and_replace_md5(content):
+    # todo: make it betetr and document it
+    md5_content = content.split("NETTACKER_MD5_GENERATOR_START")[1].split(
+        "NETTACKER_MD5_GENERATOR_STOP"
+    )[0]
+    md5_content_backup = md5_content
+    if isinstance(md5_content, str):
+        md5_content = md5_content.encode()
+    md5_hash = hashlib.md5(md5_content).hexdigest()
+    return content.replace(
+        "NETTACKER_MD5_GENERATOR_START" + md5_content_backup + "NETTACKER_MD5_GENERATOR_STOP",
+        md5_hash,
+    )
+
+
+@lru_cache(maxsize=128)
+def compile_interceptors(interceptors):
+    """
+    Args:
+        interceptors: comma separated interceptor names, applied from left to right
+
+    Returns:
+        a tuple of the interceptor functions
+    """
+    functions = []
+    for name in interceptors.split(","):
+        name = name.strip()
+        if name not in INTERCEPTORS:
+            raise ValueError(f"unknown interceptor: {name}")
+        functions.append(INTERCEPTORS[name])
+    return tuple(functions)
+
+
+def apply_interceptors(interceptors, value):
+    for interceptor in interceptors:
+        value = interceptor(value)
+    return value
+
+
+ACCESS_PATH_KEY_REGEX = re.compile(r"\[(-?\d+|'[^']*'|\"[^\"]*\")\]")
+
+
+class AccessPath:
+    """
+    A pre-parsed path like `dependent_on_temp_event[0]['content'][0]`
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.name = expression.split("[", 1)[0]
+        self.keys = tuple(
+            int(key) if key[0] not in "'\"" else key[1:-1]
+            for key in ACCESS_PATH_KEY_REGEX.findall(expression[len(self.name) :])
+        )
+
+    def resolve(self, value):
+        for key in self.keys:
+            value = value[key]
+        return value
+
+
+class CompiledTemplate:
+    """
+    A string with access paths into a single variable in it, split into the literal parts and
+    the paths so that rendering it is just lookups and a join.
+    """
+
+    def __init__(self, template, variable):
+        self.parts = []
+        regex = re.compile(re.escape(variable) + r"(?:\[(?:-?\d+|'[^']*'|\"[^\"]*\")\])+")
+        position = 0
+        for match in regex.finditer(template):
+            self.parts.append(template[position : match.start()])
+            self.parts.append(AccessPath(match.group(0)))
+            position = match.end()
+        self.parts.append(template[position:])
+
+    @property
+    def has_paths(self):
+        return len(self.parts) > 1
+
+    def render(self, value, formatter=str, error="error"):
+        """
+        Args:
+            value: the value of the variable
+            formatter: turns the resolved values into strings
+            error: what to put in place of a path that can't be resolved
+
+        Returns:
+            the rendered string
+        """
+        rendered = []
+        for part in self.parts:
+            if isinstance(part, AccessPath):
+                try:
+                    part = formatter(part.resolve(value))
+                except Exception:
+                    part = error
+            rendered.append(part)
+        return "".join(rendered)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template, variable):
+    return CompiledTemplate(template, variable)
+
+
+COMPARISON_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+
+
+@lru_cache(maxsize=128)
+def compile_comparison(condition):
+    """
+    Args:
+        condition: a comparison like "> 5" or "<= 0.3"
+
+    Returns:
+        a function that takes the value to compare, None if the condition isn't valid
+    """
+    parts = condition.split()
+    if len(parts) != 2 or parts[0] not in COMPARISON_OPERATORS:
+        return None
+    try:
+        threshold = float(parts[1])
+    except ValueError:
+        return None
+    compare = COMPARISON_OPERATORS[parts[0]]
+    return lambda value: compare(value, threshold)
@@ -0,0 +1,153 @@
+import concurrent.futures
+import os
+import threading
+
+from oatlas.logger import get_logger
+
+log = get_logger()
+
+
+def log_exception(future):
+    """
+    Done callback for the futures, a thread used to print what killed it and a future keeps
+    it to itself
+    """
+    if not future.cancelled() and future.exception() is not None:
+        log.error(f"{type(future.exception()).__name__}: {future.exception()}")
+
+
+class TaskGroup:
+    """
+    The futures of one unit of work (e.g. the requests of a module) with at most `limit` of
+    them in flight. submit blocks until a slot is free, slots are given back when a future
+    is done or cancelled.
+    """
+
+    def __init__(self, limit, stopping):
+        self.slots = threading.BoundedSemaphore(max(int(limit or 1), 1))
+        self.stopping = stopping
+        self.futures = set()
+        self.lock = threading.Lock()
+
+    def submit(self, submit_function, *args):
+        """
+        Args:
+            submit_function: function that schedules the work and returns a future
+            args: arguments for submit_function
+
+        Returns:
+            the future, None when the pool is stopping
+        """
+        self.slots.acquire()
+        if self.stopping.is_set():
+            self.slots.release()
+            return None
+        try:
+            future = submit_function(*args)
+        except RuntimeError:
+            # The executor was shut down by stop() in the meantime
+            self.slots.release()
+            return None
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._done)
+        future.add_done_callback(log_exception)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.futures.discard(future)
+        self.slots.release()
+
+    def wait(self):
+        """
+        Wait for everything submitted so far
+
+        Returns:
+            True if finished, False if the pool was stopped
+        """
+        with self.lock:
+            futures = list(self.futures)
+        concurrent.futures.wait(futures)
+        return not self.stopping.is_set()
+
+    def cancel(self):
+        with self.lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+
+
+class WorkerPool:
+    """
+    Thread pools of a process, reused by every module it scans. Nettacker used to start a
+    thread per module and a thread per request and poll them with is_alive() until they were
+    done. Now the work goes to long-lived executors and callers wait on the futures.
+
+    Executors are created on first use with the size they are asked for. Every module of a
+    process runs with the same options, so they all ask for the same size.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.executors = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def executor(self, name, size):
+        """
+        Args:
+            name: name of the pool (e.g. "modules" or "requests")
+            size: number of worker threads it needs
+
+        Returns:
+            the ThreadPoolExecutor
+        """
+        with self.lock:
+            if name not in self.executors:
+                self.executors[name] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max(int(size or 1), 1), thread_name_prefix=f"nettacker-{name}"
+                )
+            return self.executors[name]
+
+    def task_group(self, limit):
+        return TaskGroup(limit, self.stopping)
+
+    def stop(self):
+        """
+        Stop taking work and drop what is queued, used on Ctrl-C. The work that is already
+        running finishes on its own, the modules check `stopping` between requests.
+        """
+        self.stopping.set()
+        with self.lock:
+            for executor in self.executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self.lock:
+            for executor in self.executors.values():
+                executor.shutdown(wait=True)
+            self.executors.clear()
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """
+    Returns the worker pool of the current process, a new one after a fork
+    """
+    global _worker_pool
+    if _worker_pool is None or _worker_pool.pid != os.getpid():
+        with _worker_pool_lock:
+            if _worker_pool is None or _worker_pool.pid != os.getpid():
+                _worker_pool = WorkerPool()
+    return _worker_pool
+
+
+def shutdown_worker_pool():
+    global _worker_pool
+    if _worker_pool is not None and _worker_pool.pid == os.getpid():
+        _worker_pool.shutdown()
+        _worker_pool = None